@@ -3,17 +3,259 @@
 Auto-fill forms using test data
 This script reads test_data.json and sends it to the backend API
 to automatically generate filled forms without manual input.
+
+Given a directory of candidate JSON files or a JSONL file it runs in bulk:
+candidates are submitted a few at a time over one keep-alive session,
+transient failures (connection errors, timeouts, 429/502/503/504) are
+retried with exponential backoff, each candidate's forms are downloaded in
+parallel into OUT/<candidate id>/, and a ledger records finished candidates
+so a rerun skips them.
 """
 
+import argparse
+import hashlib
 import json
 import os
+import random
+import re
 import sys
+import threading
 import requests
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib.parse import urljoin
+
+TRANSIENT_STATUS = (429, 502, 503, 504)
+
+
+def safe_candidate_id(candidate_id):
+    """The id as a folder name that stays inside --output; ValueError for '.' and '..'"""
+    safe = re.sub(r'[^\w.-]', '_', str(candidate_id))
+    if safe in ('', '.', '..'):
+        raise ValueError(f"candidate id {candidate_id!r} cannot be used as a folder name")
+    return safe
+
+
+def load_candidates(path):
+    """(candidate id, data) pairs from a directory of *.json files or a JSONL file;
+    ids are as given, BulkClient.run makes them safe folder names"""
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.json'):
+                with open(os.path.join(path, name), 'r') as f:
+                    yield os.path.splitext(name)[0], json.load(f)
+        return
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            # a stable id, so the ledger still matches when the file is reordered
+            candidate_id = data.get('id') or data.get('candidate_id') or \
+                hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+            yield str(candidate_id), data
+
+
+class Ledger:
+    """Append-only JSONL record of finished candidates"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by an interrupted run
+                    if entry.get('status') == 'done':
+                        self.done.add(entry['id'])
+
+    def record(self, entry):
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            if entry['status'] == 'done':
+                self.done.add(entry['id'])
+
+
+class BulkClient:
+    def __init__(self, backend_url, output_dir, concurrency=4, download_workers=8, retries=5,
+                 backoff=0.5, timeout=300, templates=None, priority='batch'):
+        self.backend_url = backend_url.rstrip('/') + '/'
+        self.output_dir = output_dir
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.templates = templates
+        # one keep-alive pool shared by the submitting and downloading threads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency + download_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # the server schedules bulk work in its own lane, behind people using the UI
+        self.session.headers['X-Priority'] = priority
+        self.downloads = ThreadPoolExecutor(download_workers, thread_name_prefix='download')
+
+    def request(self, method, path, **kwargs):
+        """Send with retries on transient failures; returns the last response or raises"""
+        url = urljoin(self.backend_url, path.lstrip('/'))
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                if response.status_code not in TRANSIENT_STATUS or attempt == self.retries:
+                    return response
+                delay = float(response.headers.get('Retry-After') or 0)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == self.retries:
+                    raise
+                delay = 0
+            # exponential backoff with jitter, never sooner than the server asked
+            time.sleep(max(delay, self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)))
+
+    def download(self, candidate_dir, link):
+        # the name comes from the server; it must not lead out of the candidate's folder
+        filename = os.path.basename(link['filename'].replace('\\', '/'))
+        if filename in ('', '.', '..'):
+            raise RuntimeError(f"{link['filename']!r}: not a file name")
+        path = os.path.join(candidate_dir, filename)
+        headers = {}
+        if os.path.exists(path):
+            # forms render byte-identically, so the server's ETag is the content hash
+            with open(path, 'rb') as f:
+                headers['If-None-Match'] = f'"{hashlib.sha256(f.read()).hexdigest()}"'
+        response = self.request('GET', link['url'], stream=True, headers=headers)
+        if response.status_code == 304:
+            return filename
+        if response.status_code != 200:
+            raise RuntimeError(f"{filename}: HTTP {response.status_code}")
+        with open(path + '.part', 'wb') as f:
+            for chunk in response.iter_content(64 * 1024):
+                f.write(chunk)
+        os.replace(path + '.part', path)
+        return filename
+
+    def process(self, candidate_id, data):
+        """Submit one candidate and download its forms; returns its ledger entry"""
+        started = time.time()
+        # lazy links name the candidate, so concurrent submissions cannot
+        # overwrite each other's files on the server before they are fetched
+        params = {'lazy': '1'}
+        if self.templates:
+            params['templates'] = ','.join(self.templates)
+        response = self.request('POST', '/api/process-forms', params=params, json=data)
+        result = response.json() if response.headers.get('Content-Type', '').startswith('application/json') else {}
+        if response.status_code != 200 or not result.get('success'):
+            return {'id': candidate_id, 'status': 'failed',
+                    'error': result.get('error') or f'HTTP {response.status_code}'}
+
+        candidate_dir = os.path.join(self.output_dir, candidate_id)
+        os.makedirs(candidate_dir, exist_ok=True)
+        futures = [self.downloads.submit(self.download, candidate_dir, link) for link in result['downloadLinks']]
+        files, errors = [], []
+        for future in futures:
+            try:
+                files.append(future.result())
+            except Exception as e:
+                errors.append(str(e))
+        errors += [f"{form['template']}: {form['error']}" for form in result.get('failedForms', [])]
+        return {'id': candidate_id, 'status': 'failed' if errors else 'done', 'files': files, 'errors': errors,
+                'seconds': round(time.time() - started, 3)}
+
+    def run(self, candidates, ledger):
+        """Process every candidate not already in the ledger; returns (done, failed, skipped)"""
+        done = failed = skipped = 0
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix='submit') as pool:
+            pending = set()
+            for candidate_id, data in candidates:
+                try:
+                    candidate_id = safe_candidate_id(candidate_id)
+                except ValueError as e:
+                    # one unusable id fails that candidate, not the whole run
+                    ledger.record({'id': candidate_id, 'status': 'failed', 'error': str(e)})
+                    print(f"❌ {candidate_id}: {e}")
+                    failed += 1
+                    continue
+                if candidate_id in ledger.done:
+                    skipped += 1
+                    continue
+                pending.add(pool.submit(self._process_logged, candidate_id, data))
+                # bounded: never read far ahead of what is being processed
+                if len(pending) >= self.concurrency * 2:
+                    finished = next(as_completed(pending))
+                    pending.remove(finished)
+                    ok = self._tally(finished, ledger)
+                    done, failed = done + ok, failed + (not ok)
+            for finished in as_completed(pending):
+                ok = self._tally(finished, ledger)
+                done, failed = done + ok, failed + (not ok)
+        self.downloads.shutdown()
+        return done, failed, skipped
+
+    def _process_logged(self, candidate_id, data):
+        try:
+            return self.process(candidate_id, data)
+        except Exception as e:
+            return {'id': candidate_id, 'status': 'failed', 'error': f'{type(e).__name__}: {e}'}
+
+    @staticmethod
+    def _tally(future, ledger):
+        entry = future.result()
+        ledger.record(entry)
+        if entry['status'] == 'done':
+            print(f"✅ {entry['id']}: {len(entry['files'])} forms in {entry['seconds']}s")
+            return True
+        print(f"❌ {entry['id']}: {entry.get('error') or '; '.join(entry.get('errors', []))}")
+        return False
+
+
+def run_bulk(args):
+    ledger = Ledger(args.ledger or os.path.join(args.output, 'ledger.jsonl'))
+    os.makedirs(args.output, exist_ok=True)
+    print(f"🚚 Bulk run: {args.input} -> {args.output} ({len(ledger.done)} already done)")
+    client = BulkClient(args.url, args.output, concurrency=args.concurrency,
+                        download_workers=args.download_workers, retries=args.retries, backoff=args.backoff,
+                        timeout=args.timeout, templates=args.templates.split(',') if args.templates else None,
+                        priority=args.priority)
+    started = time.time()
+    done, failed, skipped = client.run(load_candidates(args.input), ledger)
+    elapsed = time.time() - started
+    print("=" * 60)
+    print(f"✨ {done} done, {failed} failed, {skipped} skipped in {elapsed:.1f}s"
+          + (f" ({done / elapsed:.2f} candidates/s)" if done and elapsed else ""))
+    sys.exit(1 if failed else 0)
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate filled forms through the backend API")
+    parser.add_argument("input", nargs="?", help="directory of candidate .json files or a .jsonl file (bulk mode)")
+    parser.add_argument("--url", default="http://localhost:5000", help="backend URL")
+    parser.add_argument("--output", default="output/bulk", help="bulk mode: one folder of forms per candidate")
+    parser.add_argument("--ledger", help="bulk mode: progress ledger (default OUTPUT/ledger.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=4, help="candidates submitted at once")
+    parser.add_argument("--download-workers", type=int, default=8, help="parallel form downloads")
+    parser.add_argument("--retries", type=int, default=5, help="retries per request on transient failures")
+    parser.add_argument("--backoff", type=float, default=0.5, help="first retry delay in seconds, doubled each time")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds per HTTP request")
+    parser.add_argument("--templates", help="only these template ids or form types (comma-separated)")
+    parser.add_argument("--priority", default="batch", choices=("interactive", "batch", "background"),
+                        help="bulk mode: server admission lane")
+    args = parser.parse_args()
+    if args.input:
+        run_bulk(args)
+    else:
+        run_single(args.url)
+
+
+def run_single(backend_url):
     # Configuration
-    BACKEND_URL = "http://localhost:5000"
+    BACKEND_URL = backend_url
     TEST_DATA_FILE = "test_data.json"
     
     print(" Starting Auto-Fill Forms Script...")
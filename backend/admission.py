@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Admission Control
+Bounds how many renders run at once and how many may wait for a slot.
+Requests beyond the queue depth are rejected immediately with a retry hint
+derived from the measured service time, instead of piling onto the workers.
+
+Requests come in priority lanes: interactive (someone in the UI waiting on
+a form), batch (bulk onboarding) and background (pre-rendering). Each lane
+has its own wait queue, so a 5,000-candidate batch fills only its own queue
+and never makes an interactive request wait behind it. Freed slots go to the
+waiting lanes in proportion to their weights (stride scheduling: each lane
+advances a pass value by 1/weight per slot and the lowest pass goes next; a
+lane that was idle rejoins at the current pass rather than with banked
+credit). The other lanes together may hold at most max_concurrency - reserved
+slots, so `reserved` slots are always free for interactive requests.
+
+A request may bring a deadline; if it passes while the request is still
+waiting, the request leaves the queue with TimeoutError instead of taking a
+slot it could only use to fail.
+"""
+
+from __future__ import annotations
+import math, threading, time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Optional, Tuple
+
+LANES = ("interactive", "batch", "background")
+DEFAULT_WEIGHTS = {"interactive": 8, "batch": 2, "background": 1}
+
+
+class Overloaded(Exception):
+    """Raised when the wait queue is full. `retry_after` is in whole seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"render queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class _Lane:
+    __slots__ = ("name", "weight", "waiters", "running", "passed", "admitted", "rejected", "timed_out",
+                 "wait_seconds_total", "max_wait_seconds")
+
+    def __init__(self, name: str, weight: float):
+        self.name = name
+        self.weight = weight
+        self.waiters: Deque[Tuple[threading.Event, float]] = deque()  # (turn, queued at)
+        self.running = 0
+        self.passed = 0.0  # stride scheduling pass value
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds_total = 0.0
+        self.max_wait_seconds = 0.0
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency: int, max_queue: int, initial_service_seconds: float = 2.0,
+                 smoothing: float = 0.2, weights: Optional[Dict[str, float]] = None, reserved: int = 1):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)  # per lane
+        self.smoothing = smoothing
+        self.service_seconds = initial_service_seconds  # EWMA of time spent holding a slot
+        # never reserve every slot, or batch work could not run at all
+        self.reserved = max(0, min(reserved, self.max_concurrency - 1))
+        weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self._lanes = {name: _Lane(name, max(0.01, float(weights[name]))) for name in LANES}
+        self._lock = threading.Lock()
+        self._pass = 0.0  # pass value of the lane served last
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds_total = 0.0
+
+    def _lane(self, lane: str) -> _Lane:
+        try:
+            return self._lanes[lane]
+        except KeyError:
+            raise ValueError(f"unknown priority {lane!r} (one of {', '.join(LANES)})") from None
+
+    def _may_start(self, lane: _Lane) -> bool:
+        if self.running >= self.max_concurrency:
+            return False
+        if lane.name == "interactive":
+            return True
+        others = self.running - self._lanes["interactive"].running
+        return others < self.max_concurrency - self.reserved
+
+    def _next(self) -> Optional[_Lane]:
+        """The waiting lane that gets the next free slot, if any may start."""
+        ready = [lane for lane in self._lanes.values() if lane.waiters and self._may_start(lane)]
+        return min(ready, key=lambda lane: (lane.passed, LANES.index(lane.name))) if ready else None
+
+    def _start(self, lane: _Lane):
+        self.running += 1
+        lane.running += 1
+        self._pass = lane.passed
+        lane.passed += 1.0 / lane.weight
+
+    def retry_after(self, lane: str = "interactive") -> int:
+        """Seconds until a newly queued request in `lane` would likely start."""
+        queue = self._lane(lane)
+        backlog = len(queue.waiters) + 1
+        # the lane's share of the slots while the other waiting lanes compete for them
+        competing = sum(l.weight for l in self._lanes.values() if l.waiters or l is queue)
+        slots = self.max_concurrency if queue.name == "interactive" else self.max_concurrency - self.reserved
+        return max(1, math.ceil(self.service_seconds * backlog / (slots * queue.weight / competing)))
+
+    def _acquire(self, lane: _Lane, deadline: Optional[float] = None) -> float:
+        with self._lock:
+            if self._may_start(lane) and self._next() is None:
+                lane.passed = max(lane.passed, self._pass)
+                self._start(lane)
+                return 0.0
+            if len(lane.waiters) >= self.max_queue:
+                lane.rejected += 1
+                self.rejected += 1
+                raise Overloaded(self.retry_after(lane.name))
+            if not lane.waiters:
+                # rejoin at the current pass: idle time earns no credit
+                lane.passed = max(lane.passed, self._pass)
+            turn = threading.Event()
+            waiter = (turn, time.monotonic())
+            lane.waiters.append(waiter)
+        started = time.monotonic()
+        # the releasing request hands its slot straight to us
+        if turn.wait(None if deadline is None else max(0.0, deadline - time.time())):
+            return time.monotonic() - started
+        with self._lock:
+            if turn.is_set():
+                # handed over just as the wait ran out: pass the slot on, it is of no use to us
+                self.running -= 1
+                lane.running -= 1
+                self._dispatch()
+            else:
+                lane.waiters.remove(waiter)
+            lane.timed_out += 1
+            self.timed_out += 1
+        raise TimeoutError(f"request deadline passed after {time.monotonic() - started:.1f}s in the "
+                           f"{lane.name} queue")
+
+    def _dispatch(self):
+        # releasing a batch slot can free an interactive one and vice versa
+        while True:
+            nxt = self._next()
+            if nxt is None:
+                break
+            turn, _ = nxt.waiters.popleft()
+            self._start(nxt)
+            turn.set()
+
+    def _release(self, lane: _Lane, held_seconds: float):
+        with self._lock:
+            self.service_seconds += self.smoothing * (held_seconds - self.service_seconds)
+            self.running -= 1
+            lane.running -= 1
+            self._dispatch()
+
+    @contextmanager
+    def admit(self, lane: str = "interactive", deadline: Optional[float] = None):
+        """Hold a render slot in `lane` for the duration of the block (may raise
+        Overloaded; TimeoutError if `deadline`, a time.time() value, passes while
+        queued; ValueError for an unknown lane)."""
+        queue = self._lane(lane)
+        waited = self._acquire(queue, deadline)
+        with self._lock:
+            self.admitted += 1
+            self.wait_seconds_total += waited
+            queue.admitted += 1
+            queue.wait_seconds_total += waited
+            queue.max_wait_seconds = max(queue.max_wait_seconds, waited)
+        started = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self._release(queue, time.monotonic() - started)
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "reserved_interactive": self.reserved,
+                "running": self.running,
+                "queued": sum(len(lane.waiters) for lane in self._lanes.values()),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "avg_service_seconds": round(self.service_seconds, 3),
+                "avg_wait_seconds": round(self.wait_seconds_total / self.admitted, 3) if self.admitted else 0.0,
+                "lanes": {lane.name: {
+                    "weight": lane.weight,
+                    "running": lane.running,
+                    "queued": len(lane.waiters),
+                    "oldest_wait_seconds": round(now - lane.waiters[0][1], 3) if lane.waiters else 0.0,
+                    "admitted": lane.admitted,
+                    "rejected": lane.rejected,
+                    "timed_out": lane.timed_out,
+                    "avg_wait_seconds": round(lane.wait_seconds_total / lane.admitted, 3) if lane.admitted else 0.0,
+                    "max_wait_seconds": round(lane.max_wait_seconds, 3),
+                } for lane in self._lanes.values()},
+            }
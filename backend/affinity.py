@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Template Affinity
+Decides which render workers hold which templates. Each template is assigned
+to a few workers (`replicas`, one by default), heaviest templates first onto
+the least loaded worker, and every per-template render is routed to the
+least busy of its workers. A template's parsed master and its rendered
+outputs then live in a few workers' caches instead of all of them, so that
+part of memory grows with the number of templates rather than workers ×
+templates. Every worker still loads every template's bytes and extracted
+structure (TemplateStore.load), since routes change at run time and the pool
+needs each template's form type.
+
+Demand is tracked per template as render seconds with exponential decay,
+plus the work already queued for it (queued jobs × its average render time,
+so a burst counts before it has finished). When one template's share of
+recent work outgrows its share of workers (the background verification form
+under a burst of candidates), all of its workers are busy and some other
+worker is idle, that worker takes it on as an extra replica. Extra replicas
+are released once the template has not needed them for `cooldown` seconds;
+the pool then tells the worker to drop the template from its cache.
+"""
+
+from __future__ import annotations
+import logging, threading, time
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger("affinity")
+
+
+class AffinityScheduler:
+    def __init__(self, workers: int, replicas: int = 1, max_replicas: Optional[int] = None,
+                 half_life: float = 30.0, cooldown: float = 60.0):
+        self.workers = workers
+        self.replicas = max(1, min(replicas, workers))
+        self.max_replicas = max(self.replicas, min(max_replicas or workers, workers))
+        self.half_life = half_life
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.assigned: Dict[str, List[int]] = {}  # template -> workers; the first `replicas` are its home
+        self._weight: Dict[str, float] = {}  # template -> placement weight (file size)
+        self._demand: Dict[str, Tuple[float, float]] = {}  # template -> (decayed render seconds, as of)
+        self._needed: Dict[str, float] = {}  # template -> last time it used an extra replica
+        self._cost: Dict[str, float] = {}  # template -> average seconds per render
+        self._queued: Dict[str, int] = {}  # template -> jobs routed but not done
+        self.outstanding = [0] * workers  # jobs queued or running per worker
+        self.rebalances = 0
+        self.releases = 0
+
+    def place(self, weights: Dict[str, float]):
+        """Assign templates not seen before ({name: weight}), heaviest first."""
+        with self._lock:
+            for name in sorted(weights, key=lambda n: (-weights[n], n)):
+                if name not in self.assigned:
+                    self._weight[name] = weights[name]
+                    self.assigned[name] = self._lightest(self.replicas, exclude=())
+
+    def templates_of(self, worker: int) -> List[str]:
+        with self._lock:
+            return sorted(name for name, workers in self.assigned.items() if worker in workers)
+
+    def _lightest(self, count: int, exclude) -> List[int]:
+        load = [0.0] * self.workers
+        for name, workers in self.assigned.items():
+            for w in workers:
+                load[w] += self._weight.get(name, 1.0)
+        return sorted((w for w in range(self.workers) if w not in exclude), key=lambda w: (load[w], w))[:count]
+
+    def _decayed(self, name: str, now: float) -> float:
+        value, at = self._demand.get(name, (0.0, now))
+        return value * 0.5 ** ((now - at) / self.half_life)
+
+    def _load(self, name: str, now: float) -> float:
+        return self._decayed(name, now) + self._queued.get(name, 0) * self._cost.get(name, 1.0)
+
+    def _hot(self, name: str, now: float) -> bool:
+        """Its share of recent and queued render time is larger than its share of workers."""
+        total = sum(self._load(n, now) for n in self.assigned)
+        if total <= 0:
+            return False
+        return self._load(name, now) / total > len(self.assigned[name]) / self.workers
+
+    def route(self, name: Optional[str]) -> int:
+        """Worker for one render of `name` (None: a whole-candidate job, any worker)."""
+        now = time.time()
+        with self._lock:
+            if name is None:
+                worker = min(range(self.workers), key=lambda w: (self.outstanding[w], w))
+                self.outstanding[worker] += 1
+                return worker
+            if name not in self.assigned:
+                self._weight.setdefault(name, 1.0)
+                self.assigned[name] = self._lightest(self.replicas, exclude=())
+            workers = self.assigned[name]
+            # ties go to the home workers, so an idle extra replica can still cool down
+            worker = workers[min(range(len(workers)), key=lambda i: (self.outstanding[workers[i]], i))]
+            if self.outstanding[worker] > 0 and len(workers) < self.max_replicas and self._hot(name, now):
+                idle = [w for w in self._lightest(self.workers, exclude=workers) if self.outstanding[w] == 0]
+                if idle:
+                    worker = idle[0]
+                    workers.append(worker)
+                    self.rebalances += 1
+                    log.info("🔀 %s is a hot spot; worker %d takes it on (%d replicas)", name, worker, len(workers),
+                             extra={"template": name, "worker": worker, "replicas": len(workers)})
+            if worker in workers[self.replicas:]:
+                self._needed[name] = now
+            self.outstanding[worker] += 1
+            self._queued[name] = self._queued.get(name, 0) + 1
+            return worker
+
+    def done(self, worker: int, name: Optional[str], seconds: float):
+        now = time.time()
+        with self._lock:
+            self.outstanding[worker] = max(0, self.outstanding[worker] - 1)
+            if name is not None:
+                self._queued[name] = max(0, self._queued.get(name, 0) - 1)
+                self._demand[name] = (self._decayed(name, now) + seconds, now)
+                cost = self._cost.get(name)
+                self._cost[name] = seconds if cost is None else 0.8 * cost + 0.2 * seconds
+
+    def release(self) -> List[Tuple[int, str]]:
+        """Give up extra replicas that have cooled down; returns (worker, template) pairs to drop."""
+        now = time.time()
+        dropped = []
+        with self._lock:
+            for name, workers in self.assigned.items():
+                if len(workers) > self.replicas and not self._queued.get(name) and \
+                        now - self._needed.get(name, 0.0) > self.cooldown:
+                    worker = workers.pop()
+                    self.releases += 1
+                    dropped.append((worker, name))
+                    log.info("🔀 %s cooled down; worker %d drops it (%d replicas)", name, worker, len(workers),
+                             extra={"template": name, "worker": worker, "replicas": len(workers)})
+        return dropped
+
+    def status(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            return {
+                "assigned": {name: list(workers) for name, workers in sorted(self.assigned.items())},
+                "outstanding": list(self.outstanding),
+                "demand_seconds": {name: round(self._decayed(name, now), 3) for name in sorted(self._demand)},
+                "rebalances": self.rebalances,
+                "releases": self.releases,
+            }
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Candidate Model
+The candidate's `form_fields` resolved once into compact `__slots__` objects:
+field values by field type, display-ready dates and ages, and address,
+employment, education, reference and gap lists. Fillers read from this model
+instead of walking the nested dicts (and re-parsing dates) per form.
+"""
+
+from __future__ import annotations
+from datetime import datetime
+from typing import Dict, List, Optional
+
+NOMINEE_DOB_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%m/%d/%Y", "%d/%m/%Y")
+
+
+def today_str(fmt: str = "%d-%m-%Y") -> str:
+    return datetime.now().strftime(fmt)
+
+
+def get_nested_value(d: dict, key: str, default: str = "") -> str:
+    """Return a scalar or 'value' from a dict like {'value':..., 'iso':..., 'raw':...}."""
+    if not isinstance(d, dict):
+        return default
+    v = d.get(key)
+    if v is None:
+        return default
+    if isinstance(v, dict):
+        return (v.get("raw") or v.get("value") or v.get("iso") or default) or default
+    return str(v)
+
+
+def extract_city_name(full_address) -> str:
+    """'12 Road, Bangalore, Karnataka 560001' -> 'Bangalore, Karnataka 560001'."""
+    if not full_address:
+        return ""
+    parts = full_address.split(',')
+    if len(parts) >= 2:
+        return parts[-2].strip() + ', ' + parts[-1].strip()
+    return full_address.strip()
+
+
+def blank(v) -> str:
+    """Display value: None and N/A-style placeholders become ''."""
+    if v is None:
+        return ""
+    s = str(v).strip()
+    return "" if s.upper() in {"", "N/A", "NA", "NONE", "NULL"} else s
+
+
+def _value(v) -> str:
+    """A date-like {'value': ...} dict or a plain scalar, as text."""
+    return v.get('value', '') if isinstance(v, dict) else str(v)
+
+
+def format_period(period) -> str:
+    """Course period as 'Aug 2022 - May 2024', falling back to the raw text."""
+    if not isinstance(period, dict):
+        return str(period)
+    start, end = period.get("start", ""), period.get("end", "")
+    if start and end:
+        try:
+            return (f"{datetime.strptime(start, '%Y-%m-%d').strftime('%b %Y')} - "
+                    f"{datetime.strptime(end, '%Y-%m-%d').strftime('%b %Y')}")
+        except (TypeError, ValueError):
+            pass
+    return period.get("raw", "")
+
+
+def age_from(dob: str, year: int) -> str:
+    for fmt in NOMINEE_DOB_FORMATS:
+        try:
+            return str(year - datetime.strptime(dob, fmt).year)
+        except ValueError:
+            continue
+    return ""
+
+
+class Address:
+    __slots__ = ("address_type", "full", "city", "duration", "phone")
+
+    def __init__(self, d: dict):
+        self.address_type = d.get("address_type")
+        town = d.get("town_or_city_name", "")
+        dur = d.get("duration_of_stay", {})
+        self.full = blank(town)
+        self.city = blank(extract_city_name(town))
+        self.duration = blank(dur.get("raw") if isinstance(dur, dict) else (str(dur) if dur else ""))
+        self.phone = blank(d.get("phone_number"))
+
+
+class Employment:
+    __slots__ = ("employer", "address", "position", "period", "code", "salary", "reason", "manager", "landline",
+                 "can_verify", "agency")
+
+    def __init__(self, d: dict):
+        self.employer = d.get("employer_name_and_branch") or d.get("employer_name", "")
+        self.address = d.get("employer_address", "") or d.get("address", "")
+        self.position = d.get("position_and_department") or d.get("position_department", "")
+        self.period = get_nested_value(d, "employment_period")
+        self.code = d.get("employee_code", "")
+        self.salary = d.get("last_salary", "")
+        self.reason = d.get("reason_for_leaving", "")
+        self.manager = d.get("reporting_manager", "")
+        self.landline = d.get("landline", "")
+        self.can_verify = "Yes" if d.get("can_verify") else "No"
+        self.agency = d.get("agency_details") or d.get("contract_agency", "")
+
+
+class Education:
+    __slots__ = ("present", "university", "location", "degree", "period", "roll")
+
+    def __init__(self, d: dict):
+        self.present = bool(d)
+        self.university = d.get("university_and_college", "")
+        self.location = d.get("location_full_address", "")
+        self.degree = d.get("degree_or_course", "")
+        self.period = format_period(d.get("period", {}))
+        self.roll = d.get("roll_or_registration", "")
+
+    def __bool__(self) -> bool:
+        # an empty qualification ({} from the frontend) is skipped like the dict it came from
+        return self.present
+
+
+class Reference:
+    __slots__ = ("name", "phone", "designation", "email", "relationship", "years_known")
+
+    def __init__(self, d: dict):
+        self.name = d.get("name", "")
+        self.phone = d.get("phone", "")
+        self.designation = d.get("designation_and_company", "")
+        self.email = d.get("email", d.get("phone", ""))
+        self.relationship = d.get("relationship", "")
+        self.years_known = d.get("years_known", "")
+
+
+class Gap:
+    __slots__ = ("reason", "period", "address")
+
+    def __init__(self, d: dict):
+        self.reason = d.get("reason", "")
+        self.period = get_nested_value(d, "period")
+        self.address = d.get("address_during_gap", "")
+
+
+class Nominee:
+    __slots__ = ("name", "relationship", "address", "dob", "age", "share")
+
+    def __init__(self, d: dict, year: int):
+        self.name = d.get('name', '')
+        self.relationship = d.get('relationship', '')
+        self.address = d.get('address', '')
+        self.dob = _value(d.get('date_of_birth', {}))
+        self.age = age_from(self.dob, year) if self.dob else ''
+        self.share = d.get('share', '')
+
+
+class FamilyMember:
+    __slots__ = ("name", "relationship", "age", "address")
+
+    def __init__(self, d: dict):
+        self.name = d.get('name', '')
+        self.relationship = d.get('relationship', '')
+        self.age = d.get('age', '')
+        self.address = d.get('address', '')
+
+
+class Candidate:
+    """Everything the fillers need, resolved once per candidate."""
+    __slots__ = (
+        "values", "decl_values", "today", "name", "father", "email", "gender", "raw_name", "raw_gender", "dob",
+        "title", "employer", "address_current", "address_permanent", "address_previous", "employee_address",
+        "employment", "education", "education_slots", "addresses", "addresses_by_type", "references", "gaps",
+        "pf_account_no", "marital_status", "religion", "department", "post_held", "appointment_date",
+        "sign_place", "nominee", "family_member", "witnesses",
+    )
+
+    def __init__(self, form_fields: dict):
+        now = datetime.now()
+        pd = form_fields.get("personal_details", {}) or {}
+        emp = form_fields.get("employment_history", []) or []
+        edu = form_fields.get("education", form_fields.get("education_history", {})) or {}
+        addr = form_fields.get("address_history", {}) or {}
+        refs = form_fields.get("references", []) or []
+        gaps = form_fields.get("gaps", {}) or {}
+        epf = form_fields.get('epf_and_gratuity', {}) or {}
+
+        def get(*paths: str, default: str = "") -> str:
+            for k in paths:
+                v = pd.get(k)
+                if v:
+                    if isinstance(v, dict):
+                        return v.get("raw") or v.get("value") or v.get("iso") or default
+                    return str(v)
+            return default
+
+        self.today = now.strftime("%d-%m-%Y")
+        self.name = get("name")
+        self.father = get("father_name", "fathers_name")
+        self.email = get("email")
+        self.gender = get("gender")
+        # the EPF/gratuity forms use the values exactly as entered
+        self.raw_name = pd.get('name', '')
+        self.raw_gender = pd.get('gender', '')
+        self.dob = _value(pd.get('date_of_birth', {}))
+        self.title = emp[0].get("position_and_department", "") if emp else ""
+        self.employer = emp[0].get("employer_name_and_branch", emp[0].get("employer_name", "")) if emp else ""
+
+        cur = addr.get("current") or {}
+        perm = addr.get("permanent") or {}
+        self.address_current = cur.get("town_or_city_name", "") or ""
+        self.address_permanent = perm.get("town_or_city_name", "") or ""
+        self.address_previous = (addr.get("previous") or {}).get("town_or_city_name", "") or ""
+        self.employee_address = cur.get('town_or_city_name', '') or perm.get('town_or_city_name', '')
+        address_any = cur or perm
+
+        passport_no = get("passport_no")
+        self.values: Dict[str, str] = {
+            "full_name": self.name,
+            "father_name": self.father,
+            "email": self.email,
+            "address": address_any.get("town_or_city_name", ""),
+            "pan_card": get("pan_card", "pan_card_no"),
+            "aadhar_card": get("aadhar_card", "aadhar_card_no"),
+            "phone": address_any.get("phone_number", ""),
+            "date_of_birth": get("date_of_birth"),
+            "gender": self.gender,
+            "nationality": get("nationality"),
+            "signature": "",  # keep blank for real signature
+            "print_name": self.name,
+            "title": self.title,
+            "date": self.today,
+            "din": get("din"),
+            "passport_no": passport_no,
+            "passport_issue_date": get("passport_issue_date"),
+            "passport_expiry_date": get("passport_expiry_date"),
+            "passport_expiry_date_with_employment": get("passport_expiry_date"),
+            # number only; the dates are filled separately to avoid duplication
+            "passport_details": f"Passport No: {passport_no}" if passport_no else "",
+        }
+
+        decl_pd = form_fields.get("personal_details", {})
+        dob = decl_pd.get("date_of_birth", {})
+        if isinstance(dob, dict):
+            dob = dob.get("value", "")
+        self.decl_values: Dict[str, str] = {
+            "name": decl_pd.get("name", ""),
+            "father_name": decl_pd.get("father_name", ""),
+            "email": decl_pd.get("email", ""),
+            "date_of_birth": dob or decl_pd.get("date_of_birth", "") or "",
+            "nationality": decl_pd.get("nationality", ""),
+            "pan_card": decl_pd.get("pan_card", ""),
+            "aadhar_card": decl_pd.get("aadhar_card", ""),
+            "passport_no": decl_pd.get("passport_no", ""),
+            "gender": decl_pd.get("gender", ""),
+        }
+
+        self.employment: List[Employment] = [Employment(e) for e in emp]
+
+        self.education: List[Education] = [Education(edu[k]) for k in ("highest_qualification",
+                                                                          "previous_qualification") if k in edu]
+        # logical education slots for forms that have more boxes than data
+        self.education_slots: List[Optional[Education]] = (self.education[:2] + [None] * 5)[:5]
+
+        # address list in canonical order; the frontend's address_list wins over address_history
+        if form_fields.get("address_list"):
+            source = form_fields["address_list"]
+        else:
+            source = [dict(addr[tag], address_type=tag) for tag in ("current", "previous", "permanent")
+                      if tag in addr]
+        self.addresses: List[Optional[Address]] = [Address(a) if a else None for a in source]
+        by_type: Dict[str, List[Address]] = {}
+        for a in self.addresses:
+            if a is not None:
+                by_type.setdefault(a.address_type, []).append(a)
+        self.addresses_by_type = by_type
+
+        self.references: List[Reference] = [Reference(r) for r in (refs if isinstance(refs, list) else [refs])]
+        self.gaps: List[Gap] = [Gap(g) for g in (gaps if isinstance(gaps, list) else ([gaps] if gaps else []))]
+
+        self.pf_account_no = epf.get('pf_account_no', '')
+        self.marital_status = epf.get('marital_status', '')
+        self.religion = epf.get('religion', '')
+        self.department = epf.get('department', '')
+        self.post_held = epf.get('post_held', '')
+        self.appointment_date = _value(epf.get('date_of_appointment', {}))
+        self.sign_place = epf.get('form_sign_place', '')
+        self.nominee = Nominee(epf.get('nominee', {}) or {}, now.year)
+        self.family_member = FamilyMember(epf.get('family_member_1', {}) or {})
+        self.witnesses: list = epf.get('witnesses', [])
+
+    def first_address(self, address_type: str) -> Optional[Address]:
+        found = self.addresses_by_type.get(address_type)
+        return found[0] if found else None
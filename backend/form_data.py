@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Form Data
+Transforms the frontend's flat form payload into the nested
+`form_fields` structure the populator works with.
+"""
+
+
+def transform_form_data(form_data: dict) -> dict:
+    """Map a frontend payload (see test_data.json) to the populator's data layout."""
+    return {
+        "source_file": "Frontend Input",
+        "form_fields": {
+            "personal_details": {
+                "name": form_data.get('name', ''),
+                "gender": form_data.get('gender', ''),
+                "date_of_birth": {
+                    "value": form_data.get('date_of_birth', ''),
+                    "iso": form_data.get('date_of_birth', '')
+                },
+                "father_name": form_data.get('father_name', ''),
+                "nationality": form_data.get('nationality', ''),
+                "pan_card": form_data.get('pan_card', ''),
+                "aadhar_card": form_data.get('aadhar_card', ''),
+                "din": form_data.get('din', ''),
+                "passport_no": form_data.get('passport_no', ''),
+                "passport_issue_date": {
+                    "value": form_data.get('passport_issue_date', ''),
+                    "iso": form_data.get('passport_issue_date', '')
+                },
+                "passport_expiry_date": {
+                    "value": form_data.get('passport_expiry_date', ''),
+                    "iso": form_data.get('passport_expiry_date', '')
+                },
+                "email": form_data.get('email', ''),
+                "religion": form_data.get('religion', '')
+            },
+            "employment_history": [
+                {
+                    "employer_name_and_branch": form_data.get('current_employment', {}).get('employer_name_and_branch', ''),
+                    "employer_address": form_data.get('current_employment', {}).get('employer_address', ''),
+                    "position_and_department": form_data.get('current_employment', {}).get('position_and_department', ''),
+                    "landline": form_data.get('current_employment', {}).get('landline', ''),
+                    "employment_period": form_data.get('current_employment', {}).get('employment_period', {}),
+                    "employee_code": form_data.get('current_employment', {}).get('employee_code', ''),
+                    "last_salary": form_data.get('current_employment', {}).get('last_salary', ''),
+                    "reason_for_leaving": form_data.get('current_employment', {}).get('reason_for_leaving', ''),
+                    "reporting_manager": form_data.get('current_employment', {}).get('reporting_manager', ''),
+                    "agency_details": form_data.get('current_employment', {}).get('agency_details', ''),
+                    "contract_agency": form_data.get('current_employment', {}).get('contract_agency', ''),
+                    "can_verify": form_data.get('current_employment', {}).get('can_verify', True)
+                }
+            ] + (form_data.get('employment_history', []) or []),
+            "education_history": {
+                "highest_qualification": form_data.get('highest_qualification', {}),
+                "previous_qualification": form_data.get('previous_qualification', {})
+            },
+            "address_history": {
+                "current": {
+                    "town_or_city_name": form_data.get('current_address', {}).get('full_address', ''),
+                    "phone_number": form_data.get('phone', ''),
+                    "duration_of_stay": form_data.get('current_address', {}).get('duration_of_stay', {})
+                },
+                "previous": {
+                    "town_or_city_name": form_data.get('previous_address', {}).get('full_address', '') if isinstance(form_data.get('previous_address'), dict) else '',
+                    "phone_number": form_data.get('phone', ''),
+                    "duration_of_stay": {}
+                },
+                "permanent": {
+                    "town_or_city_name": form_data.get('permanent_address', {}).get('full_address', ''),
+                    "phone_number": form_data.get('phone', ''),
+                    "duration_of_stay": form_data.get('permanent_address', {}).get('duration_of_stay', {})
+                }
+            },
+            # Add address list for multi-address tables
+            "address_list": [
+                {
+                    "address_type": "current",
+                    "town_or_city_name": form_data.get('current_address', {}).get('full_address', ''),
+                    "phone_number": form_data.get('phone', ''),
+                    "duration_of_stay": form_data.get('current_address', {}).get('duration_of_stay', {})
+                },
+                {
+                    "address_type": "permanent", 
+                    "town_or_city_name": form_data.get('permanent_address', {}).get('full_address', ''),
+                    "phone_number": form_data.get('phone', ''),
+                    "duration_of_stay": form_data.get('permanent_address', {}).get('duration_of_stay', {})
+                }
+            ] + ([
+                {
+                    "address_type": "previous",
+                    "town_or_city_name": addr.get('full_address', ''),
+                    "phone_number": form_data.get('phone', ''),
+                    "duration_of_stay": addr.get('duration_of_stay', {})
+                } for addr in form_data.get('previous_address', []) if isinstance(addr, dict)
+            ] if isinstance(form_data.get('previous_address'), list) else []),
+            "references": form_data.get('references', []),
+            "gaps": form_data.get('gaps', {}),
+            "epf_and_gratuity": form_data.get('epf_and_gratuity', {})
+        }
+    }
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Render Limits
+Deadlines and resource caps for one render. Each template gets a wall-clock
+and a CPU-time budget, enforced with interval timers (SIGALRM / SIGPROF) in
+the worker's main thread, and the request as a whole has a deadline after
+which the remaining templates are skipped. A template that overruns is
+interrupted and reported as failed; the forms that did finish are still
+returned. Worker memory is capped with RLIMIT_AS, so a runaway template hits
+MemoryError instead of the machine's OOM killer.
+"""
+
+from __future__ import annotations
+import resource, signal, threading, time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+class TemplateTimeout(BaseException):
+    """A template ran past its budget. A BaseException, like KeyboardInterrupt,
+    so the fillers' broad `except Exception` blocks cannot swallow it."""
+
+
+class RenderLimits:
+    def __init__(self, template_seconds: Optional[float] = None, template_cpu_seconds: Optional[float] = None,
+                 deadline: Optional[float] = None):
+        self.template_seconds = template_seconds or None
+        self.template_cpu_seconds = template_cpu_seconds or None
+        self.deadline = deadline  # wall-clock (time.time()) end of the whole request
+
+    def remaining(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.time()
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    @contextmanager
+    def template(self, name: str) -> Iterator[None]:
+        """Interrupt the block with TemplateTimeout when a budget runs out."""
+        wall = self.template_seconds
+        remaining = self.remaining()
+        by_deadline = remaining is not None and (wall is None or remaining < wall)
+        if by_deadline:
+            wall = remaining
+        cpu = self.template_cpu_seconds
+        # Signal handlers can only be installed from the main thread; elsewhere
+        # only the between-templates deadline check applies
+        if (wall is None and cpu is None) or threading.current_thread() is not threading.main_thread():
+            yield
+            return
+
+        def on_wall(signum, frame):
+            if by_deadline:
+                raise TemplateTimeout(f"{name} was still rendering at the request deadline")
+            raise TemplateTimeout(f"{name} took longer than {wall:.1f}s")
+
+        def on_cpu(signum, frame):
+            raise TemplateTimeout(f"{name} used more than {cpu:.1f}s of CPU")
+
+        previous = signal.signal(signal.SIGALRM, on_wall), signal.signal(signal.SIGPROF, on_cpu)
+        try:
+            if wall is not None:
+                signal.setitimer(signal.ITIMER_REAL, max(wall, 0.001))
+            if cpu is not None:
+                signal.setitimer(signal.ITIMER_PROF, cpu)
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGALRM, previous[0])
+            signal.signal(signal.SIGPROF, previous[1])
+
+
+def limit_memory(megabytes: int):
+    """Cap this process's address space (0 leaves it unlimited)."""
+    if megabytes <= 0:
+        return
+    _soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = megabytes * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
@@ -6,29 +6,22 @@ Pure pattern-based approach without LLM dependencies.
 """
 
 from __future__ import annotations
-import json, os, re
-from datetime import datetime
+import contextlib, copy, hashlib, io, json, logging, os, re
 from typing import Dict, List, Tuple, Optional, Union
 from docx.oxml import OxmlElement
 from docx import Document
-from docx.oxml.table import CT_Tbl
-from docx.oxml.text.paragraph import CT_P
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+from docx.oxml.ns import nsmap, qn
+from lxml import etree
 
+from candidate import Address, Candidate, Education, Employment, Gap, Reference, blank, extract_city_name, today_str
+from limits import TemplateTimeout
+from reproducible import save_document
+from streaming import document_size, scan_form_type, stream_fill
+from tracing import span, trace
 
-def today_str(fmt: str = "%d-%m-%Y") -> str:
-    return datetime.now().strftime(fmt)
-
-
-def get_nested_value(d: dict, key: str, default: str = "") -> str:
-    """Return a scalar or 'value' from a dict like {'value':..., 'iso':..., 'raw':...}."""
-    if not isinstance(d, dict):
-        return default
-    v = d.get(key)
-    if v is None:
-        return default
-    if isinstance(v, dict):
-        return (v.get("raw") or v.get("value") or v.get("iso") or default) or default
-    return str(v)
+log = logging.getLogger("populator")
 
 
 class SmartFormPopulator:
@@ -79,16 +72,27 @@ class SmartFormPopulator:
     def __init__(self, data_file: str):
         with open(data_file, "r", encoding="utf-8") as f:
             data = json.load(f)
-
+        self._bind(data)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SmartFormPopulator":
+        """Build a populator from already-loaded candidate data (no file I/O)."""
+        self = cls.__new__(cls)
+        self._bind(data)
+        return self
+
+    @classmethod
+    def from_candidate(cls, candidate: Candidate) -> "SmartFormPopulator":
+        """Populator around an already-built candidate model (used to compile skeletons)."""
+        self = cls.__new__(cls)
+        self.form_fields = {}
+        self.candidate = candidate
+        return self
+
+    def _bind(self, data: dict):
         self.form_fields: dict = data.get("form_fields", data)
-
-        # quick references
-        self.pd: dict = self.form_fields.get("personal_details", {}) or {}
-        self.emp: list = self.form_fields.get("employment_history", []) or []
-        self.edu: dict = self.form_fields.get("education", self.form_fields.get("education_history", {})) or {}
-        self.addr: dict = self.form_fields.get("address_history", {}) or {}
-        self.refs: list = self.form_fields.get("references", []) or []
-        self.gaps: Union[dict, list] = self.form_fields.get("gaps", {}) or {}
+        # every value the fillers use, resolved once (see candidate.py)
+        self.candidate = Candidate(self.form_fields)
 
     # ----------------------------
     # Structure extraction helpers
@@ -137,9 +141,18 @@ class SmartFormPopulator:
         t = SmartFormPopulator._norm(text)
         return any(SmartFormPopulator._norm(k) in t for k in keys)
 
+    # Precompiled, namespace-aware queries; lxml evaluates them in C instead of
+    # a Python-level walk over every element of the body.
+    _XP_NS = {"w": nsmap["w"]}
+    XP_TEXT = etree.XPath(".//w:t/text()", namespaces=_XP_NS)
+    XP_TEXTBOX_AND_SDT = etree.XPath(".//w:txbxContent | .//w:sdtContent", namespaces=_XP_NS)
+    XP_PARAGRAPHS = etree.XPath(".//w:p", namespaces=_XP_NS)
+    XP_BODY_BLOCKS = etree.XPath("w:p | w:tbl", namespaces=_XP_NS)
+    W_P = qn("w:p")
+
     @staticmethod
     def _pxml_get_text(p_el) -> str:
-        return "".join([(t.text or "") for t in p_el.iter() if getattr(t, "tag", "").endswith("}t")])
+        return "".join(SmartFormPopulator.XP_TEXT(p_el))
 
     @staticmethod
     def _pxml_set_text(p_el, new_text: str):
@@ -165,26 +178,9 @@ class SmartFormPopulator:
 ]
     
     
-    def _build_decl_values(self) -> dict:
-        pd = self.form_fields.get("personal_details", {})
-        dob = pd.get("date_of_birth", {})
-        if isinstance(dob, dict):
-            dob = dob.get("value", "")
-        return {
-            "name": pd.get("name",""),
-            "father_name": pd.get("father_name",""),
-            "email": pd.get("email",""),
-            "date_of_birth": dob or pd.get("date_of_birth","") or "",
-            "nationality": pd.get("nationality",""),
-            "pan_card": pd.get("pan_card",""),
-            "aadhar_card": pd.get("aadhar_card",""),
-            "passport_no": pd.get("passport_no",""),
-            "gender": pd.get("gender",""),
-        }
-
     def _fill_declaration_form(self, doc) -> int:
     # """Fills EPFO-style Declaration form across paragraphs, tables, text boxes, and content controls."""
-        values = self._build_decl_values()
+        values = self.candidate.decl_values
         filled = 0
         filled_fields = set()  # Track what we've filled to avoid duplicates
 
@@ -253,14 +249,8 @@ class SmartFormPopulator:
                                 break
 
         # C) Text boxes & content controls (python-docx doesn't expose; traverse XML)
-        body_el = doc.element.body
-        p_elements = []
-        for el in body_el.iter():
-            tag = getattr(el, "tag", "")
-            if tag.endswith("}txbxContent") or tag.endswith("}sdtContent"):
-                for sub in el.iter():
-                    if getattr(sub, "tag", "").endswith("}p"):
-                        p_elements.append(sub)
+        p_elements = [p_el for box in SmartFormPopulator.XP_TEXTBOX_AND_SDT(doc.element.body)
+                      for p_el in SmartFormPopulator.XP_PARAGRAPHS(box)]
 
         for p_el in p_elements:
             txt = SmartFormPopulator._pxml_get_text(p_el)
@@ -326,18 +316,19 @@ class SmartFormPopulator:
         blocks = []
         p_idx = 0
         t_idx = 0
-        for child in doc._element.body.iterchildren():
-            if isinstance(child, CT_P):
+        for child in self.XP_BODY_BLOCKS(doc._element.body):
+            if child.tag == self.W_P:
                 blocks.append(("p", p_idx))
                 p_idx += 1
-            elif isinstance(child, CT_Tbl):
+            else:
                 blocks.append(("t", t_idx))
                 t_idx += 1
         return blocks
 
     def extract_form_structure(self, docx_path: str) -> Dict:
-        doc = Document(docx_path)
+        return self.extract_document_structure(Document(docx_path))
 
+    def extract_document_structure(self, doc: Document) -> Dict:
         structure = {
             "paragraphs": [],
             "tables": [],
@@ -394,13 +385,14 @@ class SmartFormPopulator:
         structure["form_type"] = self.determine_form_type(structure)
         return structure
 
+    FILLABLE_FIELD_RES = [re.compile(p, re.I) for p in [
+        r":\s*$", r"\(Complete\)\*:", r"\(if any\)\*:",
+        r"\bPrint Name\b", r"\bSignature\b", r"\bDate\b", r"\bTitle\b",
+        r"Name.*:", r"Address.*:", r"Email.*:", r"Phone.*:",
+    ]]
+
     def is_fillable_field(self, text: str) -> bool:
-        pats = [
-            r":\s*$", r"\(Complete\)\*:", r"\(if any\)\*:",
-            r"\bPrint Name\b", r"\bSignature\b", r"\bDate\b", r"\bTitle\b",
-            r"Name.*:", r"Address.*:", r"Email.*:", r"Phone.*:",
-        ]
-        return any(re.search(p, text, re.I) for p in pats)
+        return any(p.search(text) for p in self.FILLABLE_FIELD_RES)
 
     def get_field_type(self, text: str) -> str:
         t = text.lower()
@@ -451,6 +443,18 @@ class SmartFormPopulator:
             return "passport_expiry_date"
         return "unknown"
 
+    # (form type, keywords, regex) checked in order against the lowercased text;
+    # also used by streaming.scan_form_type
+    FORM_TYPE_RULES = (
+        ("background_verification", ("background verification",), None),
+        ("epf_nomination", ("form 2 revised", "nomination and declaration form"), None),
+        ("gratuity", ("gratuity",), None),
+        ("pf_account", ("declaration for pf account linking with aadhar",), None),
+        ("declaration", ("declaration",), None),
+        ("nda", ("non-disclosure", "nda"), None),
+        ("loa", ("leave of absence",), re.compile(r"\bloa\b")),
+    )
+
     def determine_form_type(self, structure: Dict) -> str:
         all_text = " ".join(p["text"] for p in structure["paragraphs"])
         for table in structure["tables"]:
@@ -458,83 +462,16 @@ class SmartFormPopulator:
                 for cell in row["cells"]:
                     all_text += " " + cell["text"]
         t = all_text.lower()
-        if "background verification" in t:
-            return "background_verification"
-        if "form 2 revised" in t or "nomination and declaration form" in t:
-            return "epf_nomination"
-        if "gratuity" in t:
-            return "gratuity"
-        if "declaration for pf account linking with aadhar" in t:
-            return "pf_account"
-        if "declaration" in t:
-            return "declaration"
-        if "non-disclosure" in t or "nda" in t:
-            return "nda"
-        if "leave of absence" in t or re.search(r"\bloa\b", t):
-            return "loa"
+        for form_type, keywords, pattern in self.FORM_TYPE_RULES:
+            if any(k in t for k in keywords) or (pattern is not None and pattern.search(t)):
+                return form_type
         return "general"
 
     # ----------------------------
     # Value mapping (robust)
     # ----------------------------
-    def _get(self, *paths: str, default: str = "") -> str:
-        """Try multiple keys in personal_details."""
-        for k in paths:
-            v = self.pd.get(k)
-            if v:
-                if isinstance(v, dict):
-                    return v.get("raw") or v.get("value") or v.get("iso") or default
-                return str(v)
-        return default
-
-    def _current_address_value(self) -> str:
-        cur = (self.addr.get("current") or {})
-        return cur.get("town_or_city_name", "") or ""
-
-    def _permanent_address_value(self) -> str:
-        perm = (self.addr.get("permanent") or {})
-        return perm.get("town_or_city_name", "") or ""
-
-    def _previous_address_value(self) -> str:
-        prev = (self.addr.get("previous") or {})
-        return prev.get("town_or_city_name", "") or ""
-
     def get_field_value(self, field_type: str) -> str:
-        address_cur = self.addr.get("current", {}) or {}
-        address_perm = self.addr.get("permanent", {}) or {}
-        address_any = address_cur or address_perm
-        mapping = {
-            "full_name": self._get("name"),
-            "father_name": self._get("father_name", "fathers_name"),
-            "email": self._get("email"),
-            "address": address_any.get("town_or_city_name", ""),
-            "pan_card": self._get("pan_card", "pan_card_no"),
-            "aadhar_card": self._get("aadhar_card", "aadhar_card_no"),
-            "phone": address_any.get("phone_number", ""),
-            "date_of_birth": self._get("date_of_birth"),
-            "gender": self._get("gender"),
-            "nationality": self._get("nationality"),
-            "signature": "",  # keep blank for real signature
-            "print_name": self._get("name"),
-            "title": (self.emp[0].get("position_and_department", "") if self.emp else ""),
-            "date": today_str(),
-            "din": self._get("din"),
-            "passport_no": self._get("passport_no"),
-            "passport_issue_date": self._get("passport_issue_date"),
-            "passport_expiry_date": self._get("passport_expiry_date"),
-            "passport_expiry_date_with_employment": self._get("passport_expiry_date"),
-            "passport_details": self._get_passport_details(),
-        }
-        return mapping.get(field_type, "")
-
-    def _get_passport_details(self) -> str:
-        """Get passport number only (dates are filled separately to avoid duplication)."""
-        passport_no = self._get("passport_no")
-        
-        if not passport_no:
-            return ""
-        
-        return f"Passport No: {passport_no}"
+        return self.candidate.values.get(field_type, "")
 
     # ----------------------------
     # Table classification helpers
@@ -602,27 +539,11 @@ class SmartFormPopulator:
         return "unknown"
 
     def _blank(self, v) -> str:
-        if v is None:
-            return ""
-        s = str(v).strip()
-        return "" if s.upper() in {"", "N/A", "NA", "NONE", "NULL"} else s
+        return blank(v)
     
     def _extract_city_name(self, full_address):
         """Extract city name from full address string."""
-        if not full_address:
-            return ""
-        
-        # Split by comma and take the last part (usually city, state)
-        parts = full_address.split(',')
-        if len(parts) >= 2:
-            # Take the second-to-last part (city) and last part (state)
-            city_state = parts[-2].strip() + ', ' + parts[-1].strip()
-            return city_state
-        elif len(parts) == 1:
-            # If no comma, return the whole string
-            return full_address.strip()
-        else:
-            return ""
+        return extract_city_name(full_address)
 
     def _safe_join(self, parts, sep=" "):
         vals = [self._blank(p) for p in parts if self._blank(p)]
@@ -630,42 +551,174 @@ class SmartFormPopulator:
 
     def _clear_right_cells(self, table):
         """Clear the LAST cell in each row (supports 2- or 3-col tables)."""
-        for row in table.rows:
-            if len(row.cells) >= 2:
-                row.cells[-1].text = ""
+        for cells in self._table_grid(table):
+            if len(cells) >= 2:
+                cells[-1].text = ""
 
     def _fill_cell_if_label(self, row, must_contain: List[str], value: str, fixes_ref: List[int]):
-        if len(row.cells) < 2:
+        self._fill_cells_if_label(row.cells, must_contain, value, fixes_ref)
+
+    def _fill_cells_if_label(self, cells, must_contain: List[str], value: str, fixes_ref: List[int]):
+        if len(cells) < 2:
             return
-        left = (row.cells[0].text or "").strip().lower()
+        left = (cells[0].text or "").strip().lower()
         if all(k.lower() in left for k in must_contain):
-            row.cells[-1].text = self._blank(value)
+            cells[-1].text = self._blank(value)
             fixes_ref[0] += 1
 
     # ----------------------------
     # Fillers
     # ----------------------------
-    def populate_form_smart(self, template_path: str, output_path: str) -> bool:
-        print(f"🤖 Smart Processing: {os.path.basename(template_path)}")
+    def populate_form_smart(self, template_path: str, output_path: str, template=None) -> bool:
+        if self.streams(template_path, template):
+            self.stream_form(template_path, output_path + ".part", template=template)
+            os.replace(output_path + ".part", output_path)
+            log.debug("  ✅ Saved: %s", os.path.basename(output_path))
+            return True
+        doc = self.render_form(template_path, template=template)
+        with span("save", template=os.path.basename(template_path)):
+            # never leave a half-written form behind if the render is interrupted
+            save_document(doc, output_path + ".part")
+            os.replace(output_path + ".part", output_path)
+        log.debug("  ✅ Saved: %s", os.path.basename(output_path))
+        return True
+
+    def render_bytes(self, template_path: str, template=None) -> bytes:
+        """Filled DOCX as bytes. Uses the template's compiled skeleton when it has
+        one and the candidate fits it, python-docx otherwise."""
+        name = os.path.basename(template_path)
+        if self.streams(template_path, template):
+            buf = io.BytesIO()
+            self.stream_form(template_path, buf, template=template)
+            return buf.getvalue()
+        skeleton = getattr(template, "skeleton", None)
+        if skeleton is not None:
+            with span("skeleton", template=name):
+                blob = skeleton.render(self.candidate)
+            if blob is not None:
+                return blob
+        doc = self.render_form(template_path, template=template)
+        with span("save", template=name):
+            buf = io.BytesIO()
+            save_document(doc, buf)
+        return buf.getvalue()
+
+    def streams(self, template_path: str, template=None) -> bool:
+        """Whether this template is filled by streaming (see streaming.py): a
+        general form whose document.xml is at least STREAM_MIN_BYTES."""
+        if template is not None:
+            return template.streaming
+        if not self.STREAM_MIN_BYTES or document_size(template_path) < self.STREAM_MIN_BYTES:
+            return False
+        name = os.path.basename(template_path)
+        with span("structure", template=name):
+            form_type = scan_form_type(template_path, self.FORM_TYPE_RULES)
+        if self.streamable(name, form_type):
+            return True
+        log.warning("⚠️  %s is large, but %s forms need the whole document; filling it in memory", name, form_type)
+        return False
+
+    def stream_form(self, template_path: str, dst, template=None) -> int:
+        """Fill a large general form into dst (path or writable file) one block
+        at a time, without loading the document."""
+        name = os.path.basename(template_path)
+        src = io.BytesIO(template.blob) if template is not None else template_path
+        with span("fill", template=name, form_type="general", streaming=True):
+            fixes = stream_fill(src, dst, self.fill_general_block)
+        log.debug("  🔧 Applied %d fixes (streamed)", fixes)
+        return fixes
 
-        structure = self.extract_form_structure(template_path)
-        print(f"  📋 Form Type: {structure['form_type']}")
+    @classmethod
+    def streamable(cls, template_name: str, form_type: str) -> bool:
+        """Only the general rules work one block at a time; the other fillers look across the document."""
+        return form_type == "general" and not cls.is_simple_6(template_name)
 
-        doc = Document(template_path)
+    # document.xml size from which general forms are streamed instead of loaded (0: never)
+    STREAM_MIN_BYTES = 4 * 1024 * 1024
+
+    # Forms that only need the basics, filled by _fill_simple_6fields_everywhere
+    SIMPLE_6_TEMPLATES = (
+        "declarationforpfaccount linking with aadhar",
+        "bounteous_hyd_letterhead template_april 2025",
+        "declarationformforpfaccountpdf",
+    )
+    SKELETON_FORM_TYPES = ("nda", "loa")
+    # Everything determine_form_type() can return
+    FORM_TYPES = ("background_verification", "epf_nomination", "gratuity", "pf_account",
+                  "declaration", "nda", "loa", "general")
+
+    @staticmethod
+    def template_id(name: str) -> str:
+        """'NDA form 1.docx', 'nda form 1' and 'smart_NDA form 1.docx' all name the same template."""
+        name = name.strip().lower()
+        if name.startswith("smart_"):
+            name = name[len("smart_"):]
+        return name[:-len(".docx")] if name.endswith(".docx") else name
+
+    @classmethod
+    def select_templates(cls, names: List[str], only: Optional[List[str]], form_type_of=None) -> List[str]:
+        """The template file names picked by `only`, a list of template ids and/or
+        form types, in their original order (all of them if `only` is empty).
+        `form_type_of(name)` is only called when a form type was asked for.
+        Raises ValueError for a selector that matches no template or form type."""
+        if not only:
+            return list(names)
+        by_id = {cls.template_id(n): n for n in names}
+        wanted = {cls.template_id(s) for s in only}
+        unknown = [s for s in only if cls.template_id(s) not in by_id and cls.template_id(s) not in cls.FORM_TYPES]
+        if unknown:
+            raise ValueError(f"unknown template or form type: {', '.join(unknown)}")
+        types = wanted & set(cls.FORM_TYPES)
+        return [n for n in names
+                if cls.template_id(n) in wanted or (types and form_type_of is not None and form_type_of(n) in types)]
+
+    def classify(self, template_path: str) -> str:
+        """Form type of a template on disk (parses it; a TemplateStore already knows)."""
+        try:
+            return self.extract_document_structure(Document(template_path))["form_type"]
+        except Exception as e:
+            log.warning("⚠️  Could not classify %s: %s", os.path.basename(template_path), e)
+            return "unknown"
+
+    @classmethod
+    def is_simple_6(cls, template_name: str) -> bool:
+        name_lower = template_name.lower()
+        return any(k in name_lower for k in cls.SIMPLE_6_TEMPLATES)
+
+    @classmethod
+    def skeleton_eligible(cls, template_name: str, form_type: str) -> bool:
+        """Forms whose filling is a handful of values in fixed places (see skeleton.py)."""
+        return cls.is_simple_6(template_name) or form_type in cls.SKELETON_FORM_TYPES
+
+    def render_form(self, template_path: str, template=None) -> Document:
+        """Fill one template and return the Document unsaved. `template` is an optional
+        preloaded TemplateEntry (see template_store.py) whose bytes and structure are reused."""
+        name = os.path.basename(template_path)
+        log.debug("🤖 Smart Processing: %s", name)
+
+        if template is not None:
+            structure = template.structure
+            with span("parse", template=name):
+                doc = template.open_document()
+        else:
+            with span("parse", template=name):
+                doc = Document(template_path)
+            with span("structure", template=name):
+                # extraction only reads the tree, so the same document can be filled
+                structure = self.extract_document_structure(doc)
+        log.debug("  📋 Form Type: %s", structure["form_type"])
+
+        with span("fill", template=name, form_type=structure["form_type"]):
+            fixes_applied = self._fill_document(doc, structure, name)
+        log.debug("  🔧 Applied %d fixes", fixes_applied)
+        return doc
+
+    def _fill_document(self, doc: Document, structure: Dict, template_name: str) -> int:
         fixes_applied = 0
 
         # Force simple 6-field behavior for forms that just need the basics
-        name_lower = os.path.basename(template_path).lower()
-        if any(k in name_lower for k in [
-            "declarationforpfaccount linking with aadhar",
-            "bounteous_hyd_letterhead template_april 2025",
-            "declarationformforpfaccountpdf"
-        ]):
-            fixes_applied += self._fill_simple_6fields_everywhere(doc)
-            print(f"  🔧 Applied {fixes_applied} fixes (simple 6-field)")
-            doc.save(output_path)
-            print(f"  ✅ Saved: {os.path.basename(output_path)}")
-            return True
+        if self.is_simple_6(template_name):
+            return self._fill_simple_6fields_everywhere(doc)
 
         if structure["form_type"] == "background_verification":
             fixes_applied += self.fill_background_verification_form(doc, structure)
@@ -690,10 +743,7 @@ class SmartFormPopulator:
             fixes_applied += self.fill_general_form(doc, structure)
             fixes_applied += self._fill_current_address_everywhere(doc)
 
-        print(f"  🔧 Applied {fixes_applied} fixes")
-        doc.save(output_path)
-        print(f"  ✅ Saved: {os.path.basename(output_path)}")
-        return True
+        return fixes_applied
 
     def _heading_for_table(self, tinfo: Dict) -> str:
         heading = (tinfo.get("heading") or "").strip().lower()
@@ -729,48 +779,19 @@ class SmartFormPopulator:
                         p.text = f"{label}: {val}"
                     fixes_applied += 1
 
-        # 2) Prep data
-        employment_history = self.emp
-        edu_hist = self.edu
-        address_history = self.addr
-        refs = self.refs
-        gaps = self.gaps
-
-        # education list
-        edu_list = []
-        if edu_hist:
-            if "highest_qualification" in edu_hist:
-                edu_list.append(edu_hist["highest_qualification"])
-            if "previous_qualification" in edu_hist:
-                edu_list.append(edu_hist["previous_qualification"])
-
-        # address list in canonical order
-        addr_list = []
-        # Use address_list if provided (from frontend), otherwise build from address_history
-        if "address_list" in self.form_fields and self.form_fields["address_list"]:
-            addr_list = self.form_fields["address_list"]
-        elif address_history:
-            for tag in ["current", "previous", "permanent"]:
-                if tag in address_history:
-                    dd = dict(address_history[tag])
-                    dd["address_type"] = tag
-                    addr_list.append(dd)
-
-        # gaps can be dict or list
-        gap_list = gaps if isinstance(gaps, list) else ([gaps] if gaps else [])
+        # 2) Prep data (resolved once in the candidate model)
+        c = self.candidate
+        employment_history = c.employment
+        edu_list = c.education
+        edu_slots = c.education_slots
+        refs = c.references
+        gap_list = c.gaps
 
         counters = {"employment": 0, "education": 0, "address": 0, "reference": 0, "gap": 0, "previous_address": 0}
 
-        # logical education slots for forms that have more boxes than data
-        edu_slots = []
-        if len(edu_list) >= 1:
-            edu_slots.append(edu_list[0])  # highest
-        if len(edu_list) >= 2:
-            edu_slots.append(edu_list[1])  # previous I
-        while len(edu_slots) < 5:
-            edu_slots.append(None)
-
-        # 3) Fill tables
+        # 3) Fill tables. Employment and education tables are collected and filled
+        # together afterwards: their sections run on across tables.
+        employment_tables, education_tables = [], []
         for tinfo in structure["tables"]:
             table = doc.tables[tinfo["index"]]
             section = self._classify_table(table)
@@ -778,7 +799,7 @@ class SmartFormPopulator:
             if section == "employment":
                 i = counters["employment"]; counters["employment"] += 1
                 if i < len(employment_history):
-                    fixes_applied += self._fill_employment_table(table, employment_history[i], i)
+                    employment_tables.append(table)
                 else:
                     # Don't fill if we don't have data for this employment table
                     self._clear_right_cells(table)
@@ -788,16 +809,13 @@ class SmartFormPopulator:
                 i = counters["education"]
                 counters["education"] += 1
                 
-                # For the first education table, pass the entire list to handle forms with multiple sections in one table
-                if i == 0 and len(edu_list) > 0:
-                    fixes_applied += self._fill_education_table(table, edu_list, i)
-                elif i < len(edu_slots) and edu_slots[i] is not None:
-                    fixes_applied += self._fill_education_table(table, edu_slots[i], i)
+                if (i == 0 and len(edu_list) > 0) or (i < len(edu_slots) and edu_slots[i] is not None):
+                    education_tables.append(table)
                 else:
                     self._clear_right_cells(table)
 
             elif section == "address":
-                add_fixes, consumed = self._fill_multi_address_table(table, addr_list, counters)
+                add_fixes, consumed = self._fill_multi_address_table(table, counters)
                 fixes_applied += add_fixes
                 counters["address"] += consumed
                 
@@ -813,8 +831,8 @@ class SmartFormPopulator:
 
             elif section == "reference":
                 # Check if this table also contains address sections (mixed table)
-                if self._looks_like_address(table) and addr_list:
-                    add_fixes, consumed = self._fill_multi_address_table(table, addr_list, counters)
+                if self._looks_like_address(table) and c.addresses:
+                    add_fixes, consumed = self._fill_multi_address_table(table, counters)
                     fixes_applied += add_fixes
                     counters["address"] += consumed
                 
@@ -840,238 +858,235 @@ class SmartFormPopulator:
                 # unknown section → leave as-is
                 pass
 
+        if employment_tables:
+            fixes_applied += self._fill_employment_tables(employment_tables, employment_history)
+        if education_tables:
+            fixes_applied += self._fill_education_tables(education_tables, edu_list)
         return fixes_applied
 
-    def _fill_employment_table(self, table, data: Dict, employment_index: int = 0) -> int:
+    # ----------------------------
+    # Multi-section tables (employment, education)
+    # ----------------------------
+    EMPLOYER_NUMERAL_RE = re.compile(r"\b([ivx]+)\s*[):]")  # "Details of Last Employer (II):"
+    NUMERAL_RE = re.compile(r"\b([ivx]+)\b", re.IGNORECASE)  # the numeral in a header's text
+    _ROMAN_DIGITS = {"i": 1, "v": 5, "x": 10}
+
+    @classmethod
+    def _from_roman(cls, numeral: str) -> int:
+        values = [cls._ROMAN_DIGITS[ch] for ch in numeral.lower()]
+        return sum(-v if v < nxt else v for v, nxt in zip(values, values[1:] + [0]))
+
+    @staticmethod
+    def _to_roman(n: int) -> str:
+        out = ""
+        for value, letters in ((10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I")):
+            while n >= value:
+                out, n = out + letters, n - value
+        return out
+
+    @staticmethod
+    def _table_grid(table) -> List[list]:
+        """[row.cells for row in table.rows], computed once. python-docx rebuilds the
+        whole table's cell grid on every row.cells, so walking a table row by row with
+        it is quadratic in the number of rows."""
+        cells, cols = table._cells, table._column_count
+        return [cells[i:i + cols] for i in range(0, len(cells), cols)]
+
+    def _table_rows(self, table) -> List[tuple]:
+        """(tr element, cells, lowercased first-cell text) for every row."""
+        return [(tr, cells, (cells[0].text if cells else "").strip().lower())
+                for tr, cells in zip(table._tbl.tr_lst, self._table_grid(table))]
+
+    def _route_sections(self, tables, header_section) -> List[List[list]]:
+        """One pass over the rows of `tables`: per table, [tr, cells, left, section] for
+        every row. header_section(left) gives the section a header row opens (-1 for a
+        section to skip) and None for any other row; other rows belong to the section
+        above them, across tables too (a section broken over a page). Rows before the
+        first header have section None."""
+        routed, section = [], None
+        for table in tables:
+            rows = []
+            for tr, cells, left in self._table_rows(table):
+                opened = header_section(left)
+                if opened is not None:
+                    section = opened
+                rows.append([tr, cells, left, section])
+            routed.append(rows)
+        return routed
+
+    @staticmethod
+    def _section_block(routed, section: int) -> Tuple[int, int, int]:
+        """(table, first row, last row) of the rows of `section` in the first table that has any."""
+        for t, rows in enumerate(routed):
+            start = next((r for r, row in enumerate(rows) if row[3] == section), None)
+            if start is not None:
+                end = start
+                while end + 1 < len(rows) and rows[end + 1][3] == section:
+                    end += 1
+                return t, start, end
+        raise ValueError(f"no section {section}")
+
+    def _renumber_header(self, tr, numeral: int):
+        """Write `numeral` over the first roman numeral in a header row's text."""
+        for t in tr.iter(qn("w:t")):
+            if t.text and self.NUMERAL_RE.search(t.text):
+                t.text = self.NUMERAL_RE.sub(self._to_roman(numeral), t.text, count=1)
+                return
+
+    def _clone_section(self, tables, routed, block: Tuple[int, int, int], dest: Tuple[int, int],
+                       copies: List[Tuple[int, int]]):
+        """Insert a copy of the rows `block` (a section, header first) after row dest[1]
+        of table dest[0] for every (section, numeral) in `copies`, renumbering each
+        copied header, then re-read that table's rows."""
+        bt, first, last = block
+        t, after = dest
+        anchor = routed[t][after][0]
+        inserted = []
+        for section, numeral in copies:
+            for r in range(first, last + 1):
+                tr = copy.deepcopy(routed[bt][r][0])
+                if r == first:
+                    self._renumber_header(tr, numeral)
+                anchor.addnext(tr)
+                anchor = tr
+                inserted.append(section)
+        sections = [row[3] for row in routed[t]]
+        sections[after + 1:after + 1] = inserted
+        routed[t] = [[tr, cells, left, section]
+                     for (tr, cells, left), section in zip(self._table_rows(tables[t]), sections)]
+
+    def _fill_employment_tables(self, tables: List, history: List[Employment]) -> int:
+        """Fill all employment tables of a form in one pass over their rows. Rows under
+        a "Details of ... Employer (II)" header, up to the next header and across
+        tables, get history[1]; a header without a numeral opens the section after the
+        previous one. A table without headers before the first header gets the entry
+        of its position. When there are more entries than sections, the last complete
+        section is cloned after the last one, numbered (V), (VI), ..."""
+        last = [-1]
+
+        def header_section(left):
+            if "details of" not in left or "employer" not in left:
+                return None
+            m = self.EMPLOYER_NUMERAL_RE.search(left)
+            last[0] = self._from_roman(m.group(1)) - 1 if m else last[0] + 1
+            return last[0]
+
+        routed = self._route_sections(tables, header_section)
+        for t, rows in enumerate(routed):
+            if all(row[3] is None for row in rows):
+                for row in rows:
+                    row[3] = t
+
+        headers = sorted({row[3] for rows in routed for row in rows
+                          if row[3] is not None and header_section(row[2]) is not None})
+        if headers and len(history) > headers[-1] + 1:
+            # the last section whose rows end at another header: not cut off by a page break
+            blocks = [self._section_block(routed, s) for s in headers]
+            complete = [b for b in blocks if b[2] + 1 < len(routed[b[0]])]
+            block = (complete or blocks)[-1]
+            t = max(t for t, rows in enumerate(routed) if any(row[3] == headers[-1] for row in rows))
+            after = max(r for r, row in enumerate(routed[t]) if row[3] == headers[-1])
+            if tables[block[0]]._column_count == tables[t]._column_count:
+                copies = [(s, s + 1) for s in range(headers[-1] + 1, len(history))]
+                self._clone_section(tables, routed, block, (t, after), copies)
+                log.debug("  ➕ Added %d employment section(s)", len(copies))
+
         fixes = [0]
-        current_section = None
-        sections_filled = 0
-        target_section_filled = False  # Track if we've filled the target section
-        
-        # Check if this table has section headers
-        has_section_headers = False
-        for row in table.rows:
-            left = (row.cells[0].text if row.cells else "").strip().lower()
-            if "details of" in left and "employer" in left:
-                has_section_headers = True
-                break
-        
-        for row in table.rows:
-            left = (row.cells[0].text if row.cells else "").strip().lower()
-            
-            # Check if this is a new employment section
-            if "details of" in left and "employer" in left:
-                if "(iv)" in left or "iv)" in left or "iv:" in left:
-                    current_section = 3
-                elif "(iii)" in left or "iii)" in left or "iii:" in left:
-                    current_section = 2
-                elif "(ii)" in left or "ii)" in left or "ii:" in left:
-                    current_section = 1
-                elif "(i)" in left or "i)" in left or "i:" in left:
-                    current_section = 0
-                else:
-                    current_section = 0
-                
-                # If we encounter a new section after filling our target section, stop
-                if target_section_filled:
-                    break
-                
-                # Only fill this section if it matches our employment index
-                if current_section != employment_index:
-                    continue
-                else:
-                    # We're in the correct section, start filling
-                    target_section_filled = False
-            
-            # Only fill fields if we're in the correct section OR if there are no section headers
-            if current_section == employment_index or (not has_section_headers and employment_index >= 0):
-                if any(k in left for k in ["employers name", "employer name", "employers name & branch", "employer name & branch"]):
-                    self._fill_cell_if_label(row, ["employer"], data.get("employer_name_and_branch") or data.get("employer_name", ""), fixes)
-                if "address" in left:
-                    # Try employer address first, then any other address
-                    addr_value = data.get("employer_address", "") or data.get("address", "")
-                    if addr_value:
-                        self._fill_cell_if_label(row, ["address"], addr_value, fixes)
-                if "position" in left and ("held" in left or "department" in left or "dept" in left):
-                    self._fill_cell_if_label(row, ["position"], data.get("position_and_department") or data.get("position_department", ""), fixes)
-                if "employment period" in left:
-                    self._fill_cell_if_label(row, ["employment period"], get_nested_value(data, "employment_period"), fixes)
-                if "employee code" in left:
-                    self._fill_cell_if_label(row, ["employee code"], data.get("employee_code", ""), fixes)
-                if "last salary" in left:
-                    self._fill_cell_if_label(row, ["salary"], data.get("last_salary", ""), fixes)
-                if "reason for leaving" in left:
-                    self._fill_cell_if_label(row, ["reason"], data.get("reason_for_leaving", ""), fixes)
-                if "reporting manager" in left:
-                    self._fill_cell_if_label(row, ["reporting manager"], data.get("reporting_manager", ""), fixes)
-                if "telephone" in left or "landline" in left:
-                    self._fill_cell_if_label(row, ["telephone"], data.get("landline", ""), fixes)
-                if "verify" in left and "employment" in left:
-                    self._fill_cell_if_label(row, ["verify"], "Yes" if data.get("can_verify") else "No", fixes)
-                if "agency" in left and "details" in left:
-                    self._fill_cell_if_label(row, ["agency"], data.get("agency_details") or data.get("contract_agency", ""), fixes)
+        for rows in routed:
+            for _tr, cells, left, section in rows:
+                if section is not None and 0 <= section < len(history):
+                    self._fill_employment_row(cells, left, history[section], fixes)
         return fixes[0]
 
-    def _fill_education_row(self, row, data: Dict) -> int:
+    def _fill_employment_row(self, cells, left: str, data: Employment, fixes: List[int]):
+        if any(k in left for k in ["employers name", "employer name", "employers name & branch", "employer name & branch"]):
+            self._fill_cells_if_label(cells, ["employer"], data.employer, fixes)
+        if "address" in left:
+            # employer address, falling back to any other address
+            if data.address:
+                self._fill_cells_if_label(cells, ["address"], data.address, fixes)
+        if "position" in left and ("held" in left or "department" in left or "dept" in left):
+            self._fill_cells_if_label(cells, ["position"], data.position, fixes)
+        if "employment period" in left:
+            self._fill_cells_if_label(cells, ["employment period"], data.period, fixes)
+        if "employee code" in left:
+            self._fill_cells_if_label(cells, ["employee code"], data.code, fixes)
+        if "last salary" in left:
+            self._fill_cells_if_label(cells, ["salary"], data.salary, fixes)
+        if "reason for leaving" in left:
+            self._fill_cells_if_label(cells, ["reason"], data.reason, fixes)
+        if "reporting manager" in left:
+            self._fill_cells_if_label(cells, ["reporting manager"], data.manager, fixes)
+        if "telephone" in left or "landline" in left:
+            self._fill_cells_if_label(cells, ["telephone"], data.landline, fixes)
+        if "verify" in left and "employment" in left:
+            self._fill_cells_if_label(cells, ["verify"], data.can_verify, fixes)
+        if "agency" in left and "details" in left:
+            self._fill_cells_if_label(cells, ["agency"], data.agency, fixes)
+
+    def _fill_education_row(self, cells, data: Education) -> int:
         """Helper function to fill a single education row with data."""
-        fixes = 0
-        if not row.cells or len(row.cells) < 2:
+        if not cells or len(cells) < 2:
             return 0
             
-        left = (row.cells[0].text or "").strip().lower()
+        left = (cells[0].text or "").strip().lower()
         
         if "university" in left and "college" in left:
             # Fill only university name, not the address
-            uni = data.get("university_and_college", "")
-            if uni and len(row.cells) >= 2:
-                row.cells[-1].text = self._blank(uni)
-                fixes += 1
+            value = data.university
         elif "location" in left and ("town" in left or "city" in left or "address" in left):
             # Fill the location/address field separately
-            location = data.get("location_full_address", "")
-            if location and len(row.cells) >= 2:
-                row.cells[-1].text = self._blank(location)
-                fixes += 1
+            value = data.location
         elif "period of the course" in left or "period" in left and "course" in left:
-            period_data = data.get("period", {})
-            if isinstance(period_data, dict):
-                start_date = period_data.get("start", "")
-                end_date = period_data.get("end", "")
-                if start_date and end_date:
-                    # Format dates properly (e.g., "Aug 2022 - May 2024")
-                    from datetime import datetime
-                    try:
-                        start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-                        end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-                        formatted_period = f"{start_dt.strftime('%b %Y')} - {end_dt.strftime('%b %Y')}"
-                        if len(row.cells) >= 2:
-                            row.cells[-1].text = self._blank(formatted_period)
-                            fixes += 1
-                    except:
-                        # Fallback to raw period if date parsing fails
-                        raw = period_data.get("raw", "")
-                        if raw and len(row.cells) >= 2:
-                            row.cells[-1].text = self._blank(raw)
-                            fixes += 1
-                else:
-                    raw = period_data.get("raw", "")
-                    if raw and len(row.cells) >= 2:
-                        row.cells[-1].text = self._blank(raw)
-                        fixes += 1
+            value = data.period  # already formatted, e.g. "Aug 2022 - May 2024"
         elif any(k in left for k in ["degree", "diploma", "course"]):
-            degree = data.get("degree_or_course", "")
-            if degree and len(row.cells) >= 2:
-                row.cells[-1].text = self._blank(degree)
-                fixes += 1
+            value = data.degree
         elif any(k in left for k in ["roll", "registration", "seat"]):
-            roll = data.get("roll_or_registration", "")
-            if roll and len(row.cells) >= 2:
-                row.cells[-1].text = self._blank(roll)
-                fixes += 1
-        
-        return fixes
+            value = data.roll
+        else:
+            return 0
+        if not value:
+            return 0
+        cells[-1].text = self._blank(value)
+        return 1
+
+    def _fill_education_tables(self, tables: List, entries: List[Education]) -> int:
+        """Fill all education tables of a form in one pass over their rows. The regular
+        qualification sections ("Details of Highest Qualification", "Details of Previous
+        I to Highest Qualification", ...) take entries[0], entries[1], ... in order,
+        across tables; professional certification sections are left alone. When there
+        are more entries than sections, the last regular section is cloned right after
+        itself, numbered Previous III, IV, ..."""
+        regular = [0]
+
+        def header_section(left):
+            if "details of" not in left or ("qualification" not in left and "professional" not in left):
+                return None
+            if "professional" in left and "certification" in left:
+                return -1
+            regular[0] += 1
+            return regular[0] - 1
+
+        routed = self._route_sections(tables, header_section)
+        have = regular[0]
+        if have and len(entries) > have:
+            bt, first, last = self._section_block(routed, have - 1)
+            copies = [(s, s) for s in range(have, len(entries))]
+            self._clone_section(tables, routed, (bt, first, last), (bt, last), copies)
+            log.debug("  ➕ Added %d education section(s)", len(copies))
 
-    def _fill_education_table(self, table, data: Dict, education_index: int = 0) -> int:
-        """
-        Fill education table. If data is a dict, fill one section at education_index.
-        If data is a list, fill multiple sections (for forms with multiple sections in one table).
-        """
-        # If data is a list, fill all sections in the table
-        if isinstance(data, list):
-            fixes = 0
-            edu_data_list = data
-            sections_encountered = 0
-            current_section = None
-            current_data = None
-            
-            for row in table.rows:
-                left = (row.cells[0].text if row.cells else "").strip().lower()
-                
-                # Check if this is a new education section header
-                if "details of" in left and ("qualification" in left or "professional" in left):
-                    # Skip "Professional Qualifications or Certifications" sections for regular education data
-                    if "professional" in left and "certification" in left:
-                        current_section = None
-                        current_data = None
-                        continue
-                    
-                    # Activate this section if we have data for it
-                    if sections_encountered < len(edu_data_list):
-                        current_section = "active"
-                        current_data = edu_data_list[sections_encountered]
-                    else:
-                        current_section = None
-                        current_data = None
-                    sections_encountered += 1
-                
-                # Fill fields if we're in an active section with data
-                if current_section == "active" and current_data:
-                    fixes += self._fill_education_row(row, current_data)
-            
-            return fixes
-        
-        # Original logic for single education entry (dict)
-        fixes = [0]
-        current_section = None
-        sections_encountered = 0
-        
-        for row in table.rows:
-            left = (row.cells[0].text if row.cells else "").strip().lower()
-            
-            # Check if this is a new education section header
-            if "details of" in left and ("qualification" in left or "professional" in left):
-                # Skip "Professional Qualifications or Certifications" sections for regular education data
-                if "professional" in left and "certification" in left:
-                    current_section = None  # Skip this section
-                    continue
-                
-                # Count the regular education sections and activate only the one matching our education_index
-                # education_index: 0 = first section (Highest), 1 = second section (Previous I), etc.
-                if sections_encountered == education_index:
-                    current_section = "active"
-                else:
-                    current_section = None
-                sections_encountered += 1
-            
-            # Only fill fields if we're in an active section
-            if current_section == "active":
-                if "university" in left and "college" in left:
-                    # Fill only university name, not the address
-                    uni = data.get("university_and_college", "")
-                    self._fill_cell_if_label(row, ["university", "college"], uni, fixes)
-                elif "location" in left and ("town" in left or "city" in left or "address" in left):
-                    # Fill the location/address field separately
-                    location = data.get("location_full_address", "")
-                    self._fill_cell_if_label(row, ["location", "address"], location, fixes)
-                elif any(k in left for k in ["degree", "diploma", "course"]):
-                    self._fill_cell_if_label(row, ["degree"], data.get("degree_or_course", ""), fixes)
-                elif "period of the course" in left:
-                    period_data = data.get("period", {})
-                    if isinstance(period_data, dict):
-                        start_date = period_data.get("start", "")
-                        end_date = period_data.get("end", "")
-                        if start_date and end_date:
-                            # Format dates properly (e.g., "Aug 2022 - May 2024")
-                            from datetime import datetime
-                            try:
-                                start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-                                end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-                                formatted_period = f"{start_dt.strftime('%b %Y')} - {end_dt.strftime('%b %Y')}"
-                                self._fill_cell_if_label(row, ["period"], formatted_period, fixes)
-                            except:
-                                # Fallback to raw period if date parsing fails
-                                self._fill_cell_if_label(row, ["period"], period_data.get("raw", ""), fixes)
-                        else:
-                            self._fill_cell_if_label(row, ["period"], period_data.get("raw", ""), fixes)
-                    else:
-                        self._fill_cell_if_label(row, ["period"], str(period_data), fixes)
-                elif any(k in left for k in ["roll", "registration", "seat"]):
-                    self._fill_cell_if_label(row, ["roll"], data.get("roll_or_registration", ""), fixes)
-        return fixes[0]
+        fixes = 0
+        for rows in routed:
+            for _tr, cells, _left, section in rows:
+                if section is not None and 0 <= section < len(entries):
+                    fixes += self._fill_education_row(cells, entries[section])
+        return fixes
 
-    def _fill_multi_address_table(self, table, address_list: List[Dict], counters: Dict) -> Tuple[int, int]:
+    def _fill_multi_address_table(self, table, counters: Dict) -> Tuple[int, int]:
         """Fill a table that contains multiple address sections.
         Returns (fixes_applied, addresses_consumed)."""
+        address_list = self.candidate.addresses
+        previous_addresses = self.candidate.addresses_by_type.get("previous", [])
         fixes = 0
         idx = counters["address"]  # Use the global address counter
         last_used = None
@@ -1091,21 +1106,17 @@ class SmartFormPopulator:
                 last_used = None
                 
                 # Smart matching: match address type with section label
-                target_address = None
+                target_address: Optional[Address] = None
                 
                 if "permanent" in left:
-                    # Look for permanent address in the list
-                    target_address = next((addr for addr in address_list if addr.get("address_type") == "permanent"), None)
+                    target_address = self.candidate.first_address("permanent")
                 elif "previous" in left:
-                    # Look for previous address(es) in the list
                     # For "Previous Address 1", "Previous Address 2", etc., fill only if we have that many previous addresses
-                    previous_addresses = [addr for addr in address_list if addr.get("address_type") == "previous"]
                     if previous_address_counter < len(previous_addresses):
                         target_address = previous_addresses[previous_address_counter]
                     previous_address_counter += 1
                 elif "current" in left:
-                    # Look for current address in the list
-                    target_address = next((addr for addr in address_list if addr.get("address_type") == "current"), None)
+                    target_address = self.candidate.first_address("current")
                 else:
                     # No specific type mentioned, use sequential logic
                     if idx < len(address_list):
@@ -1116,7 +1127,7 @@ class SmartFormPopulator:
                 if target_address:
                     last_used = target_address
                     # Fill complete address with the full address
-                    right.text = self._blank(target_address.get("town_or_city_name"))
+                    right.text = target_address.full
                     fixes += 1
                 else:
                     right.text = ""
@@ -1130,23 +1141,18 @@ class SmartFormPopulator:
 
             if last_used:
                 if "town" in left or "city" in left:
-                    # Extract city name from the full address
-                    full_address = last_used.get("town_or_city_name", "")
-                    city_name = self._extract_city_name(full_address)
-                    right.text = self._blank(city_name); fixes += 1
+                    right.text = last_used.city; fixes += 1
                 elif "duration of stay" in left:
-                    dur = last_used.get("duration_of_stay", {})
-                    val = dur.get("raw") if isinstance(dur, dict) else (str(dur) if dur else "")
-                    right.text = self._blank(val); fixes += 1
+                    right.text = last_used.duration; fixes += 1
                 elif "phone" in left:
-                    right.text = self._blank(last_used.get("phone_number")); fixes += 1
+                    right.text = last_used.phone; fixes += 1
 
         # Update the global previous_address counter for next table
         counters["previous_address"] = previous_address_counter
         return fixes, consumed_for_this_table
 
     # ------- Reference & Gap (now using _row_label) -------
-    def _fill_reference_table(self, table, data: Union[Dict, List[Dict]], fill_extra_refs: bool = True) -> int:
+    def _fill_reference_table(self, table, data: Union[Reference, List[Reference]], fill_extra_refs: bool = True) -> int:
         refs = data if isinstance(data, list) else [data]
         fixes = 0
         ref_idx = 0
@@ -1197,17 +1203,17 @@ class SmartFormPopulator:
                     continue
 
                 if "designation" in left or "company" in left or "organization" in left or "org" in left:
-                    set_last(row, ref.get("designation_and_company", ""))
+                    set_last(row, ref.designation)
                 elif "ph" in left or "phone" in left or "mobile" in left or "contact" in left:
-                    set_last(row, ref.get("phone", ""))
+                    set_last(row, ref.phone)
                 elif "name" in left:
-                    set_last(row, ref.get("name", ""))
+                    set_last(row, ref.name)
                 elif "email" in left or "mail" in left:
-                    set_last(row, ref.get("email", ref.get("phone", "")))
+                    set_last(row, ref.email)
                 elif "relationship" in left:
-                    set_last(row, ref.get("relationship", ""))
+                    set_last(row, ref.relationship)
                 elif "years known" in left or "known for" in left or "years" in left:
-                    set_last(row, ref.get("years_known", ""))
+                    set_last(row, ref.years_known)
 
         else:
             # sequential groups: Name → Phone → Designation → Email → Relationship → Years … then next ref
@@ -1224,9 +1230,9 @@ class SmartFormPopulator:
                     continue
 
                 if "designation" in left or "company" in left or "organization" in left or "org" in left:
-                    set_last(row, ref.get("designation_and_company", "")); fields_written.add("designation")
+                    set_last(row, ref.designation); fields_written.add("designation")
                 elif "ph" in left or "phone" in left or "mobile" in left or "contact" in left:
-                    set_last(row, ref.get("phone", "")); fields_written.add("phone")
+                    set_last(row, ref.phone); fields_written.add("phone")
                 elif "name" in left:
                     if "name" in fields_written:
                         ref_idx += 1
@@ -1236,17 +1242,17 @@ class SmartFormPopulator:
                             if len(row.cells) >= 2:
                                 row.cells[-1].text = ""
                             continue
-                    set_last(row, ref.get("name", "")); fields_written.add("name")
+                    set_last(row, ref.name); fields_written.add("name")
                 elif "email" in left or "mail" in left:
-                    set_last(row, ref.get("email", ref.get("phone", ""))); fields_written.add("email")
+                    set_last(row, ref.email); fields_written.add("email")
                 elif "relationship" in left:
-                    set_last(row, ref.get("relationship", "")); fields_written.add("relationship")
+                    set_last(row, ref.relationship); fields_written.add("relationship")
                 elif "years known" in left or "known for" in left or "years" in left:
-                    set_last(row, ref.get("years_known", "")); fields_written.add("years")
+                    set_last(row, ref.years_known); fields_written.add("years")
 
         return fixes
 
-    def _fill_gap_table(self, table, data: Dict, fill_second_gap: bool = True) -> int:
+    def _fill_gap_table(self, table, data: Gap, fill_second_gap: bool = True) -> int:
         fixes = [0]
         gap_section = 1  # Track which gap section we're filling
         
@@ -1261,20 +1267,20 @@ class SmartFormPopulator:
             
             if ("reason for gap" in left) or (left.startswith("reason")) or ("gap reason" in left):
                 if gap_section == 1 or fill_second_gap:
-                    self._fill_cell_if_label(row, ["reason"], data.get("reason", ""), fixes)
+                    self._fill_cell_if_label(row, ["reason"], data.reason, fixes)
             elif ("period of gap" in left) or ("period" in left) or ("from" in left) or ("to" in left) or ("duration" in left):
                 if gap_section == 1 or fill_second_gap:
-                    self._fill_cell_if_label(row, ["period"], get_nested_value(data, "period"), fixes)
+                    self._fill_cell_if_label(row, ["period"], data.period, fixes)
             elif ("address stayed during the gap" in left) or ("address during gap" in left) or ("address stayed" in left):
                 if gap_section == 1 or fill_second_gap:
-                    self._fill_cell_if_label(row, ["address"], data.get("address_during_gap", ""), fixes)
+                    self._fill_cell_if_label(row, ["address"], data.address, fixes)
         return fixes[0]
 
     # ----- Other forms -----
     def fill_nda_form(self, doc: Document, structure: Dict) -> int:
         fixes = 0
-        name = self._get("name")
-        title = self.emp[0].get("position_and_department", "") if self.emp else ""
+        c = self.candidate
+        name, title, today = c.name, c.title, c.today
 
         for p in doc.paragraphs:
             t = p.text.strip()
@@ -1283,7 +1289,7 @@ class SmartFormPopulator:
             elif re.fullmatch(r"\s*Title\s*:\s*", t):
                 p.text = f"Title: {title}"; fixes += 1
             elif re.fullmatch(r"\s*Date\s*:\s*", t):
-                p.text = f"Date: {today_str()}"; fixes += 1
+                p.text = f"Date: {today}"; fixes += 1
 
         for table in doc.tables:
             for row in table.rows:
@@ -1294,7 +1300,7 @@ class SmartFormPopulator:
                     elif re.search(r"\bTitle\b", L, re.I):
                         row.cells[-1].text = title; fixes += 1
                     elif re.search(r"\bDate\b", L, re.I):
-                        row.cells[-1].text = today_str(); fixes += 1
+                        row.cells[-1].text = today; fixes += 1
                     # Fill "Print Name" fields in the signature section
                     elif L == "Print Name":
                         row.cells[-1].text = name; fixes += 1
@@ -1313,33 +1319,10 @@ class SmartFormPopulator:
         """Simplified declaration form filling - fills data as text in paragraphs and tables."""
         return self._fill_declaration_form(doc)
 
-    def fill_gratuity_form(self, doc: Document, structure: Dict) -> int:
-        fixes = 0
-        name = self._get("name")
-        father = self._get("father_name", "fathers_name")
-        title = self.emp[0].get("position_and_department", "") if self.emp else ""
-        perm = (self.addr.get("permanent") or self.addr.get("current") or {})
-        paddr = perm.get("town_or_city_name", "")
-
-        for p in doc.paragraphs:
-            t = p.text
-            if re.search(r"Name of employee in full", t, re.I):
-                p.text = f"Name of employee in full: {name}"; fixes += 1
-            elif re.search(r"Father.*Name", t, re.I):
-                p.text = f"{t.strip()} {father}"; fixes += 1
-            elif re.search(r"Post held|Designation|Position", t, re.I):
-                p.text = f"{t.strip()} {title}"; fixes += 1
-            elif re.search(r"Permanent address", t, re.I):
-                p.text = f"Permanent address: {paddr}"; fixes += 1
-            elif re.fullmatch(r"\s*Date\s*:\s*", t):
-                p.text = f"Date: {today_str()}"; fixes += 1
-        return fixes
-
     def fill_loa_form(self, doc: Document, structure: Dict) -> int:
         fixes = 0
-        name = self._get("name")
-        title = self.emp[0].get("position_and_department", "") if self.emp else ""
-        employer = self.emp[0].get("employer_name_and_branch", self.emp[0].get("employer_name", "")) if self.emp else ""
+        c = self.candidate
+        name, title, employer, today = c.name, c.title, c.employer, c.today
 
         for p in doc.paragraphs:
             t = p.text.strip()
@@ -1350,7 +1333,7 @@ class SmartFormPopulator:
             elif re.fullmatch(r"\s*Employer\s*:\s*", t):
                 p.text = f"Employer: {employer}"; fixes += 1
             elif re.fullmatch(r"\s*Date\s*:\s*", t):
-                p.text = f"Date: {today_str()}"; fixes += 1
+                p.text = f"Date: {today}"; fixes += 1
 
         # Fill table fields including "Print Name" fields
         for table in doc.tables:
@@ -1364,7 +1347,7 @@ class SmartFormPopulator:
                     elif re.search(r"\bEmployer\b", L, re.I):
                         row.cells[-1].text = employer; fixes += 1
                     elif re.search(r"\bDate\b", L, re.I):
-                        row.cells[-1].text = today_str(); fixes += 1
+                        row.cells[-1].text = today; fixes += 1
                     # Fill "Print Name" fields in the signature section
                     elif L == "Print Name":
                         row.cells[-1].text = name; fixes += 1
@@ -1381,9 +1364,8 @@ class SmartFormPopulator:
 
     def fill_pf_account_form(self, doc: Document, structure: Dict) -> int:
         fixes = 0
-        name = self._get("name")
-        father = self._get("father_name", "fathers_name")
-        email = self._get("email")
+        c = self.candidate
+        name, father, email, today = c.name, c.father, c.email, c.today
 
         for p in doc.paragraphs:
             t = p.text
@@ -1396,7 +1378,7 @@ class SmartFormPopulator:
             elif re.search(r"Personal\s+Email\s+id\s*:\s*Signature\s*:\s*$", t, re.I):
                 p.text = f"Personal Email id: {email}   Signature:"; fixes += 1
             elif re.fullmatch(r"\s*Date\s*:\s*", t):
-                p.text = f"Date: {today_str()}"; fixes += 1
+                p.text = f"Date: {today}"; fixes += 1
         return fixes
 
     # ------- Simple 6-field filler for the three “basic” forms -------
@@ -1406,13 +1388,14 @@ class SmartFormPopulator:
         in both paragraphs and tables. Very permissive matching.
         """
         fixes = 0
-        name   = self._get("name")
-        father = self._get("father_name", "fathers_name")
-        email  = self._get("email")
-        cur    = self._current_address_value()
-        perm   = self._permanent_address_value()
-        prev   = self._previous_address_value()
-        today  = today_str()
+        c = self.candidate
+        name   = c.name
+        father = c.father
+        email  = c.email
+        cur    = c.address_current
+        perm   = c.address_permanent
+        prev   = c.address_previous
+        today  = c.today
 
         # paragraphs
         # paragraphs
@@ -1424,8 +1407,6 @@ class SmartFormPopulator:
 
 
             if self.DECLARATION_NAME_LINE_RE.search(txt) and self.REL_MARKER_RE.search(txt):
-                name = self._get("name")
-                father = self._get("father_name", "fathers_name")
                 if name and father:
                     new_line = f"I, {name} s/o or d/o {father}"
                     
@@ -1503,119 +1484,87 @@ class SmartFormPopulator:
         Non-BGV rule: fill current by default; honor explicit Permanent/Previous if present.
         Works in both paragraphs and tables.
         """
+        c = self.candidate
+        if not (c.address_current or c.address_permanent or c.address_previous):
+            return 0
         fixes = 0
-        cur  = self._current_address_value()
-        perm = self._permanent_address_value()
-        prev = self._previous_address_value()
+        for p in doc.paragraphs:
+            fixes += self._address_paragraph(p)
+        for table in doc.tables:
+            fixes += self._address_table(table)
+        return fixes
 
-        if not (cur or perm or prev):
+    def _address_for_label(self, label: str) -> str:
+        l = label.lower()
+        if "permanent" in l:
+            return self.candidate.address_permanent
+        if "previous" in l:
+            return self.candidate.address_previous
+        return self.candidate.address_current
+
+    def _address_paragraph(self, p) -> int:
+        text = p.text or ""
+        if not self.ADDRESS_LABEL_RE.search(text):
             return 0
+        label = text.split(":", 1)[0] if ":" in text else text
+        v = self._address_for_label(label)
+        if not v:
+            return 0
+        p.text = f"{label.strip()}: {v}"
+        return 1
 
-        # paragraphs
-        for p in doc.paragraphs:
-            text = p.text or ""
-            if not self.ADDRESS_LABEL_RE.search(text):
+    def _address_table(self, table) -> int:
+        fixes = 0
+        for row in table.rows:
+            if not row.cells:
                 continue
-            label = text.split(":", 1)[0] if ":" in text else text
-            l = label.lower()
-            if "permanent" in l:
-                v = perm
-            elif "previous" in l:
-                v = prev
-            else:
-                v = cur
-            if not v:
+            label = row.cells[0].text or ""
+            if not self.ADDRESS_LABEL_RE.search(label):
+                continue
+            if len(row.cells) < 2:
                 continue
-            if ":" in text:
-                p.text = f"{label.strip()}: {v}"
-            else:
-                p.text = f"{label.strip()}: {v}"
-            fixes += 1
 
-        # tables
-        for table in doc.tables:
-            for row in table.rows:
-                if not row.cells:
-                    continue
-                label = row.cells[0].text or ""
-                if not self.ADDRESS_LABEL_RE.search(label):
-                    continue
-                if len(row.cells) < 2:
-                    continue
-                
-                # Skip header rows - they often contain descriptive text like "full address of nominee"
-                # Real address labels are typically short (e.g., "Address:", "Current Address:")
-                # Header cells tend to be longer and contain "of" or "the"
-                if len(label) > 60 or " of " in label.lower() or " the " in label.lower():
-                    continue
-                
-                l = label.lower()
-                if "permanent" in l:
-                    v = perm
-                elif "previous" in l:
-                    v = prev
-                else:
-                    v = cur
-                row.cells[-1].text = v
-                fixes += 1
+            # Skip header rows - they often contain descriptive text like "full address of nominee"
+            # Real address labels are typically short (e.g., "Address:", "Current Address:")
+            # Header cells tend to be longer and contain "of" or "the"
+            if len(label) > 60 or " of " in label.lower() or " the " in label.lower():
+                continue
 
+            row.cells[-1].text = self._address_for_label(label)
+            fixes += 1
         return fixes
 
     def fill_gratuity_form(self, doc: Document, structure: Dict) -> int:
         """Fill Gratuity form with employee and nominee details."""
         fixes_applied = 0
-        personal_details = self.form_fields.get('personal_details', {})
-        epf_gratuity = self.form_fields.get('epf_and_gratuity', {})
+        c = self.candidate
         
         # Employee details
-        employee_name = personal_details.get('name', '')
-        gender = personal_details.get('gender', '')
-        employee_address = self.addr.get('current', {}).get('town_or_city_name', '') or self.addr.get('permanent', {}).get('town_or_city_name', '')
+        employee_name = c.raw_name
+        gender = c.raw_gender
+        employee_address = c.employee_address
         
         # Employment details
-        post_held = epf_gratuity.get('post_held', '')
-        department = epf_gratuity.get('department', '')
-        date_of_appointment = epf_gratuity.get('date_of_appointment', {})
-        appointment_date = date_of_appointment.get('value', '') if isinstance(date_of_appointment, dict) else str(date_of_appointment)
-        religion = epf_gratuity.get('religion', '')
-        marital_status = epf_gratuity.get('marital_status', '')
+        post_held = c.post_held
+        department = c.department
+        appointment_date = c.appointment_date
+        religion = c.religion
+        marital_status = c.marital_status
         
-        # Nominee details
-        nominee = epf_gratuity.get('nominee', {})
-        nominee_name = nominee.get('name', '')
-        nominee_relationship = nominee.get('relationship', '')
-        nominee_address = nominee.get('address', '')
-        nominee_dob = nominee.get('date_of_birth', {})
-        nominee_dob_value = nominee_dob.get('value', '') if isinstance(nominee_dob, dict) else str(nominee_dob)
-        nominee_share = nominee.get('share', '')
-        
-        # Calculate age from date of birth
-        nominee_age = ''
-        if nominee_dob_value:
-            try:
-                from datetime import datetime
-                # Try different date formats
-                for fmt in ['%Y-%m-%d', '%d-%m-%Y', '%m/%d/%Y', '%d/%m/%Y']:
-                    try:
-                        dob_date = datetime.strptime(nominee_dob_value, fmt)
-                        current_year = datetime.now().year
-                        nominee_age = str(current_year - dob_date.year)
-                        break
-                    except ValueError:
-                        continue
-            except:
-                pass
+        # Nominee details (age is worked out from the date of birth up front)
+        nominee = c.nominee
+        nominee_name = nominee.name
+        nominee_relationship = nominee.relationship
+        nominee_address = nominee.address
+        nominee_age = nominee.age
+        nominee_share = nominee.share
         
         # Witnesses
-        witnesses = epf_gratuity.get('witnesses', [])
-        witness_1 = witnesses[0] if len(witnesses) > 0 else ''
-        witness_2 = witnesses[1] if len(witnesses) > 1 else ''
+        witnesses = c.witnesses
         
         # Form details - use today's date
-        from datetime import datetime
-        today = datetime.now()
-        sign_date = today.strftime('%d-%m-%Y')
-        sign_place = epf_gratuity.get('form_sign_place', '')
+        sign_date = c.today
+        sign_place = c.sign_place
         
         # Fill paragraphs
         for paragraph in doc.paragraphs:
@@ -1697,41 +1646,35 @@ class SmartFormPopulator:
     def fill_epf_nomination_form(self, doc: Document, structure: Dict) -> int:
         """Fill EPF Nomination form with employee and nominee details."""
         fixes_applied = 0
-        personal_details = self.form_fields.get('personal_details', {})
-        epf_gratuity = self.form_fields.get('epf_and_gratuity', {})
+        c = self.candidate
         
         # Employee details
-        employee_name = personal_details.get('name', '')
-        father_name = personal_details.get('father_name', '')
-        dob = personal_details.get('date_of_birth', {})
-        dob_value = dob.get('value', '') if isinstance(dob, dict) else str(dob)
-        gender = personal_details.get('gender', '')
-        employee_address = self.addr.get('current', {}).get('town_or_city_name', '') or self.addr.get('permanent', {}).get('town_or_city_name', '')
+        employee_name = c.raw_name
+        dob_value = c.dob
+        gender = c.raw_gender
+        employee_address = c.employee_address
         
         # PF Account details
-        pf_account_no = epf_gratuity.get('pf_account_no', '')
-        marital_status = epf_gratuity.get('marital_status', '')
+        pf_account_no = c.pf_account_no
+        marital_status = c.marital_status
         
         # Nominee details
-        nominee = epf_gratuity.get('nominee', {})
-        nominee_name = nominee.get('name', '')
-        nominee_relationship = nominee.get('relationship', '')
-        nominee_address = nominee.get('address', '')
-        nominee_dob = nominee.get('date_of_birth', {})
-        nominee_dob_value = nominee_dob.get('value', '') if isinstance(nominee_dob, dict) else str(nominee_dob)
-        nominee_share = nominee.get('share', '')
+        nominee = c.nominee
+        nominee_name = nominee.name
+        nominee_relationship = nominee.relationship
+        nominee_address = nominee.address
+        nominee_dob_value = nominee.dob
+        nominee_share = nominee.share
         
         # Family member details
-        family_member = epf_gratuity.get('family_member_1', {})
-        family_name = family_member.get('name', '')
-        family_relationship = family_member.get('relationship', '')
-        family_age = family_member.get('age', '')
-        family_address = family_member.get('address', '')
+        family = c.family_member
+        family_name = family.name
+        family_relationship = family.relationship
+        family_age = family.age
+        family_address = family.address
         
         # Form details - use today's date
-        from datetime import datetime
-        today = datetime.now()
-        sign_date = today.strftime('%d-%m-%Y')
+        sign_date = c.today
         
         # Fill paragraphs with actual form patterns
         for paragraph in doc.paragraphs:
@@ -1805,77 +1748,211 @@ class SmartFormPopulator:
 
     def fill_general_form(self, doc: Document, structure: Dict) -> int:
         fixes = 0
-        name = self._get("name")
-        email = self._get("email")
-        addr_any = (self.addr.get("current") or self.addr.get("permanent") or {})
-        address = addr_any.get("town_or_city_name", "")
-
-        # paragraphs
         for p in doc.paragraphs:
-            t = p.text
-            if re.fullmatch(r"\s*Name:\s*", t):
-                p.text = f"Name: {name}"; fixes += 1
-            elif re.search(SmartFormPopulator.EMAIL_LABEL_RE, t or ""):
-                label = t.split(":",1)[0] if ":" in (t or "") else "Email"
-                p.text = f"{label.strip()}: {email}"; fixes += 1
-            elif SmartFormPopulator.ADDRESS_LABEL_RE.search(t or ""):
-                label = t.split(":",1)[0] if ":" in (t or "") else "Address"
-                p.text = f"{label.strip()}: {address}"; fixes += 1
-
-        # tables
+            fixes += self._general_paragraph(p)
         for table in doc.tables:
-            for row in table.rows:
-                if len(row.cells) >= 2:
-                    L = (row.cells[0].text or "").strip()
-                    if re.fullmatch(r"\s*Name\s*:?\s*", L, re.I):
-                        row.cells[-1].text = name; fixes += 1
-                    elif SmartFormPopulator.EMAIL_LABEL_RE.search(L):
-                        row.cells[-1].text = email; fixes += 1
-                    elif SmartFormPopulator.ADDRESS_LABEL_RE.search(L):
-                        row.cells[-1].text = address; fixes += 1
+            fixes += self._general_table(table)
+        return fixes
+
+    def _general_paragraph(self, p) -> int:
+        c = self.candidate
+        t = p.text
+        if re.fullmatch(r"\s*Name:\s*", t):
+            p.text = f"Name: {c.name}"
+        elif re.search(SmartFormPopulator.EMAIL_LABEL_RE, t or ""):
+            label = t.split(":",1)[0] if ":" in (t or "") else "Email"
+            p.text = f"{label.strip()}: {c.email}"
+        elif SmartFormPopulator.ADDRESS_LABEL_RE.search(t or ""):
+            label = t.split(":",1)[0] if ":" in (t or "") else "Address"
+            p.text = f"{label.strip()}: {c.values['address']}"
+        else:
+            return 0
+        return 1
+
+    def _general_table(self, table) -> int:
+        fixes = 0
+        c = self.candidate
+        for row in table.rows:
+            if len(row.cells) >= 2:
+                L = (row.cells[0].text or "").strip()
+                if re.fullmatch(r"\s*Name\s*:?\s*", L, re.I):
+                    row.cells[-1].text = c.name; fixes += 1
+                elif SmartFormPopulator.EMAIL_LABEL_RE.search(L):
+                    row.cells[-1].text = c.email; fixes += 1
+                elif SmartFormPopulator.ADDRESS_LABEL_RE.search(L):
+                    row.cells[-1].text = c.values["address"]; fixes += 1
+        return fixes
+
+    def fill_general_block(self, element) -> int:
+        """The general form rules (fill_general_form, then the address rule) for
+        one top-level w:p or w:tbl element; used by streaming fills."""
+        if element.tag == self.W_P:
+            block = Paragraph(element, None)
+            fixes = self._general_paragraph(block)
+            address = self._address_paragraph
+        else:
+            block = Table(element, None)
+            fixes = self._general_table(block)
+            address = self._address_table
+        c = self.candidate
+        if c.address_current or c.address_permanent or c.address_previous:
+            fixes += address(block)
         return fixes
 
     # ----------------------------
     # Batch
     # ----------------------------
-    def populate_all_forms(self, templates_dir: str, output_dir: str) -> int:
-        print("🚀 Starting Smart Form Population")
-        print(f"📁 Templates: {templates_dir}")
-        print(f"📁 Output:    {output_dir}")
+    def data_digest(self) -> str:
+        """Stable hash of the candidate data (part of the rendered-output cache key)."""
+        return hashlib.sha256(json.dumps(self.form_fields, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def populate_all_forms(self, templates_dir: str, output_dir: str, store=None, output_cache=None,
+                           profiler=None, limits=None, progress=None, only=None) -> int:
+        """Fill every template in templates_dir. When a TemplateStore is given,
+        its preloaded templates are used instead of reading the directory, and
+        an optional MemoryBudgetLRU keeps rendered bytes for repeat requests.
+        A RenderProfiler, if given, profiles each template separately.
+        RenderLimits bound each template's time and the whole run; templates
+        that fail or overrun are listed in self.failures (name -> reason).
+        `progress`, if given, is called with {'template', 'status'} as each
+        template starts, finishes (plus 'filename') or fails (plus 'error').
+        `only` limits the run to some template ids / form types (see
+        select_templates); the other templates are never opened."""
+        log.debug("🚀 Starting Smart Form Population")
+        log.debug("📁 Templates: %s", templates_dir)
+        log.debug("📁 Output:    %s", output_dir)
 
         os.makedirs(output_dir, exist_ok=True)
-        template_files = [f for f in os.listdir(templates_dir) if f.lower().endswith(".docx")]
+        if store is not None:
+            # pin one version so a hot reload can't change templates mid-request
+            store = store.snapshot()
+            template_files = self.select_templates(store.names(), only, lambda n: store.get(n).form_type)
+        else:
+            template_files = [f for f in os.listdir(templates_dir) if f.lower().endswith(".docx")]
+            template_files = self.select_templates(
+                template_files, only, lambda n: self.classify(os.path.join(templates_dir, n)))
         if not template_files:
-            print("❌ No template files found!")
+            if only:
+                log.error("❌ No template in %s matches %s", templates_dir, ", ".join(only))
+            else:
+                log.error("❌ No template files found in %s", templates_dir)
             return 0
 
-        print(f"📄 Found {len(template_files)} templates")
+        log.debug("📄 Found %d templates", len(template_files))
+        digest = self.data_digest() if output_cache is not None else None
         ok = 0
+        self.failures: Dict[str, str] = {}
         for name in template_files:
             src = os.path.join(templates_dir, name)
             dst = os.path.join(output_dir, f"smart_{name}")
+            if limits is not None and limits.expired():
+                self.failures[name] = "request deadline passed"
+                if progress is not None:
+                    progress({"template": name, "status": "failed", "error": self.failures[name]})
+                continue
+            if progress is not None:
+                progress({"template": name, "status": "started"})
+            done = 0
             try:
-                if self.populate_form_smart(src, dst):
-                    ok += 1
+                with profiler.template(name) if profiler is not None else contextlib.nullcontext(), \
+                        limits.template(name) if limits is not None else contextlib.nullcontext():
+                    done = self._populate_one(name, src, dst, store, output_cache, digest)
+                ok += done
+            except TemplateTimeout as e:
+                log.warning("⏱️  %s", e, extra={"template": name})
+                self.failures[name] = str(e)
             except Exception as e:
-                import traceback
-                print(f"❌ Error processing {name}: {e}")
-                print(traceback.format_exc())
-        print(f"\n🎉 Completed! {ok}/{len(template_files)} forms populated successfully")
+                log.exception("❌ Error processing %s: %s", name, e, extra={"template": name})
+                self.failures[name] = f"{type(e).__name__}: {e}"
+            if name in self.failures and os.path.exists(dst + ".part"):
+                os.remove(dst + ".part")
+            if progress is not None:
+                if done:
+                    progress({"template": name, "status": "finished", "filename": os.path.basename(dst)})
+                else:
+                    progress({"template": name, "status": "failed",
+                              "error": self.failures.get(name, "no output was written")})
+        if self.failures:
+            log.warning("⚠️  %d forms failed: %s", len(self.failures), ", ".join(self.failures),
+                        extra={"failures": self.failures})
+        log.info("🎉 Completed! %d/%d forms populated successfully", ok, len(template_files),
+                 extra={"forms_ok": ok, "forms_total": len(template_files)})
         return ok
 
+    def _populate_one(self, name: str, src: str, dst: str, store, output_cache, digest) -> int:
+        """Render one template to dst; returns 1 on success, 0 otherwise."""
+        template = store.get(name) if store is not None else None
+        if template is None or template.streaming:
+            # streamed forms are too big to keep in the output cache
+            return 1 if self.populate_form_smart(src, dst, template=template) else 0
+        if output_cache is None:
+            self._write(dst, self.render_bytes(src, template=template))
+            return 1
+        # outputs carry today's date, so the day is part of the key
+        key = ("output", template.sha256, digest, today_str())
+        blob = output_cache.get(key)
+        if blob is None:
+            blob = self.render_bytes(src, template=template)
+            output_cache.put(key, blob)
+        else:
+            log.debug("♻️  Cached: %s", name)
+        self._write(dst, blob)
+        return 1
+
+    @staticmethod
+    def _write(dst: str, blob: bytes):
+        # written under a temporary name so readers never see a partial form
+        with open(dst + ".part", "wb") as f:
+            f.write(blob)
+        os.replace(dst + ".part", dst)
+        log.debug("  ✅ Saved: %s", os.path.basename(dst))
+
 
 def main():
-    import sys
-    if len(sys.argv) < 3:
-        print("Usage: python smart_form_populator.py <data_file> <templates_dir> [output_dir]")
-        sys.exit(1)
-    data_file = sys.argv[1]
-    templates_dir = sys.argv[2]
-    output_dir = sys.argv[3] if len(sys.argv) > 3 else "populated_forms_smart"
-
-    pop = SmartFormPopulator(data_file)
-    count = pop.populate_all_forms(templates_dir, output_dir)
+    import argparse, sys
+    from tracing import configure_logging
+    parser = argparse.ArgumentParser(description="Fill every DOCX template with one candidate's data")
+    parser.add_argument("data_file")
+    parser.add_argument("templates_dir")
+    parser.add_argument("output_dir", nargs="?", default="populated_forms_smart")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log per-template progress")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--profile-dir", help="write per-template cProfile stats here")
+    mode.add_argument("--memory-report", metavar="PATH",
+                      help="measure peak allocation and RSS per template and stage, write a JSON report")
+    parser.add_argument("--only", action="append", metavar="TEMPLATES",
+                        help="fill only these template ids or form types (comma-separated, repeatable)")
+    parser.add_argument("--stream-mb", type=float, metavar="MB",
+                        help="stream general forms whose document.xml is at least this big (default %g, 0 = never)"
+                             % (SmartFormPopulator.STREAM_MIN_BYTES / 1024 / 1024))
+    args = parser.parse_args()
+    configure_logging("DEBUG" if args.verbose else None, json_output=False)
+
+    profiler = None
+    if args.profile_dir:
+        from profiling import RenderProfiler
+        profiler = RenderProfiler(args.profile_dir)
+    elif args.memory_report:
+        from profiling import MemoryProfiler
+        profiler = MemoryProfiler()
+    only = [t.strip() for arg in args.only or () for t in arg.split(",") if t.strip()]
+    if args.stream_mb is not None:
+        SmartFormPopulator.STREAM_MIN_BYTES = int(args.stream_mb * 1024 * 1024)
+    pop = SmartFormPopulator(args.data_file)
+    with trace() as tr:
+        if args.memory_report:
+            tr.hooks.append(profiler.stage)
+        try:
+            count = pop.populate_all_forms(args.templates_dir, args.output_dir, profiler=profiler, only=only)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.profile_dir:
+        for row in profiler.summary()["top"]:
+            print(f"{row['cumtime_ms']:>10.1f} ms  {row['calls']:>8}  {row['function']}")
+    elif args.memory_report:
+        from profiling import format_memory_report
+        profiler.close()
+        print(format_memory_report(profiler.write_report(args.memory_report)))
     sys.exit(0 if count > 0 else 2)
 
 
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Render Profiling
+Opt-in cProfile capture for one render. Each template is profiled separately
+and its stats are written as a .pstats file (open with `python -m pstats` or
+snakeviz); a short top-functions summary is returned to the caller.
+
+MemoryProfiler does the same for memory: peak traced allocation (tracemalloc)
+and RSS change per template and per render stage (parse, structure, fill,
+save), for sizing how many workers fit on a node.
+"""
+
+from __future__ import annotations
+import cProfile, json, os, pstats, re, resource, sys, tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", os.path.splitext(name)[0]).strip("_") or "template"
+
+
+def top_functions(stats: pstats.Stats, limit: int = 15) -> List[Dict]:
+    """Functions with the highest cumulative time, most expensive first."""
+    rows = []
+    for (filename, line, func), (cc, nc, tt, ct, _callers) in stats.stats.items():
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{line}({func})",
+            "calls": nc,
+            "tottime_ms": round(tt * 1000, 2),
+            "cumtime_ms": round(ct * 1000, 2),
+        })
+    rows.sort(key=lambda r: r["cumtime_ms"], reverse=True)
+    return rows[:limit]
+
+
+class RenderProfiler:
+    """Collects one cProfile run per template into `profile_dir`."""
+
+    def __init__(self, profile_dir: str, limit: int = 15):
+        self.profile_dir = profile_dir
+        self.limit = limit
+        self.templates: Dict[str, Dict] = {}
+        os.makedirs(profile_dir, exist_ok=True)
+
+    @contextmanager
+    def template(self, name: str) -> Iterator[None]:
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            path = os.path.join(self.profile_dir, f"{_safe_name(name)}.pstats")
+            profile.dump_stats(path)
+            stats = pstats.Stats(profile)
+            self.templates[name] = {
+                "pstats": path,
+                "total_ms": round(stats.total_tt * 1000, 2),
+                "top": top_functions(stats, self.limit),
+            }
+
+    def summary(self) -> Dict:
+        """Per-template top functions plus the same across the whole render."""
+        combined: Optional[pstats.Stats] = None
+        for entry in self.templates.values():
+            if combined is None:
+                combined = pstats.Stats(entry["pstats"])
+            else:
+                combined.add(entry["pstats"])
+        return {
+            "profile_dir": self.profile_dir,
+            "templates": self.templates,
+            "top": top_functions(combined, self.limit) if combined is not None else [],
+        }
+
+
+def rss_bytes() -> int:
+    """Current resident set size (peak RSS where /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, KiB elsewhere
+
+
+def _kb(n: int) -> float:
+    return round(n / 1024, 1)
+
+
+class MemoryProfiler:
+    """Peak allocation and RSS delta per template and per stage.
+
+    Use template() around each template and register stage() as a trace hook
+    (`tr.hooks.append(profiler.stage)`) so every span with a `template`
+    attribute is measured. tracemalloc only sees Python allocations; lxml
+    keeps the XML trees in C memory, which shows up in the RSS delta instead.
+    tracemalloc slows rendering down noticeably, so this is for the CLI and
+    benchmarks, not for production requests.
+    """
+
+    def __init__(self):
+        self.templates: Dict[str, Dict] = {}
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        self._rss_start = rss_bytes()
+        self._open_peak = 0  # highest traced peak seen since the current template started
+
+    def _fold_peak(self):
+        self._open_peak = max(self._open_peak, tracemalloc.get_traced_memory()[1])
+
+    @contextmanager
+    def template(self, name: str) -> Iterator[None]:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        rss = rss_bytes()
+        self._open_peak = base
+        entry = self.templates.setdefault(name, {"stages": {}})
+        try:
+            yield
+        finally:
+            self._fold_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            entry.update(peak_kb=_kb(self._open_peak - base), retained_kb=_kb(current - base),
+                         rss_delta_kb=_kb(rss_bytes() - rss))
+
+    @contextmanager
+    def stage(self, name: str, attrs: Dict) -> Iterator[None]:
+        template = attrs.get("template")
+        if template is None:
+            yield
+            return
+        self._fold_peak()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        rss = rss_bytes()
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            self._fold_peak()
+            stages = self.templates.setdefault(template, {"stages": {}})["stages"]
+            prev = stages.get(name)
+            row = {"peak_kb": _kb(peak - base), "retained_kb": _kb(current - base),
+                   "rss_delta_kb": _kb(rss_bytes() - rss)}
+            if prev is not None:  # a stage that runs twice (e.g. parse fallback) keeps its worst peak
+                row = {k: max(prev[k], v) if k == "peak_kb" else round(prev[k] + v, 1) for k, v in row.items()}
+            stages[name] = row
+
+    def close(self):
+        if self._started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def summary(self) -> Dict:
+        rss = rss_bytes()
+        peaks = [t.get("peak_kb", 0.0) for t in self.templates.values()]
+        return {
+            "templates": self.templates,
+            "max_peak_kb": max(peaks, default=0.0),
+            "rss_start_kb": _kb(self._rss_start),
+            "rss_end_kb": _kb(rss),
+            # what one worker process needs: its resident size plus the worst render on top
+            "per_worker_kb": _kb(rss) + max(peaks, default=0.0),
+        }
+
+    def write_report(self, path: str) -> Dict:
+        report = self.summary()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        return report
+
+
+def format_memory_report(report: Dict) -> str:
+    """Plain-text table of a MemoryProfiler summary, largest peak first.
+    Stage columns are traced peak / RSS delta in KB."""
+    stage_names = ["parse", "structure", "fill", "save", "skeleton"]
+    present = [s for s in stage_names if any(s in t["stages"] for t in report["templates"].values())]
+
+    def cell(stage: Optional[Dict]) -> str:
+        return f"{stage['peak_kb']:.0f}/{stage['rss_delta_kb']:.0f}" if stage else "-"
+
+    lines = [f"{'template':<50}{'peak KB':>10}{'RSS Δ KB':>10}" + "".join(f"{s:>16}" for s in present)]
+    for name, t in sorted(report["templates"].items(), key=lambda kv: -kv[1].get("peak_kb", 0.0)):
+        cells = "".join(f"{cell(t['stages'].get(s)):>16}" for s in present)
+        lines.append(f"{name[:49]:<50}{t.get('peak_kb', 0.0):>10}{t.get('rss_delta_kb', 0.0):>10}" + cells)
+    per_worker_mb = report["per_worker_kb"] / 1024
+    lines.append(f"\nProcess RSS {report['rss_end_kb'] / 1024:.0f} MB, worst render peak "
+                 f"{report['max_peak_kb'] / 1024:.1f} MB -> about {per_worker_mb:.0f} MB per worker "
+                 f"({int(1024 // per_worker_mb) if per_worker_mb else 0} workers per GB)")
+    return "\n".join(lines)
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+Render Farm
+Lets several backend nodes share one render queue without a broker. Jobs live
+in a SQLite file (WAL mode) that every node opens; a node claims a job by
+taking a lease on it and renews the lease with heartbeats while its local
+render pool works. If a node dies its leases run out and another node picks
+the job up again, up to `max_attempts` times. Finished files are published
+into a shared output folder, so whichever node answers /api/download finds
+them. Per-template progress events go through the database as well, so the
+node that took the request can stream them to the client.
+
+Run extra render-only nodes next to the backend with:
+
+    python render_farm.py --db ../farm/jobs.db --output ../output --workers 4
+"""
+
+from __future__ import annotations
+import argparse, json, logging, os, shutil, signal, socket, sqlite3, sys, tempfile, threading, time, uuid
+from typing import Callable, Dict, List, Optional
+
+from sampler import MAX_STACKS, TRUNCATED
+
+log = logging.getLogger("render_farm")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           TEXT PRIMARY KEY,
+    status       TEXT NOT NULL,            -- queued | running | done | failed
+    payload      TEXT NOT NULL,            -- {"data": ..., "options": ...}
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    node         TEXT,
+    lease_until  REAL,
+    created      REAL NOT NULL,
+    started      REAL,
+    finished     REAL,
+    result       TEXT,
+    error        TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, created);
+CREATE TABLE IF NOT EXISTS job_events (
+    seq    INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    event  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, seq);
+CREATE TABLE IF NOT EXISTS nodes (
+    id        TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL,
+    info      TEXT
+);
+CREATE TABLE IF NOT EXISTS stacks (    -- sampled stacks of standalone nodes (see sampler.py)
+    node    TEXT NOT NULL,
+    stack   TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    PRIMARY KEY (node, stack)
+);
+"""
+
+
+class JobFailed(Exception):
+    """The job ended in the failed state; the message is the recorded error."""
+
+
+class JobQueue:
+    """SQLite-backed job table shared by every node. Safe to use from many threads and processes."""
+
+    def __init__(self, path: str, max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db().executescript(SCHEMA)
+
+    def _db(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def enqueue(self, data: dict, options: Optional[dict] = None, job_id: Optional[str] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        self._db().execute(
+            "INSERT INTO jobs (id, status, payload, max_attempts, created) VALUES (?, 'queued', ?, ?, ?)",
+            (job_id, json.dumps({"data": data, "options": options or {}}), self.max_attempts, time.time()))
+        return job_id
+
+    def claim(self, node: str, lease_seconds: float) -> Optional[Dict]:
+        """Lease the oldest runnable job: queued, or running on a node whose lease has expired."""
+        db = self._db()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # Expired jobs that are out of attempts are given up on first
+            db.execute("UPDATE jobs SET status='failed', finished=?, error='lease expired ' || attempts || ' times' "
+                       "WHERE status='running' AND lease_until < ? AND attempts >= max_attempts", (now, now))
+            row = db.execute("SELECT id, payload, attempts, node FROM jobs "
+                             "WHERE status='queued' OR (status='running' AND lease_until < ?) "
+                             "ORDER BY created LIMIT 1", (now,)).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            db.execute("UPDATE jobs SET status='running', node=?, lease_until=?, attempts=attempts+1, "
+                       "started=COALESCE(started, ?) WHERE id=?", (node, now + lease_seconds, now, row["id"]))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        if row["attempts"]:
+            log.warning("♻️  Retrying job %s (attempt %d, previous node %s)", row["id"], row["attempts"] + 1,
+                        row["node"])
+        payload = json.loads(row["payload"])
+        return {"id": row["id"], "data": payload["data"], "options": payload["options"],
+                "attempt": row["attempts"] + 1}
+
+    def heartbeat(self, job_id: str, node: str, lease_seconds: float) -> bool:
+        """Extend the lease. False means the job was taken over and the node should drop it."""
+        cur = self._db().execute("UPDATE jobs SET lease_until=? WHERE id=? AND node=? AND status='running'",
+                                 (time.time() + lease_seconds, job_id, node))
+        return cur.rowcount == 1
+
+    def complete(self, job_id: str, node: str, result: dict) -> bool:
+        cur = self._db().execute("UPDATE jobs SET status='done', finished=?, result=?, lease_until=NULL "
+                                 "WHERE id=? AND node=? AND status='running'",
+                                 (time.time(), json.dumps(result), job_id, node))
+        return cur.rowcount == 1
+
+    def fail(self, job_id: str, node: str, error: str, retry: bool = False) -> bool:
+        """Record a failure. With `retry` the job goes back to the queue while attempts remain."""
+        cur = self._db().execute(
+            "UPDATE jobs SET status=CASE WHEN ? AND attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+            "finished=CASE WHEN ? AND attempts < max_attempts THEN NULL ELSE ? END, "
+            "error=?, lease_until=NULL WHERE id=? AND node=? AND status='running'",
+            (retry, retry, time.time(), error, job_id, node))
+        return cur.rowcount == 1
+
+    def cancel(self, job_id: str, error: str = "cancelled") -> bool:
+        """Fail a job nobody waits for any more. A queued job is never claimed; the node
+        rendering a running one loses its heartbeat and drops the result."""
+        cur = self._db().execute("UPDATE jobs SET status='failed', finished=?, error=?, lease_until=NULL "
+                                 "WHERE id=? AND status IN ('queued', 'running')", (time.time(), error, job_id))
+        return cur.rowcount == 1
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        row = self._db().execute("SELECT id, status, attempts, node, created, started, finished, result, error "
+                                 "FROM jobs WHERE id=?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def add_event(self, job_id: str, event: dict):
+        self._db().execute("INSERT INTO job_events (job_id, event) VALUES (?, ?)", (job_id, json.dumps(event)))
+
+    def events(self, job_id: str, after: int = 0) -> List[tuple]:
+        """(seq, event) pairs recorded for the job after `after`, oldest first."""
+        return [(r["seq"], json.loads(r["event"])) for r in self._db().execute(
+            "SELECT seq, event FROM job_events WHERE job_id=? AND seq>? ORDER BY seq", (job_id, after))]
+
+    def wait(self, job_id: str, timeout: float, poll: float = 0.05,
+             on_event: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """Block until the job is done; its result. Raises JobFailed or TimeoutError.
+        `on_event` receives the job's progress events as they arrive."""
+        deadline = time.monotonic() + timeout
+        seen = 0
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                raise KeyError(job_id)
+            if on_event is not None:
+                for seen, event in self.events(job_id, seen):
+                    on_event(event)
+            if job["status"] == "done":
+                return job["result"]
+            if job["status"] == "failed":
+                raise JobFailed(job["error"] or "render failed")
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"job {job_id} not finished after {timeout:.0f}s ({job['status']})")
+            time.sleep(poll)
+
+    def node_seen(self, node: str, info: dict):
+        self._db().execute("INSERT INTO nodes (id, last_seen, info) VALUES (?, ?, ?) "
+                           "ON CONFLICT(id) DO UPDATE SET last_seen=excluded.last_seen, info=excluded.info",
+                           (node, time.time(), json.dumps(info)))
+
+    def add_stacks(self, node: str, counts: Dict[str, int], max_stacks: int = MAX_STACKS):
+        """Add a node's sampled stacks; past max_stacks distinct ones the rest count as TRUNCATED."""
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            held = {r["stack"] for r in db.execute("SELECT stack FROM stacks WHERE node=?", (node,))}
+            for stack, n in counts.items():
+                if stack not in held:
+                    if len(held) >= max_stacks:
+                        stack = ";".join(TRUNCATED)
+                    held.add(stack)
+                db.execute("INSERT INTO stacks (node, stack, samples) VALUES (?, ?, ?) "
+                           "ON CONFLICT(node, stack) DO UPDATE SET samples=samples+excluded.samples", (node, stack, n))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def stacks(self, reset: bool = False) -> Dict[str, int]:
+        """Sampled stacks of every node, merged; `reset` clears them after reading."""
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            counts = {r["stack"]: r["n"] for r in db.execute("SELECT stack, SUM(samples) AS n FROM stacks GROUP BY stack")}
+            if reset:
+                db.execute("DELETE FROM stacks")
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return counts
+
+    def prune(self, max_age: float) -> int:
+        """Drop finished jobs and silent nodes older than `max_age` seconds."""
+        cutoff = time.time() - max_age
+        db = self._db()
+        n = db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?", (cutoff,)).rowcount
+        db.execute("DELETE FROM job_events WHERE job_id NOT IN (SELECT id FROM jobs)")
+        db.execute("DELETE FROM nodes WHERE last_seen < ?", (cutoff,))
+        db.execute("DELETE FROM stacks WHERE node NOT IN (SELECT id FROM nodes)")
+        return n
+
+    def stats(self, node_timeout: float = 30.0) -> Dict:
+        db = self._db()
+        counts = {r["status"]: r["n"] for r in db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+        now = time.time()
+        nodes = [{"id": r["id"], "seconds_since_seen": round(now - r["last_seen"], 1),
+                  "alive": now - r["last_seen"] < node_timeout, **json.loads(r["info"] or "{}")}
+                 for r in db.execute("SELECT id, last_seen, info FROM nodes ORDER BY id")]
+        return {"jobs": {s: counts.get(s, 0) for s in ("queued", "running", "done", "failed")}, "nodes": nodes}
+
+
+def publish_file(src_dir: str, filename: str, output_dir: str):
+    """Copy one rendered file into the shared output folder; it appears atomically."""
+    os.makedirs(output_dir, exist_ok=True)
+    part = os.path.join(output_dir, f".{filename}.{uuid.uuid4().hex[:8]}.part")
+    shutil.copyfile(os.path.join(src_dir, filename), part)
+    os.replace(part, os.path.join(output_dir, filename))
+
+
+def publish(src_dir: str, output_dir: str, skip=()) -> List[str]:
+    """Publish every rendered file in src_dir (those in `skip` are already there)."""
+    files = []
+    for filename in sorted(os.listdir(src_dir)):
+        if not filename.endswith(".docx"):
+            continue
+        if filename not in skip:
+            publish_file(src_dir, filename, output_dir)
+        files.append(filename)
+    return files
+
+
+class FarmNode:
+    """Claims jobs from the shared queue and renders them on this machine's RenderPool."""
+
+    def __init__(self, queue: JobQueue, pool, output_dir: str, node_id: Optional[str] = None,
+                 lease_seconds: float = 30.0, poll_interval: float = 0.2, slots: Optional[int] = None,
+                 retention_seconds: float = 24 * 3600, share_stacks: bool = False):
+        self.queue = queue
+        self.pool = pool
+        self.output_dir = output_dir
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.slots = slots or pool.size
+        self.retention_seconds = retention_seconds
+        # a standalone node has no endpoint of its own, so it hands its pool's sampled
+        # stacks to the queue; a backend's node leaves them to the backend
+        self.share_stacks = share_stacks
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self) -> "FarmNode":
+        if self._threads:
+            return self
+        self.pool.start()
+        for i in range(self.slots):
+            t = threading.Thread(target=self._claim_loop, name=f"farm-slot-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._presence_loop, name="farm-presence", daemon=True)
+        t.start()
+        self._threads.append(t)
+        log.info("🚜 Farm node %s pulling jobs from %s with %d slots", self.node_id, self.queue.path, self.slots)
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self) -> Dict:
+        return {"node": self.node_id, "slots": self.slots, "running": self.running,
+                "completed": self.completed, "failed": self.failed, "ready": self.pool.is_ready()}
+
+    def _presence_loop(self):
+        last_prune = 0.0
+        while not self._stop.is_set():
+            try:
+                self.queue.node_seen(self.node_id, self.status())
+                if self.share_stacks:
+                    counts = self.pool.stacks(reset=True)
+                    if counts:
+                        self.queue.add_stacks(self.node_id, counts)
+                if time.time() - last_prune > 600:
+                    self.queue.prune(self.retention_seconds)
+                    last_prune = time.time()
+            except Exception as e:
+                log.warning("⚠️  Farm presence update failed: %s", e)
+            self._stop.wait(self.lease_seconds / 3)
+
+    def _claim_loop(self):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim(self.node_id, self.lease_seconds) if self.pool.is_ready() else None
+            except sqlite3.Error as e:
+                log.warning("⚠️  Could not claim a job: %s", e)
+                job = None
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            with self._lock:
+                self.running += 1
+            try:
+                ok = self._run(job)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    if ok is not None:
+                        self.completed += ok
+                        self.failed += not ok
+
+    def _run(self, job: Dict) -> Optional[bool]:
+        """True if the job completed, False if it failed, None if another node took it over."""
+        job_id, options = job["id"], job["options"]
+        lost = threading.Event()
+        done = threading.Event()
+
+        def keep_lease():
+            while not done.wait(self.lease_seconds / 3):
+                if not self.queue.heartbeat(job_id, self.node_id, self.lease_seconds):
+                    lost.set()
+                    return
+
+        keeper = threading.Thread(target=keep_lease, name=f"lease-{job_id[:8]}", daemon=True)
+        keeper.start()
+        try:
+            # a private job gets its own folder, so two candidates rendering the same template
+            # never write the same path; the requester reads the files and removes the folder
+            subdir = os.path.join("jobs", job_id) if options.get("private") else None
+            output_dir = os.path.join(self.output_dir, subdir) if subdir else self.output_dir
+            with tempfile.TemporaryDirectory() as scratch:
+                published = set()
+
+                def on_progress(event):
+                    # finished forms are published right away so a streaming client can fetch them
+                    if event["status"] == "finished":
+                        publish_file(scratch, event["filename"], output_dir)
+                        published.add(event["filename"])
+                    self.queue.add_event(job_id, event)
+
+                result = self.pool.submit(job["data"], scratch, options.get("trace_id"),
+                                          profile_dir=options.get("profile_dir"),
+                                          deadline=options.get("deadline"),
+                                          on_progress=on_progress if options.get("progress") else None,
+                                          templates=options.get("templates")).result()
+                if lost.is_set():
+                    log.warning("⚠️  Lost the lease on job %s; another node has it", job_id)
+                    return None
+                if result["ok"] == 0:
+                    # The render itself failed; another node would fail the same way
+                    self.queue.fail(job_id, self.node_id, result["error"] or "no forms were generated")
+                    return False
+                files = publish(scratch, output_dir, skip=published)
+            result = {k: v for k, v in result.items() if k != "error"}
+            if subdir:
+                result["dir"] = subdir
+            completed = self.queue.complete(job_id, self.node_id, {**result, "files": files, "node": self.node_id})
+            if subdir and not completed:
+                shutil.rmtree(output_dir, ignore_errors=True)  # cancelled or taken over: nobody will read it
+            return completed
+        except Exception as e:
+            # A broken node (pool gone, disk full) should not sink the job: let another node try
+            log.exception("❌ Job %s failed on %s: %s", job_id, self.node_id, e)
+            self.queue.fail(job_id, self.node_id, f"{type(e).__name__}: {e}", retry=True)
+            return False
+        finally:
+            done.set()
+
+
+def main():
+    from form_data import transform_form_data
+    from render_pool import RenderPool
+    from tracing import configure_logging
+
+    parser = argparse.ArgumentParser(description="Render-only farm node")
+    parser.add_argument("--db", default=os.environ.get("RENDER_FARM_DB", "../farm/jobs.db"))
+    parser.add_argument("--output", default=os.environ.get("OUTPUT_FOLDER", "../output"))
+    parser.add_argument("--templates", default="../templates")
+    parser.add_argument("--warmup", default="../test_data.json", help="candidate rendered once per worker on start")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--lease-seconds", type=float, default=float(os.environ.get("RENDER_FARM_LEASE_SECONDS", 30)))
+    parser.add_argument("--node-id")
+    # the same render limits as a backend's own pool, from the same variables (see server.py)
+    env = os.environ.get
+    parser.add_argument("--cache-mb", type=int, default=int(env("RENDER_CACHE_MB", 256)))
+    parser.add_argument("--template-timeout", type=float, default=float(env("RENDER_TEMPLATE_TIMEOUT", 60)),
+                        help="wall seconds per template, 0 = off")
+    parser.add_argument("--template-cpu-seconds", type=float, default=float(env("RENDER_TEMPLATE_CPU_SECONDS", 0)))
+    parser.add_argument("--memory-mb", type=int, default=int(env("RENDER_WORKER_MEMORY_MB", 0)),
+                        help="address-space cap per worker, 0 = off")
+    parser.add_argument("--stream-mb", type=float, default=float(env("RENDER_STREAM_MB", 4)))
+    parser.add_argument("--no-skeletons", action="store_true", default=env("SKELETON_ENGINE", "1") == "0")
+    parser.add_argument("--affinity", action="store_true", default=env("RENDER_AFFINITY", "0") != "0")
+    parser.add_argument("--affinity-replicas", type=int, default=int(env("RENDER_AFFINITY_REPLICAS", 1)))
+    parser.add_argument("--poll-seconds", type=float, default=float(env("TEMPLATE_POLL_SECONDS", 2.0)),
+                        help="template hot-reload interval, 0 = off")
+    parser.add_argument("--sample-hz", type=float, default=float(env("PROFILE_SAMPLE_HZ", 19)),
+                        help="always-on stack samples per second, 0 = off")
+    args = parser.parse_args()
+
+    configure_logging()
+    warmup = None
+    if args.warmup and os.path.exists(args.warmup):
+        with open(args.warmup) as f:
+            warmup = transform_form_data(json.load(f))
+    pool = RenderPool(os.path.abspath(args.templates), size=args.workers, warmup_data=warmup,
+                      poll_interval=args.poll_seconds, cache_bytes=args.cache_mb * 1024 * 1024,
+                      skeletons=not args.no_skeletons, template_seconds=args.template_timeout,
+                      template_cpu_seconds=args.template_cpu_seconds, memory_mb=args.memory_mb,
+                      affinity=args.affinity, affinity_replicas=args.affinity_replicas,
+                      stream_bytes=int(args.stream_mb * 1024 * 1024), sample_hz=args.sample_hz)
+    node = FarmNode(JobQueue(args.db), pool, os.path.abspath(args.output), node_id=args.node_id,
+                    lease_seconds=args.lease_seconds, share_stacks=args.sample_hz > 0).start()
+    # SIGTERM (docker stop, kill) shuts the workers down like Ctrl+C does
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        while True:
+            time.sleep(3600)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        node.stop()
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
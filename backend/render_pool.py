@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Render Worker Pool
+Long-lived worker processes that fill forms for the backend. Each worker
+warms up once on start (python-docx import, compiled regexes, parsed
+templates and one full render of the sample data) so requests never pay
+the cold-start cost. Workers watch the templates folder and pick up edits
+without a restart.
+
+Workers enforce per-template time limits themselves (see limits.py). As a
+backstop the pool kills and replaces a worker that is still busy past its
+job's deadline (plus a grace period) or that died mid-job; the job then
+resolves with the forms that were already written.
+
+Workers also run the always-on stack sampler (see sampler.py) and send
+its counts to the pool, which merges them for the admin endpoint.
+
+With template affinity (see affinity.py) each worker has its own queue and
+only warms the templates assigned to it; a request is split into one job
+per template, each routed to a worker that holds that template, and the
+results are merged.
+"""
+
+from __future__ import annotations
+import itertools, logging, multiprocessing, os, tempfile, threading, time, traceback
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from affinity import AffinityScheduler
+from limits import RenderLimits, limit_memory
+from populator import SmartFormPopulator
+from sampler import MAX_STACKS, merge
+
+log = logging.getLogger("render_pool")
+
+
+def _worker_main(worker_id: int, templates_dir: str, warmup_data: Optional[dict], poll_interval: float,
+                 cache_bytes: int, skeletons: bool, limits: Dict, tasks, results, warm_templates=None,
+                 stream_bytes: Optional[int] = None, sample_hz: float = 0):
+    limit_memory(limits.get("memory_mb", 0))
+    # Imported here so the import cost is part of the warm-up, not of a request
+    from memory_cache import MemoryBudgetLRU
+    from profiling import RenderProfiler
+    from sampler import StackSampler
+    from template_store import TemplateStore
+    from tracing import configure_logging, trace
+
+    configure_logging()
+    started = time.time()
+    cache = MemoryBudgetLRU(cache_bytes)
+    store = TemplateStore(templates_dir, cache=cache, skeletons=skeletons, stream_bytes=stream_bytes).load()
+    # warm_templates: only these (affinity), None: all of them
+    if warmup_data and warm_templates != []:
+        with tempfile.TemporaryDirectory() as scratch:
+            SmartFormPopulator.from_dict(warmup_data).populate_all_forms(templates_dir, scratch, store=store,
+                                                                         only=warm_templates)
+    results.put(("ready", worker_id, {"warmup_seconds": round(time.time() - started, 3), **store.stats()}))
+    store.watch(poll_interval, on_change=lambda s: results.put(("stats", worker_id, s.stats())))
+    # always-on stack sampling of the renders (not the warm-up); counts go to the pool every few seconds
+    sampler = StackSampler(sample_hz, on_flush=lambda counts, stats: results.put(("stacks", worker_id, counts, stats)))
+    sampler.start()
+
+    while True:
+        job = tasks.get()
+        if job is None:
+            break
+        if job[0] == "drop":
+            # the scheduler moved this template elsewhere; free its parsed copy and outputs
+            entry = store.get(job[1])
+            if entry is not None:
+                freed = cache.discard(lambda key: isinstance(key, tuple) and len(key) > 1 and key[1] == entry.sha256)
+                log.debug("🧹 Dropped %s (%d bytes)", job[1], freed)
+            results.put(("stats", worker_id, store.stats()))
+            continue
+        job_id, data, output_dir, options = job
+        only = options.get("templates")
+        try:
+            # tells the pool which forms to report if this worker is lost mid-job
+            selected = SmartFormPopulator.select_templates(store.names(), only, lambda n: store.get(n).form_type)
+        except ValueError:
+            selected = []
+        results.put(("started", worker_id, job_id, selected))
+        render_limits = RenderLimits(limits.get("template_seconds"), limits.get("template_cpu_seconds"),
+                                     options.get("deadline"))
+        pop = None
+        # A profiled render must really render, so it bypasses the output cache
+        profiler = RenderProfiler(options["profile_dir"]) if options.get("profile_dir") else None
+        progress = (lambda event, _job=job_id: results.put(("progress", worker_id, _job, event))) \
+            if options.get("progress") else None
+        # Spans are collected in the worker and shipped back with the result,
+        # so the server can log one line covering the whole request
+        with trace(options.get("trace_id")) as tr, sampler.track():
+            try:
+                pop = SmartFormPopulator.from_dict(data)
+                ok = pop.populate_all_forms(
+                    templates_dir, output_dir, store=store,
+                    output_cache=None if profiler is not None else cache, profiler=profiler, limits=render_limits,
+                    progress=progress, only=only)
+                payload = {"ok": ok, "error": None}
+            except Exception:
+                payload = {"ok": 0, "error": traceback.format_exc()}
+        payload.update(worker=worker_id, spans=tr.spans, failed=getattr(pop, "failures", {}))
+        if profiler is not None:
+            payload["profile"] = profiler.summary()
+        results.put(("done", worker_id, job_id, payload))
+        results.put(("stats", worker_id, store.stats()))
+
+
+class RenderPool:
+    def __init__(self, templates_dir: str, size: int = 2, warmup_data: Optional[dict] = None,
+                 poll_interval: float = 2.0, cache_bytes: int = 256 * 1024 * 1024, skeletons: bool = True,
+                 template_seconds: float = 0, template_cpu_seconds: float = 0, memory_mb: int = 0,
+                 kill_grace: float = 5.0, affinity: bool = False, affinity_replicas: int = 1,
+                 stream_bytes: Optional[int] = None, sample_hz: float = 0):
+        self.templates_dir = templates_dir
+        self.size = size
+        self.warmup_data = warmup_data
+        self.poll_interval = poll_interval
+        self.cache_bytes = cache_bytes
+        self.skeletons = skeletons
+        self.stream_bytes = stream_bytes
+        self.sample_hz = sample_hz
+        self.limits = {"template_seconds": template_seconds, "template_cpu_seconds": template_cpu_seconds,
+                       "memory_mb": memory_mb}
+        self.kill_grace = kill_grace
+        self.scheduler = AffinityScheduler(size, replicas=affinity_replicas) if affinity else None
+        self._ctx = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._started = False
+        self._stopping = False
+        self._workers = []
+        self._tasks = None
+        self._queues = []  # one per worker with affinity
+        self._results = None
+        self._pending: Dict[int, Future] = {}
+        self._jobs: Dict[int, Dict] = {}  # job_id -> output_dir and deadline, until it resolves
+        self._busy: Dict[int, int] = {}  # worker_id -> job_id it is rendering
+        self._job_ids = itertools.count(1)
+        self._warm: Dict[int, Dict] = {}  # worker_id -> warm-up and cache stats, under _lock
+        self._stacks: Dict[str, int] = {}  # sampled stacks from every worker, merged
+        self._sampler_stats: Dict[int, Dict] = {}
+        self.killed = 0
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._tasks = self._ctx.Queue()
+            self._results = self._ctx.Queue()
+            if self.scheduler is not None:
+                self._queues = [self._ctx.Queue() for _ in range(self.size)]
+                self.scheduler.place({f: os.path.getsize(os.path.join(self.templates_dir, f))
+                                      for f in os.listdir(self.templates_dir) if f.lower().endswith(".docx")})
+            for worker_id in range(self.size):
+                self._workers.append(self._spawn(worker_id))
+            threading.Thread(target=self._collect, name="render-pool-collector", daemon=True).start()
+            threading.Thread(target=self._watchdog, name="render-pool-watchdog", daemon=True).start()
+            self._started = True
+
+    def _spawn(self, worker_id: int):
+        if self.scheduler is not None:
+            tasks, warm = self._queues[worker_id], self.scheduler.templates_of(worker_id)
+        else:
+            tasks, warm = self._tasks, None
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.templates_dir, self.warmup_data, self.poll_interval,
+                  self.cache_bytes, self.skeletons, self.limits, tasks, self._results, warm,
+                  self.stream_bytes, self.sample_hz),
+            name=f"render-worker-{worker_id}",
+            daemon=True,
+        )
+        proc.start()
+        return proc
+
+    def _collect(self):
+        while True:
+            msg = self._results.get()
+            if msg[0] == "ready":
+                _, worker_id, stats = msg
+                with self._lock:
+                    self._warm[worker_id] = stats
+            elif msg[0] == "stats":
+                _, worker_id, stats = msg
+                with self._lock:
+                    self._warm[worker_id] = {**self._warm.get(worker_id, {}), **stats}
+            elif msg[0] == "stacks":
+                _, worker_id, counts, stats = msg
+                with self._lock:
+                    merge(self._stacks, counts, MAX_STACKS)  # bounded like each worker's own counts
+                    self._sampler_stats[worker_id] = stats
+            elif msg[0] == "started":
+                _, worker_id, job_id, selected = msg
+                with self._lock:
+                    if job_id in self._pending:
+                        self._busy[worker_id] = job_id
+                        self._jobs[job_id]["templates"] = selected
+                        self._jobs[job_id]["started"] = time.time()
+            elif msg[0] == "progress":
+                _, worker_id, job_id, event = msg
+                callback = self._jobs.get(job_id, {}).get("on_progress")
+                if callback is not None:
+                    try:
+                        callback(event)
+                    except Exception as e:
+                        log.warning("⚠️  Progress callback failed: %s", e)
+            elif msg[0] == "done":
+                _, worker_id, job_id, payload = msg
+                self._resolve(job_id, payload, worker_id)
+
+    def _resolve(self, job_id: int, payload: Dict, worker_id: int):
+        with self._lock:
+            if self._busy.get(worker_id) == job_id:
+                del self._busy[worker_id]
+            fut = self._pending.pop(job_id, None)
+            job = self._jobs.pop(job_id, None)
+        if self.scheduler is not None and job is not None:
+            self.scheduler.done(job["worker"], job["template"], time.time() - job.get("started", time.time()))
+        if fut is not None:
+            fut.set_result(payload)
+
+    def _watchdog(self, interval: float = 0.5):
+        """Replace workers that died or overran their job's deadline; resolve their jobs."""
+        while not self._stopping:
+            time.sleep(interval)
+            if self._stopping:
+                return
+            if self.scheduler is not None:
+                for worker_id, name in self.scheduler.release():
+                    self._queues[worker_id].put(("drop", name))
+            now = time.time()
+            for worker_id, proc in enumerate(list(self._workers)):
+                with self._lock:
+                    job_id = self._busy.get(worker_id)
+                    job = self._jobs.get(job_id) if job_id is not None else None
+                overdue = job is not None and job["deadline"] is not None and now > job["deadline"] + self.kill_grace
+                if proc.is_alive() and not overdue:
+                    continue
+                reason = "render worker exceeded the request deadline" if overdue else \
+                    f"render worker died (exit code {proc.exitcode})"
+                if proc.is_alive():
+                    proc.kill()
+                    proc.join(timeout=5)
+                    self.killed += 1
+                with self._lock:
+                    self._warm.pop(worker_id, None)
+                if self.scheduler is not None:
+                    self._requeue(worker_id, job_id)
+                self._workers[worker_id] = self._spawn(worker_id)
+                if job is not None:
+                    self._resolve(job_id, self._partial(job, reason, worker_id), worker_id)
+
+    def _requeue(self, worker_id: int, lost_job: Optional[int]):
+        """Give a lost worker's replacement a fresh queue holding the jobs still routed to it.
+        A process killed while waiting in Queue.get() leaves that queue's lock held forever."""
+        with self._lock:
+            self._queues[worker_id] = self._ctx.Queue()
+            for job_id, job in sorted(self._jobs.items()):
+                if job["worker"] == worker_id and job_id != lost_job:
+                    self._queues[worker_id].put(job["task"])
+
+    def _partial(self, job: Dict, reason: str, worker_id: int) -> Dict:
+        """Result for a job whose worker was lost: whatever forms it had finished."""
+        written = {f for f in os.listdir(job["output_dir"]) if f.endswith(".docx")} \
+            if os.path.isdir(job["output_dir"]) else set()
+        templates = job.get("templates")
+        if templates is None:
+            templates = [f for f in os.listdir(self.templates_dir) if f.lower().endswith(".docx")]
+        return {"ok": len(written), "error": None if written else reason, "worker": worker_id, "spans": [],
+                "failed": {t: reason for t in templates if f"smart_{t}" not in written}}
+
+    def submit(self, data: dict, output_dir: str, trace_id: Optional[str] = None,
+               profile_dir: Optional[str] = None, deadline: Optional[float] = None,
+               on_progress: Optional[Callable[[Dict], None]] = None,
+               templates: Optional[List[str]] = None) -> Future:
+        """Queue one candidate; the future resolves to {'ok', 'error', 'worker', 'spans', 'failed'}
+        plus 'profile' when `profile_dir` asks for a profiled render. `deadline` is a
+        time.time() by which the render should be finished; templates still
+        pending then are reported in 'failed'. `on_progress` is called (on the
+        pool's collector thread) with each per-template event as it happens.
+        `templates` renders only those template ids / form types."""
+        self.start()
+        options = {"trace_id": trace_id, "profile_dir": profile_dir, "deadline": deadline,
+                   "progress": on_progress is not None}
+        names = self._split(templates) if self.scheduler is not None and not profile_dir else None
+        if names is None:
+            # one job renders every selected template (a profile must cover the whole request)
+            return self._enqueue(data, output_dir, {**options, "templates": templates}, on_progress)
+        if not names:
+            fut = Future()
+            fut.set_result({"ok": 0, "error": None, "worker": None, "spans": [], "failed": {}})
+            return fut
+        parts = [self._enqueue(data, output_dir, {**options, "templates": [name]}, on_progress, template=name)
+                 for name in names]
+        return self._merge(parts)
+
+    def _split(self, templates: Optional[List[str]]) -> Optional[List[str]]:
+        """Template file names for per-template jobs, or None when only a worker can tell
+        (form types asked for before any worker has reported them)."""
+        form_types = {}
+        with self._lock:
+            warm = list(self._warm.values())
+        for stats in warm:
+            form_types.update(stats.get("form_types") or {})
+        wanted = {SmartFormPopulator.template_id(t) for t in templates or ()}
+        if not form_types and wanted & set(SmartFormPopulator.FORM_TYPES):
+            return None
+        names = sorted(form_types) or sorted(f for f in os.listdir(self.templates_dir) if f.lower().endswith(".docx"))
+        return SmartFormPopulator.select_templates(names, templates, form_types.get)
+
+    def _enqueue(self, data: dict, output_dir: str, options: Dict, on_progress, template: Optional[str] = None) -> Future:
+        job_id = next(self._job_ids)
+        fut = Future()
+        worker = self.scheduler.route(template) if self.scheduler is not None else None
+        with self._lock:
+            self._pending[job_id] = fut
+            self._jobs[job_id] = {"output_dir": output_dir, "deadline": options["deadline"], "on_progress": on_progress,
+                                  "worker": worker, "template": template}
+            if template is not None:
+                self._jobs[job_id]["templates"] = [template]
+            if worker is not None:
+                self._jobs[job_id]["task"] = (job_id, data, output_dir, options)  # in case it must be requeued
+            # under the lock, so _requeue cannot swap the queue in between
+            (self._queues[worker] if worker is not None else self._tasks).put((job_id, data, output_dir, options))
+        return fut
+
+    @staticmethod
+    def _merge(parts: List[Future]) -> Future:
+        """One result for a request that was split into per-template jobs."""
+        merged = Future()
+        remaining = [len(parts)]
+        lock = threading.Lock()
+
+        def on_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            results = [p.result() for p in parts]
+            ok = sum(r["ok"] for r in results)
+            errors = [r["error"] for r in results if r["error"]]
+            merged.set_result({
+                "ok": ok,
+                "error": None if ok else ("\n".join(errors) or None),
+                "worker": sorted({r["worker"] for r in results if r.get("worker") is not None}),
+                "spans": [span for r in results for span in r.get("spans") or []],
+                "failed": {name: reason for r in results for name, reason in (r.get("failed") or {}).items()},
+            })
+
+        for part in parts:
+            part.add_done_callback(on_done)
+        return merged
+
+    def stacks(self, reset: bool = False) -> Dict[str, int]:
+        """Sampled stacks ({collapsed stack: samples}) from all workers since the start
+        or the last reset; workers report every few seconds."""
+        with self._lock:
+            counts = dict(self._stacks)
+            if reset:
+                self._stacks.clear()
+        return counts
+
+    def is_ready(self) -> bool:
+        with self._lock:
+            return self._started and len(self._warm) == self.size
+
+    def status(self) -> Dict:
+        with self._lock:
+            warm = dict(self._warm)
+        return {
+            "ready": self.is_ready(),
+            "workers": self.size,
+            "warm_workers": len(warm),
+            "alive_workers": sum(1 for p in self._workers if p.is_alive()),
+            "busy_workers": len(self._busy),
+            "killed_workers": self.killed,
+            "cache": {str(k): v for k, v in sorted(warm.items())},
+            "affinity": self.scheduler.status() if self.scheduler is not None else None,
+            "sampler": {str(k): v for k, v in sorted(self._sampler_stats.items())} if self.sample_hz else None,
+        }
+
+    def shutdown(self):
+        if not self._started:
+            return
+        self._stopping = True
+        for worker_id in range(len(self._workers)):
+            (self._queues[worker_id] if self.scheduler is not None else self._tasks).put(None)
+        for proc in self._workers:
+            proc.join(timeout=5)
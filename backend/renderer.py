@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Form Renderer
+Library API for filling the templates: one long-lived FormRenderer holds the
+templates and everything derived from them (bytes, extracted structure,
+compiled skeletons, parsed masters), and render() fills them for any
+candidate:
+
+    renderer = FormRenderer.from_dir("templates")
+    forms = renderer.render(candidate_dict, templates=["nda", "GratuityFormpdf 1"])
+    # {"NDA form 1.docx": b"PK...", "LOA form 1.docx": b"PK...", ...}
+
+render() is reentrant and safe to call from many threads at once. Each call
+builds its own SmartFormPopulator around the candidate, so nothing about one
+candidate is kept on the shared object, and the shared template state is only
+read. It reads no files: templates are loaded up front.
+"""
+
+from __future__ import annotations
+from typing import Dict, List, Mapping, Optional
+
+from memory_cache import MemoryBudgetLRU
+from populator import SmartFormPopulator
+from template_store import TemplateStore
+
+
+class FormRenderer:
+    def __init__(self, store: TemplateStore):
+        self.store = store
+
+    @classmethod
+    def from_dir(cls, templates_dir: str, cache_bytes: int = 64 * 1024 * 1024, skeletons: bool = True,
+                 watch: float = 0, stream_bytes: Optional[int] = None) -> "FormRenderer":
+        """Load every template in templates_dir; `watch` > 0 also picks up edits every that many seconds.
+        General forms whose document.xml reaches `stream_bytes` are filled by streaming."""
+        store = TemplateStore(templates_dir, cache=MemoryBudgetLRU(cache_bytes) if cache_bytes else None,
+                              skeletons=skeletons, stream_bytes=stream_bytes).load()
+        store.watch(watch)
+        return cls(store)
+
+    @classmethod
+    def from_bytes(cls, blobs: Mapping[str, bytes], cache_bytes: int = 64 * 1024 * 1024,
+                   skeletons: bool = True, stream_bytes: Optional[int] = None) -> "FormRenderer":
+        """Templates given as {file name: DOCX bytes}."""
+        return cls(TemplateStore.from_blobs(blobs, cache=MemoryBudgetLRU(cache_bytes) if cache_bytes else None,
+                                            skeletons=skeletons, stream_bytes=stream_bytes))
+
+    def names(self) -> List[str]:
+        return self.store.names()
+
+    def form_types(self) -> Dict[str, str]:
+        snap = self.store.snapshot()
+        return {name: snap.get(name).form_type for name in snap.names()}
+
+    def render(self, candidate: dict, templates: Optional[List[str]] = None) -> Dict[str, bytes]:
+        """Filled DOCX bytes per template file name. `candidate` is the populator's
+        data (either the form fields or {'form_fields': ...}); `templates` picks
+        template ids or form types as in SmartFormPopulator.select_templates.
+        Raises ValueError for an unknown selector; a template that fails to
+        fill raises its error."""
+        # one version for the whole call, even if the folder is reloaded meanwhile
+        snap = self.store.snapshot()
+        names = SmartFormPopulator.select_templates(snap.names(), templates, lambda n: snap.get(n).form_type)
+        populator = SmartFormPopulator.from_dict(candidate)
+        forms = {}
+        for name in names:
+            template = snap.get(name)
+            forms[name] = populator.render_bytes(template.path or name, template=template)
+        return forms
+
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Reproducible Output
+Byte-for-byte reproducible DOCX files. A plain python-docx save stamps every
+zip entry with the current time, and the skeleton and streaming engines each
+wrote the parts in their own order, so the same form rendered twice (or by a
+different engine) gave different bytes. Every engine now writes packages
+through zip_info() and part_order(): one fixed timestamp, fixed file
+attributes, default compression, and the parts in a fixed order
+([Content_Types].xml, the package relationships, the other parts by name,
+and word/document.xml last so the skeleton engine can still append it to a
+prebuilt zip). Part contents are left as they are; core properties come
+from the template's docProps/core.xml, which python-docx copies through
+unchanged, so they are stable too.
+
+The timestamp is SOURCE_DATE_EPOCH when set (the reproducible-builds
+convention), else 1980-01-01, the earliest a zip can record. Identical
+inputs then give identical files, and digest() of one serves as its cache
+key and ETag.
+"""
+
+from __future__ import annotations
+import hashlib, os, time, zipfile
+from typing import Dict, Tuple
+
+from docx.opc.pkgwriter import PackageWriter
+
+FIXED_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+DOCUMENT_PART = "word/document.xml"
+_FIRST_PARTS = ("[Content_Types].xml", "_rels/.rels")
+
+
+def date_time() -> Tuple[int, int, int, int, int, int]:
+    epoch = os.environ.get("SOURCE_DATE_EPOCH")
+    if not epoch:
+        return FIXED_DATE_TIME
+    return max(FIXED_DATE_TIME, tuple(time.gmtime(int(epoch))[:6]))
+
+
+def part_order(name: str) -> tuple:
+    """Sort key for the parts of a package."""
+    if name in _FIRST_PARTS:
+        return (0, _FIRST_PARTS.index(name), "")
+    return (2 if name == DOCUMENT_PART else 1, 0, name)
+
+
+def zip_info(name: str, stamp: tuple) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name, stamp)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.create_system = 3
+    info.external_attr = 0o600 << 16  # what ZipFile.writestr(name, ...) gives
+    return info
+
+
+def write_package(parts: Dict[str, bytes], dst):
+    """Zip {member name: bytes} reproducibly to dst (path or writable file)."""
+    stamp = date_time()
+    with zipfile.ZipFile(dst, "w", zipfile.ZIP_DEFLATED) as z:
+        for name in sorted(parts, key=part_order):
+            z.writestr(zip_info(name, stamp), parts[name])
+
+
+class _PartCollector:
+    """Stands in for python-docx's zip writer and keeps each part's bytes."""
+
+    def __init__(self):
+        self.parts: Dict[str, bytes] = {}
+
+    def write(self, pack_uri, blob: bytes):
+        self.parts[pack_uri.membername] = blob
+
+
+def document_parts(doc) -> Dict[str, bytes]:
+    """{member name: bytes} of a python-docx Document, as doc.save() would write them."""
+    package = doc.part.package
+    parts = package.parts
+    for part in parts:
+        part.before_marshal()
+    collector = _PartCollector()
+    PackageWriter._write_content_types_stream(collector, parts)
+    PackageWriter._write_pkg_rels(collector, package.rels)
+    PackageWriter._write_parts(collector, parts)
+    return collector.parts
+
+
+def save_document(doc, dst):
+    """doc.save(dst), reproducibly."""
+    write_package(document_parts(doc), dst)
+
+
+def digest(blob: bytes) -> str:
+    return hashlib.sha256(blob).hexdigest()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Stack Sampler
+A statistical profiler cheap enough to leave on in production. A daemon
+thread wakes `hz` times a second, reads the current frame of every thread
+that is doing tracked work (a render in a worker, a request in the server)
+and counts its call stack. Idle threads are never walked, so a quiet worker
+costs only the wake-ups. Nothing is instrumented and the code being measured
+runs unchanged, so unlike RenderProfiler (profiling.py) the timings are the
+real ones and no request has to be picked in advance.
+
+Counts are kept per distinct stack and read out in the collapsed format
+("frame;frame;frame count" per line, root first) that flamegraph.pl,
+speedscope and inferno take as is. Workers send theirs to the pool every
+few seconds (see render_pool.py); the server merges them with its own.
+"""
+
+from __future__ import annotations
+import os, sys, threading, time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple
+
+MAX_STACKS = 20000  # distinct stacks kept before the rest are counted as TRUNCATED
+TRUNCATED = ("[other stacks]",)  # where samples go once max_stacks distinct stacks are held
+
+
+def _label(frame) -> str:
+    # "populator:_norm", "docx.table:cells"; collapsed lines are split on ";" and the last space
+    module = frame.f_globals.get("__name__")
+    if not module or module == "__main__":
+        module = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+    return f"{module}:{frame.f_code.co_name}".replace(";", ":").replace(" ", "_")
+
+
+def collapsed(counts: Dict[str, int]) -> str:
+    """Collapsed-stack text for {stack: samples}, most sampled first."""
+    return "".join(f"{stack} {n}\n" for stack, n in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])))
+
+
+def merge(into: Dict[str, int], counts: Dict[str, int], max_stacks: Optional[int] = None):
+    """Add counts to into; with max_stacks, new stacks beyond that many go to TRUNCATED."""
+    for stack, n in counts.items():
+        if max_stacks is not None and stack not in into and len(into) >= max_stacks:
+            stack = ";".join(TRUNCATED)
+        into[stack] = into.get(stack, 0) + n
+
+
+class StackSampler:
+    def __init__(self, hz: float, max_depth: int = 64, max_stacks: int = MAX_STACKS,
+                 on_flush: Optional[Callable[[Dict[str, int], Dict], None]] = None, flush_seconds: float = 5.0):
+        self.hz = hz
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+        self.on_flush = on_flush  # gets (new counts since the last flush, stats())
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._active: Dict[int, int] = {}  # thread id -> nesting depth of track()
+        self._counts: Dict[Tuple[str, ...], int] = {}
+        self._unflushed: Dict[Tuple[str, ...], int] = {}  # only kept when there is an on_flush to drain it
+        self._labels: Dict[object, str] = {}  # code object -> label
+        self._thread: Optional[threading.Thread] = None
+        self.samples = 0
+        self.ticks = 0
+        self.sampling_seconds = 0.0  # time spent inside ticks, i.e. the overhead
+        self.started = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.hz > 0
+
+    def start(self) -> "StackSampler":
+        with self._lock:
+            if self.enabled and self._thread is None:
+                self.started = time.monotonic()
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+        return self
+
+    # ----- what to sample -----
+    def enter(self):
+        """Sample the calling thread until the matching leave()."""
+        ident = threading.get_ident()
+        with self._lock:
+            self._active[ident] = self._active.get(ident, 0) + 1
+
+    def leave(self):
+        ident = threading.get_ident()
+        with self._lock:
+            depth = self._active.get(ident, 0) - 1
+            if depth > 0:
+                self._active[ident] = depth
+            else:
+                self._active.pop(ident, None)
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        self.enter()
+        try:
+            yield
+        finally:
+            self.leave()
+
+    # ----- sampling -----
+    def _stack(self, frame) -> Tuple[str, ...]:
+        labels = self._labels
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = _label(frame)
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def tick(self):
+        """Take one sample of every tracked thread."""
+        started = time.perf_counter()
+        with self._lock:
+            active: Set[int] = set(self._active)
+        if active:
+            frames = sys._current_frames()
+            stacks = [self._stack(frames[ident]) for ident in active if ident in frames]
+            with self._lock:
+                for stack in stacks:
+                    if stack not in self._counts and len(self._counts) >= self.max_stacks:
+                        stack = TRUNCATED
+                    self._counts[stack] = self._counts.get(stack, 0) + 1
+                    if self.on_flush is not None:
+                        self._unflushed[stack] = self._unflushed.get(stack, 0) + 1
+                self.samples += len(stacks)
+        self.ticks += 1
+        self.sampling_seconds += time.perf_counter() - started
+
+    def _run(self):
+        interval = 1.0 / self.hz
+        next_tick = next_flush = time.monotonic()
+        while True:
+            next_tick += interval
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()  # fell behind: skip the missed ticks rather than burst
+            self.tick()
+            if self.on_flush is not None and time.monotonic() >= next_flush:
+                next_flush = time.monotonic() + self.flush_seconds
+                self.flush()
+
+    def flush(self):
+        """Hand the counts gathered since the last flush to on_flush."""
+        with self._lock:
+            fresh, self._unflushed = self._unflushed, {}
+        if fresh and self.on_flush is not None:
+            self.on_flush({";".join(stack): n for stack, n in fresh.items()}, self.stats())
+
+    # ----- reading -----
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {";".join(stack): n for stack, n in self._counts.items()}
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+    def stats(self) -> Dict:
+        uptime = time.monotonic() - self.started if self.started is not None else 0.0
+        with self._lock:
+            stacks, tracked = len(self._counts), len(self._active)
+        return {
+            "hz": self.hz,
+            "samples": self.samples,
+            "stacks": stacks,
+            "tracked_threads": tracked,
+            "overhead_percent": round(100 * self.sampling_seconds / uptime, 3) if uptime else 0.0,
+        }
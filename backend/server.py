@@ -2,196 +2,499 @@
 """
 Backend server for Form Automation Frontend
 Handles form processing and file downloads
+
+With RENDER_FARM_DB set, renders go through a job queue shared with other
+backend nodes (see render_farm.py) and results land in a shared OUTPUT_FOLDER.
 """
 
 import os
+import hashlib
+import hmac
+import io
 import json
-import subprocess
+import logging
+import queue
 import tempfile
+import threading
 import shutil
-from flask import Flask, request, jsonify, send_file
+import time
+import re
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, copy_current_request_context, request, jsonify, send_file
 from flask_cors import CORS
+from urllib.parse import quote
 from werkzeug.utils import secure_filename
 
+from admission import LANES, AdmissionController, Overloaded
+from candidate import today_str
+from form_data import transform_form_data
+from populator import SmartFormPopulator
+from render_farm import FarmNode, JobFailed, JobQueue
+from memory_cache import MemoryBudgetLRU
+from render_pool import RenderPool
+from reproducible import digest
+from sampler import StackSampler, collapsed, merge
+from tracing import configure_logging, new_trace_id, span, trace
+
 app = Flask(__name__)
 CORS(app)
 
+configure_logging()
+log = logging.getLogger('server')
+
 # Configuration
 UPLOAD_FOLDER = 'uploads'
-OUTPUT_FOLDER = '../output'  # Output files are in the parent directory
+OUTPUT_FOLDER = os.environ.get('OUTPUT_FOLDER', '../output')  # shared storage when running a farm
 TEMPLATES_FOLDER = '../templates'  # Templates are in the parent directory
+WARMUP_DATA_FILE = '../test_data.json'  # Rendered once per worker during warm-up
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+TEMPLATE_POLL_SECONDS = float(os.environ.get('TEMPLATE_POLL_SECONDS', 2.0))  # 0 disables hot reload
+RENDER_CACHE_MB = int(os.environ.get('RENDER_CACHE_MB', 256))  # per worker: parsed templates + rendered outputs
+SKELETON_ENGINE = os.environ.get('SKELETON_ENGINE', '1') != '0'  # precompiled fast path for the simple forms
+RENDER_STREAM_MB = float(os.environ.get('RENDER_STREAM_MB', 4))  # general forms this big are streamed, 0 = never
+RENDER_CONCURRENCY = int(os.environ.get('RENDER_CONCURRENCY', RENDER_WORKERS))  # renders in flight
+RENDER_QUEUE_DEPTH = int(os.environ.get('RENDER_QUEUE_DEPTH', 4 * RENDER_WORKERS))  # waiting per lane before 429
+RENDER_LANE_WEIGHTS = os.environ.get('RENDER_LANE_WEIGHTS', 'interactive=8,batch=2,background=1')  # fair shares
+RENDER_INTERACTIVE_RESERVED = int(os.environ.get('RENDER_INTERACTIVE_RESERVED', 1))  # slots batch work never takes
+RENDER_TEMPLATE_TIMEOUT = float(os.environ.get('RENDER_TEMPLATE_TIMEOUT', 60))  # wall seconds per template, 0 = off
+RENDER_TEMPLATE_CPU_SECONDS = float(os.environ.get('RENDER_TEMPLATE_CPU_SECONDS', 0))  # CPU seconds per template
+RENDER_REQUEST_TIMEOUT = float(os.environ.get('RENDER_REQUEST_TIMEOUT', 120))  # whole request, queue wait included
+RENDER_WORKER_MEMORY_MB = int(os.environ.get('RENDER_WORKER_MEMORY_MB', 0))  # address-space cap per worker, 0 = off
+RENDER_AFFINITY = os.environ.get('RENDER_AFFINITY', '0') != '0'  # each template warm on a few workers, not all
+RENDER_AFFINITY_REPLICAS = int(os.environ.get('RENDER_AFFINITY_REPLICAS', 1))  # workers per template before rebalancing
+PROFILE_FOLDER = os.environ.get('PROFILE_FOLDER', '../profiles')  # per-request cProfile stats
+PROFILE_ADMIN_TOKEN = os.environ.get('PROFILE_ADMIN_TOKEN', '')  # enables ?profile=1 and /api/admin with X-Admin-Token
+PROFILE_RENDERS = os.environ.get('PROFILE_RENDERS', '').lower() in ('1', 'true', 'yes')  # profile every request
+PROFILE_SAMPLE_HZ = float(os.environ.get('PROFILE_SAMPLE_HZ', 19))  # always-on stack samples per second, 0 = off
+RENDER_FARM_DB = os.environ.get('RENDER_FARM_DB', '')  # shared SQLite job queue; unset renders locally
+RENDER_FARM_NODE = os.environ.get('RENDER_FARM_NODE', '1') != '0'  # 0: only enqueue, never render here
+RENDER_FARM_LEASE_SECONDS = float(os.environ.get('RENDER_FARM_LEASE_SECONDS', 30))  # job given up if not renewed
+RENDER_FARM_MAX_ATTEMPTS = int(os.environ.get('RENDER_FARM_MAX_ATTEMPTS', 3))  # claims before a job is failed
+RENDER_FARM_TIMEOUT = float(os.environ.get('RENDER_FARM_TIMEOUT', 300))  # seconds a request waits for its job
+RENDER_LAZY = os.environ.get('RENDER_LAZY', '').lower() in ('1', 'true', 'yes')  # render each form on first download
+HOT_OUTPUT_CACHE_MB = int(os.environ.get('HOT_OUTPUT_CACHE_MB', 64))  # recently downloaded forms kept in memory
+RENDER_LAZY_PRERENDER = os.environ.get('RENDER_LAZY_PRERENDER', '').lower() in ('1', 'true', 'yes')  # background lane
+CANDIDATE_FOLDER = os.path.join(OUTPUT_FOLDER, 'candidates')  # candidate data waiting for lazy downloads
+PORT = int(os.environ.get('PORT', 5000))
+DEBUG = True
 
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+os.makedirs(CANDIDATE_FOLDER, exist_ok=True)
+
+
+def load_warmup_data():
+    """Sample candidate used to exercise every template once per worker"""
+    if not os.path.exists(WARMUP_DATA_FILE):
+        return None
+    with open(WARMUP_DATA_FILE, 'r') as f:
+        return transform_form_data(json.load(f))
+
+
+render_pool = RenderPool(os.path.abspath(TEMPLATES_FOLDER), size=RENDER_WORKERS, warmup_data=load_warmup_data(),
+                         poll_interval=TEMPLATE_POLL_SECONDS, cache_bytes=RENDER_CACHE_MB * 1024 * 1024,
+                         skeletons=SKELETON_ENGINE, template_seconds=RENDER_TEMPLATE_TIMEOUT,
+                         template_cpu_seconds=RENDER_TEMPLATE_CPU_SECONDS, memory_mb=RENDER_WORKER_MEMORY_MB,
+                         affinity=RENDER_AFFINITY, affinity_replicas=RENDER_AFFINITY_REPLICAS,
+                         stream_bytes=int(RENDER_STREAM_MB * 1024 * 1024), sample_hz=PROFILE_SAMPLE_HZ)
+admission = AdmissionController(RENDER_CONCURRENCY, RENDER_QUEUE_DEPTH,
+                                weights={k.strip(): float(v) for k, v in
+                                         (w.split('=') for w in RENDER_LANE_WEIGHTS.split(',') if w.strip())},
+                                reserved=RENDER_INTERACTIVE_RESERVED)
+farm_queue = JobQueue(RENDER_FARM_DB, max_attempts=RENDER_FARM_MAX_ATTEMPTS) if RENDER_FARM_DB else None
+farm_node = (FarmNode(farm_queue, render_pool, os.path.abspath(OUTPUT_FOLDER), lease_seconds=RENDER_FARM_LEASE_SECONDS)
+             if farm_queue is not None and RENDER_FARM_NODE else None)
+hot_outputs = MemoryBudgetLRU(HOT_OUTPUT_CACHE_MB * 1024 * 1024)  # lazily rendered forms, by candidate
+prerender_pool = ThreadPoolExecutor(max_workers=max(1, RENDER_CONCURRENCY), thread_name_prefix='prerender')
+stack_sampler = StackSampler(PROFILE_SAMPLE_HZ)  # this process's request threads; workers sample their own
+
+
+@app.before_request
+def sample_request():
+    stack_sampler.start()
+    stack_sampler.enter()
+
+@app.teardown_request
+def stop_sampling_request(_exc):
+    stack_sampler.leave()
+
+
+def overloaded_response(e):
+    """429 with a Retry-After based on measured render time"""
+    response = jsonify({
+        'success': False,
+        'error': f'Server is busy, please retry in {e.retry_after} seconds',
+        'retryAfter': e.retry_after
+    })
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+def is_admin():
+    """True when the request carries the configured X-Admin-Token."""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(PROFILE_ADMIN_TOKEN) and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN)
+
+def profiling_requested():
+    """True when this request should render under the profiler.
+    Raises PermissionError if profiling was asked for without a valid admin token."""
+    if PROFILE_RENDERS:
+        return True
+    if request.args.get('profile') not in ('1', 'true'):
+        return False
+    if not is_admin():
+        raise PermissionError('profiling requires a valid X-Admin-Token')
+    return True
+
+def requested_templates():
+    """Template ids / form types from ?templates=nda,gratuity (None renders every form).
+    Raises ValueError for a name that matches no template or form type."""
+    only = [t.strip() for arg in request.args.getlist('templates') for t in arg.split(',') if t.strip()]
+    if not only:
+        return None
+    names = [f for f in os.listdir(TEMPLATES_FOLDER) if f.lower().endswith('.docx')]
+    SmartFormPopulator.select_templates(names, only)
+    return only
+
+def request_lane():
+    """Admission lane from the X-Priority header or ?priority= (interactive by default).
+    Raises ValueError for an unknown lane."""
+    lane = (request.headers.get('X-Priority') or request.args.get('priority') or 'interactive').strip().lower()
+    if lane not in LANES:
+        raise ValueError(f"unknown priority {lane!r} (one of {', '.join(LANES)})")
+    return lane
+
+def render_on_farm(data, trace_id, profile_dir, deadline, on_progress=None, templates=None, private=False):
+    """Queue the job for whichever node is free; same shape as a RenderPool result plus 'files'.
+    A `private` job is published into its own folder under OUTPUT_FOLDER, named by 'dir'."""
+    if farm_node is not None:
+        farm_node.start()
+    job_id = farm_queue.enqueue(data, {'trace_id': trace_id, 'profile_dir': profile_dir, 'deadline': deadline,
+                                       'progress': on_progress is not None, 'templates': templates,
+                                       'private': private})
+    try:
+        return farm_queue.wait(job_id, RENDER_FARM_TIMEOUT, on_event=on_progress)
+    except JobFailed as e:
+        return {'ok': 0, 'error': str(e)}
+    except TimeoutError:
+        farm_queue.cancel(job_id, 'requester stopped waiting')  # or a node would still render it
+        raise
 
 @app.route('/api/process-forms', methods=['POST'])
 def process_forms():
     """Process the form data and generate filled documents"""
+    trace_id = request.headers.get('X-Trace-Id') or request.headers.get('X-Request-ID') or new_trace_id()
+    with trace(trace_id) as tr:
+        response = _process_forms(tr)
+        response = app.make_response(response)
+        response.headers['X-Trace-Id'] = tr.trace_id
+        log.info("process-forms %s", response.status_code, extra={
+            'status': response.status_code, 'total_ms': tr.elapsed_ms(), 'spans': tr.spans
+        })
+        return response
+
+def failed_forms(result):
+    return [{'template': name, 'error': reason} for name, reason in sorted((result.get('failed') or {}).items())]
+
+@app.route('/api/process-forms/stream', methods=['POST'])
+def process_forms_stream():
+    """Same as /api/process-forms, streamed as Server-Sent Events: a 'template'
+    event whenever a form starts, finishes (with its download URL) or fails,
+    then a 'done' event carrying the usual response body"""
+    trace_id = request.headers.get('X-Trace-Id') or request.headers.get('X-Request-ID') or new_trace_id()
+    events = queue.Queue()
+
+    @copy_current_request_context
+    def run():
+        with trace(trace_id) as tr:
+            response = app.make_response(_process_forms(tr, on_progress=lambda e: events.put(('template', e))))
+            log.info("process-forms %s", response.status_code, extra={
+                'status': response.status_code, 'total_ms': tr.elapsed_ms(), 'spans': tr.spans, 'stream': True
+            })
+            events.put(('done', response))
+
+    threading.Thread(target=run, name=f"process-forms-{trace_id}", daemon=True).start()
+    # Wait until rendering starts, so a busy server or a bad request still
+    # gets a plain JSON answer with the right status code
+    kind, payload = events.get()
+    if kind == 'done' and payload.status_code != 200:
+        payload.headers['X-Trace-Id'] = trace_id
+        return payload
+
+    def stream(kind, payload):
+        while kind == 'template':
+            yield f"event: template\ndata: {json.dumps(payload)}\n\n"
+            kind = None
+            while kind is None:
+                try:
+                    kind, payload = events.get(timeout=15)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"  # keeps proxies from closing an idle connection
+        yield f"event: done\ndata: {json.dumps({**payload.get_json(), 'status': payload.status_code})}\n\n"
+
+    return Response(stream(kind, payload), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache, no-transform', 'X-Accel-Buffering': 'no',
+                             'X-Trace-Id': trace_id})
+
+def _process_forms(tr, on_progress=None):
+    deadline = time.time() + RENDER_REQUEST_TIMEOUT if RENDER_REQUEST_TIMEOUT > 0 else None
+    try:
+        templates = requested_templates()
+        lane = request_lane()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'traceId': tr.trace_id}), 400
     try:
+        profile_dir = os.path.abspath(os.path.join(PROFILE_FOLDER, tr.trace_id)) if profiling_requested() else None
+        
         # Get form data from request
         form_data = request.json
+        if RENDER_LAZY or request.args.get('lazy') in ('1', 'true'):
+            return _defer_forms(tr, form_data, templates,
+                                prerender=RENDER_LAZY_PRERENDER or request.args.get('prerender') in ('1', 'true'))
         
         # Create temporary directory for this session
         with tempfile.TemporaryDirectory() as temp_dir:
             # Transform form data to match populator's expected structure
-            transformed_data = {
-            "source_file": "Frontend Input",
-            "form_fields": {
-                "personal_details": {
-                    "name": form_data.get('name', ''),
-                    "gender": form_data.get('gender', ''),
-                    "date_of_birth": {
-                        "value": form_data.get('date_of_birth', ''),
-                        "iso": form_data.get('date_of_birth', '')
-                    },
-                    "father_name": form_data.get('father_name', ''),
-                    "nationality": form_data.get('nationality', ''),
-                    "pan_card": form_data.get('pan_card', ''),
-                    "aadhar_card": form_data.get('aadhar_card', ''),
-                    "din": form_data.get('din', ''),
-                    "passport_no": form_data.get('passport_no', ''),
-                    "passport_issue_date": {
-                        "value": form_data.get('passport_issue_date', ''),
-                        "iso": form_data.get('passport_issue_date', '')
-                    },
-                    "passport_expiry_date": {
-                        "value": form_data.get('passport_expiry_date', ''),
-                        "iso": form_data.get('passport_expiry_date', '')
-                    },
-                    "email": form_data.get('email', ''),
-                    "religion": form_data.get('religion', '')
-                },
-                "employment_history": [
-                    {
-                        "employer_name_and_branch": form_data.get('current_employment', {}).get('employer_name_and_branch', ''),
-                        "employer_address": form_data.get('current_employment', {}).get('employer_address', ''),
-                        "position_and_department": form_data.get('current_employment', {}).get('position_and_department', ''),
-                        "landline": form_data.get('current_employment', {}).get('landline', ''),
-                        "employment_period": form_data.get('current_employment', {}).get('employment_period', {}),
-                        "employee_code": form_data.get('current_employment', {}).get('employee_code', ''),
-                        "last_salary": form_data.get('current_employment', {}).get('last_salary', ''),
-                        "reason_for_leaving": form_data.get('current_employment', {}).get('reason_for_leaving', ''),
-                        "reporting_manager": form_data.get('current_employment', {}).get('reporting_manager', ''),
-                        "agency_details": form_data.get('current_employment', {}).get('agency_details', ''),
-                        "contract_agency": form_data.get('current_employment', {}).get('contract_agency', ''),
-                        "can_verify": form_data.get('current_employment', {}).get('can_verify', True)
-                    }
-                ] + (form_data.get('employment_history', []) or []),
-                "education_history": {
-                    "highest_qualification": form_data.get('highest_qualification', {}),
-                    "previous_qualification": form_data.get('previous_qualification', {})
-                },
-                "address_history": {
-                    "current": {
-                        "town_or_city_name": form_data.get('current_address', {}).get('full_address', ''),
-                        "phone_number": form_data.get('phone', ''),
-                        "duration_of_stay": form_data.get('current_address', {}).get('duration_of_stay', {})
-                    },
-                    "previous": {
-                        "town_or_city_name": form_data.get('previous_address', {}).get('full_address', '') if isinstance(form_data.get('previous_address'), dict) else '',
-                        "phone_number": form_data.get('phone', ''),
-                        "duration_of_stay": {}
-                    },
-                    "permanent": {
-                        "town_or_city_name": form_data.get('permanent_address', {}).get('full_address', ''),
-                        "phone_number": form_data.get('phone', ''),
-                        "duration_of_stay": form_data.get('permanent_address', {}).get('duration_of_stay', {})
-                    }
-                },
-                # Add address list for multi-address tables
-                "address_list": [
-                    {
-                        "address_type": "current",
-                        "town_or_city_name": form_data.get('current_address', {}).get('full_address', ''),
-                        "phone_number": form_data.get('phone', ''),
-                        "duration_of_stay": form_data.get('current_address', {}).get('duration_of_stay', {})
-                    },
-                    {
-                        "address_type": "permanent", 
-                        "town_or_city_name": form_data.get('permanent_address', {}).get('full_address', ''),
-                        "phone_number": form_data.get('phone', ''),
-                        "duration_of_stay": form_data.get('permanent_address', {}).get('duration_of_stay', {})
-                    }
-                ] + ([
-                    {
-                        "address_type": "previous",
-                        "town_or_city_name": addr.get('full_address', ''),
-                        "phone_number": form_data.get('phone', ''),
-                        "duration_of_stay": addr.get('duration_of_stay', {})
-                    } for addr in form_data.get('previous_address', []) if isinstance(addr, dict)
-                ] if isinstance(form_data.get('previous_address'), list) else []),
-                "references": form_data.get('references', []),
-                "gaps": form_data.get('gaps', {}),
-                "epf_and_gratuity": form_data.get('epf_and_gratuity', {})
-            }
-            }
-            
-            # Write transformed form data to JSON file
-            json_file = os.path.join(temp_dir, 'extracted_data.json')
-            with open(json_file, 'w') as f:
-                json.dump(transformed_data, f, indent=2)
-                
-            # Copy templates to temp directory
-            templates_dir = os.path.join(temp_dir, 'templates')
-            shutil.copytree(TEMPLATES_FOLDER, templates_dir)
+            with span('transform'):
+                transformed_data = transform_form_data(form_data)
             
             # Create output directory
             output_dir = os.path.join(temp_dir, 'output')
             os.makedirs(output_dir, exist_ok=True)
             
-            # Run the populator script
-            populator_script = os.path.join(os.path.dirname(__file__), 'populator.py')
-            result = subprocess.run([
-                'python', populator_script, 
-                json_file, 
-                templates_dir, 
-                output_dir
-            ], capture_output=True, text=True, cwd=os.path.dirname(__file__))
+            # Streaming clients can download each form as soon as it is done
+            published = set()
+            def relay(event):
+                if event['status'] == 'finished':
+                    if farm_queue is None:
+                        shutil.copy2(os.path.join(output_dir, event['filename']),
+                                     os.path.join(OUTPUT_FOLDER, event['filename']))
+                        published.add(event['filename'])
+                    event = {**event, 'url': f"/api/download/{quote(event['filename'])}"}
+                on_progress(event)
+            
+            # Render on a warm worker (templates are already parsed there);
+            # admission bounds how many renders run or wait at once, per lane
+            with admission.admit(lane, deadline) as waited:
+                tr.add('queue_wait', waited * 1000, lane=lane)
+                with span('render'):
+                    progress = relay if on_progress is not None else None
+                    if farm_queue is not None:
+                        result = render_on_farm(transformed_data, tr.trace_id, profile_dir, deadline, progress,
+                                                templates)
+                    else:
+                        result = render_pool.submit(transformed_data, output_dir, tr.trace_id, profile_dir=profile_dir,
+                                                    deadline=deadline, on_progress=progress,
+                                                    templates=templates).result()
+            tr.extend(result.get('spans'))
             
-            if result.returncode != 0:
+            if result['ok'] == 0 and templates and not result.get('failed') and not result.get('error'):
                 return jsonify({
                     'success': False,
-                    'error': f'Form processing failed: {result.stderr}'
+                    'error': f"No template matches {', '.join(templates)}",
+                    'traceId': tr.trace_id
+                }), 404
+            if result['ok'] == 0:
+                log.error("❌ Render failed on worker %s", result.get('worker'), extra={'error': result['error']})
+                return jsonify({
+                    'success': False,
+                    'error': f"Form processing failed: {result['error'] or 'no forms were generated'}",
+                    'failedForms': failed_forms(result),
+                    'traceId': tr.trace_id
                 }), 500
             
             # Copy output files to permanent location and generate download links
             output_files = []
             download_links = []
             
-            for filename in os.listdir(output_dir):
-                if filename.endswith('.docx'):
-                    source_path = os.path.join(output_dir, filename)
-                    dest_path = os.path.join(OUTPUT_FOLDER, filename)
-                    shutil.copy2(source_path, dest_path)
-                    output_files.append(filename)
-                    
-                    # Add DOCX download link
-                    download_links.append({
-                        'filename': filename,
-                        'url': f'/api/download/{filename}',
-                        'type': 'docx'
-                    })
+            with span('publish'):
+                # Farm jobs are already published to the shared output folder
+                for filename in result.get('files') or os.listdir(output_dir):
+                    if filename.endswith('.docx'):
+                        if 'files' not in result and filename not in published:
+                            source_path = os.path.join(output_dir, filename)
+                            dest_path = os.path.join(OUTPUT_FOLDER, filename)
+                            shutil.copy2(source_path, dest_path)
+                        output_files.append(filename)
+                        
+                        # Add DOCX download link
+                        download_links.append({
+                            'filename': filename,
+                            'url': f'/api/download/{quote(filename)}',
+                            'type': 'docx'
+                        })
             
-            return jsonify({
+            # Forms that failed or ran out of time are reported; the rest are still returned
+            body = {
                 'success': True,
                 'message': f'Successfully processed {len(output_files)} forms',
-                'downloadLinks': download_links
-            })
+                'downloadLinks': download_links,
+                'failedForms': failed_forms(result),
+                'traceId': tr.trace_id
+            }
+            if 'profile' in result:
+                body['profile'] = result['profile']
+            return jsonify(body)
             
+    except Overloaded as e:
+        return overloaded_response(e)
+    except TimeoutError as e:
+        return jsonify({'success': False, 'error': str(e), 'traceId': tr.trace_id}), 504
+    except LookupError as e:
+        return jsonify({'success': False, 'error': str(e), 'traceId': tr.trace_id}), 503
+    except PermissionError as e:
+        return jsonify({'success': False, 'error': str(e), 'traceId': tr.trace_id}), 403
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"❌ Error in process_forms: {str(e)}")
-        print(f"❌ Full traceback: {error_details}")
+        log.exception("❌ Error in process_forms: %s", e)
         return jsonify({
             'success': False,
-            'error': f'Server error: {str(e)}'
+            'error': f'Server error: {str(e)}',
+            'traceId': tr.trace_id
         }), 500
 
+def template_form_types():
+    """Form type of each template, as reported by the warm local workers"""
+    types = {}
+    for stats in render_pool.status()['cache'].values():
+        types.update(stats.get('form_types') or {})
+    return types
+
+def _defer_forms(tr, form_data, templates, prerender=False):
+    """Lazy mode: store the candidate and return links at once; each form is
+    rendered the first time it is downloaded. With `prerender` the forms are
+    also rendered into the hot cache in the background lane meanwhile."""
+    with span('transform'):
+        data = transform_form_data(form_data)
+    names = [f for f in os.listdir(TEMPLATES_FOLDER) if f.lower().endswith('.docx')]
+    if templates:
+        form_types = template_form_types()
+        if not form_types and any(SmartFormPopulator.template_id(t) in SmartFormPopulator.FORM_TYPES
+                                  for t in templates):
+            raise LookupError('Templates are still loading, please retry shortly')
+        names = SmartFormPopulator.select_templates(names, templates, form_types.get)
+        if not names:
+            return jsonify({
+                'success': False,
+                'error': f"No template matches {', '.join(templates)}",
+                'traceId': tr.trace_id
+            }), 404
+
+    # The same candidate always gets the same id, so repeat submissions share cached forms
+    encoded = json.dumps(data, sort_keys=True)
+    candidate_id = hashlib.sha256(encoded.encode('utf-8')).hexdigest()[:32]
+    path = os.path.join(CANDIDATE_FOLDER, f'{candidate_id}.json')
+    if not os.path.exists(path):
+        with tempfile.NamedTemporaryFile('w', dir=CANDIDATE_FOLDER, suffix='.part', delete=False) as f:
+            f.write(encoded)
+        os.replace(f.name, path)
+
+    if prerender:
+        prerender_pool.submit(_prerender, candidate_id, data, names)
+
+    download_links = [{
+        'filename': f'smart_{name}',
+        'url': f'/api/download/{quote(f"smart_{name}")}?candidate={candidate_id}',
+        'type': 'docx'
+    } for name in names]
+    return jsonify({
+        'success': True,
+        'message': f'{len(download_links)} forms will be generated on download',
+        'downloadLinks': download_links,
+        'failedForms': [],
+        'candidateId': candidate_id,
+        'traceId': tr.trace_id
+    })
+
+def render_single(tr, data, name, lane='interactive'):
+    """DOCX bytes of one template for one candidate, rendered on a worker or the farm"""
+    filename = f'smart_{name}'
+    deadline = time.time() + RENDER_REQUEST_TIMEOUT if RENDER_REQUEST_TIMEOUT > 0 else None
+    with admission.admit(lane, deadline) as waited:
+        tr.add('queue_wait', waited * 1000, lane=lane)
+        with span('render', template=name), tempfile.TemporaryDirectory() as temp_dir:
+            if farm_queue is not None:
+                # smart_{name} in the shared folder belongs to whichever candidate rendered last
+                result = render_on_farm(data, tr.trace_id, None, deadline, templates=[name], private=True)
+                output_dir = os.path.join(os.path.abspath(OUTPUT_FOLDER), result['dir']) if result.get('dir') else None
+            else:
+                result = render_pool.submit(data, temp_dir, tr.trace_id, deadline=deadline,
+                                            templates=[name]).result()
+                output_dir = temp_dir
+            try:
+                tr.extend(result.get('spans'))
+                if result['ok'] == 0:
+                    reason = (result.get('failed') or {}).get(name) or result['error'] or 'no output was written'
+                    raise RuntimeError(f'{name} could not be generated: {reason}')
+                with open(os.path.join(output_dir, filename), 'rb') as f:
+                    return f.read()
+            finally:
+                if output_dir is not None and output_dir != temp_dir:
+                    shutil.rmtree(output_dir, ignore_errors=True)
+
+def _prerender(candidate_id, data, names):
+    """Render a lazy candidate's forms into the hot cache before anyone asks for them.
+    Runs in the background lane, so it only uses capacity the other lanes leave over."""
+    for name in names:
+        key = ('output', candidate_id, name, today_str())
+        if key in hot_outputs:
+            continue
+        with trace(new_trace_id()) as tr:
+            try:
+                hot_outputs.put(key, render_single(tr, data, name, lane='background'))
+            except Overloaded:
+                log.info("⏭️  Pre-render queue full; %s will render on download", candidate_id)
+                return
+            except Exception as e:
+                log.warning("⚠️  Pre-render of %s failed: %s", name, e, extra={'template': name})
+
+def _download_deferred(tr, filename, candidate_id):
+    """Serve one lazily rendered form, from the hot cache when it was rendered recently"""
+    path = os.path.join(CANDIDATE_FOLDER, f'{candidate_id}.json')
+    if not re.fullmatch(r'[0-9a-f]{32}', candidate_id) or not os.path.exists(path):
+        return jsonify({'error': 'Unknown or expired candidate', 'traceId': tr.trace_id}), 404
+    name = filename[len('smart_'):] if filename.startswith('smart_') else filename
+    if not os.path.exists(os.path.join(TEMPLATES_FOLDER, name)):
+        return jsonify({'error': f'File not found: {filename}', 'traceId': tr.trace_id}), 404
+
+    try:
+        lane = request_lane()
+    except ValueError as e:
+        return jsonify({'error': str(e), 'traceId': tr.trace_id}), 400
+
+    # outputs carry today's date, so the day is part of the key
+    key = ('output', candidate_id, name, today_str())
+    blob = hot_outputs.get(key)
+    tr.add('hot_cache', 0.0, hit=blob is not None)
+    if blob is None:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        blob = render_single(tr, data, name, lane)
+        hot_outputs.put(key, blob)
+    # renders are reproducible, so the content hash is a strong ETag
+    return send_file(io.BytesIO(blob), as_attachment=True, download_name=f'smart_{name}', etag=digest(blob),
+                     mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+
 @app.route('/api/download/<filename>')
 def download_file(filename):
     """Download a processed form file"""
+    candidate_id = request.args.get('candidate')
+    if candidate_id:
+        trace_id = request.headers.get('X-Trace-Id') or request.headers.get('X-Request-ID') or new_trace_id()
+        with trace(trace_id) as tr:
+            try:
+                response = app.make_response(_download_deferred(tr, filename, candidate_id))
+            except Overloaded as e:
+                response = app.make_response(overloaded_response(e))
+            except TimeoutError as e:
+                response = app.make_response((jsonify({'error': str(e), 'traceId': tr.trace_id}), 504))
+            except Exception as e:
+                log.exception("❌ Lazy render of %s failed: %s", filename, e)
+                response = app.make_response((jsonify({'error': str(e), 'traceId': tr.trace_id}), 500))
+            response.headers['X-Trace-Id'] = tr.trace_id
+            log.info("download %s", response.status_code, extra={
+                'status': response.status_code, 'total_ms': tr.elapsed_ms(), 'spans': tr.spans, 'lazy': True
+            })
+            return response
     try:
         # Try the filename as-is first, then with secure_filename
         file_path = os.path.join(OUTPUT_FOLDER, filename)
@@ -201,7 +504,9 @@ def download_file(filename):
             file_path = os.path.join(OUTPUT_FOLDER, secure_name)
         
         if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True)
+            with open(file_path, 'rb') as f:
+                etag = digest(f.read())
+            return send_file(file_path, as_attachment=True, etag=etag)
         else:
             # List available files for debugging
             available_files = [f for f in os.listdir(OUTPUT_FOLDER) if f.endswith('.docx')]
@@ -214,13 +519,74 @@ def download_file(filename):
 
 @app.route('/api/health')
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (liveness: the process is up)"""
     return jsonify({'status': 'healthy'})
 
+@app.route('/api/ready')
+def readiness_check():
+    """Readiness endpoint: 200 only once every render worker has warmed up"""
+    if farm_queue is not None and farm_node is None:
+        # Enqueue-only node: ready while some farm node is alive
+        farm = farm_queue.stats()
+        ready = any(n['alive'] for n in farm['nodes'])
+        return jsonify({'status': 'ready' if ready else 'warming', 'farm': farm}), (200 if ready else 503)
+    # A readiness probe before any request also kicks off the warm-up
+    if farm_node is not None:
+        farm_node.start()
+    render_pool.start()
+    status = render_pool.status()
+    return jsonify({'status': 'ready' if status['ready'] else 'warming', **status}), (200 if status['ready'] else 503)
+
+@app.route('/api/metrics')
+def metrics():
+    """Render queue and worker metrics"""
+    body = {
+        'admission': admission.stats(),
+        'workers': render_pool.status(),
+        'hot_outputs': hot_outputs.stats(),
+        'sampler': stack_sampler.stats()
+    }
+    if farm_queue is not None:
+        body['farm'] = {**farm_queue.stats(RENDER_FARM_LEASE_SECONDS),
+                        'node': farm_node.status() if farm_node is not None else None}
+    return jsonify(body)
+
+@app.route('/api/admin/profile/stacks')
+def profile_stacks():
+    """Always-on sampler output as collapsed stacks, for flame graphs (admin token required).
+    ?source=workers or server narrows it down; ?reset=1 starts a new window after reading."""
+    if not is_admin():
+        return jsonify({'error': 'requires a valid X-Admin-Token'}), 403
+    source = request.args.get('source', 'all')
+    if source not in ('all', 'workers', 'server'):
+        return jsonify({'error': 'source must be all, workers or server'}), 400
+    reset = request.args.get('reset') in ('1', 'true')
+    counts = {}
+    if source != 'server':
+        merge(counts, render_pool.stacks(reset))
+        if farm_queue is not None:
+            merge(counts, farm_queue.stacks(reset))  # standalone render_farm.py nodes
+    if source != 'workers':
+        merge(counts, stack_sampler.counts())
+        if reset:
+            stack_sampler.reset()
+    return Response(collapsed(counts), mimetype='text/plain')
+
 if __name__ == '__main__':
     print("🚀 Starting Form Automation Backend Server...")
     print("📁 Templates folder:", TEMPLATES_FOLDER)
     print("📁 Output folder:", OUTPUT_FOLDER)
-    print("🌐 Server running on http://localhost:5000")
+    print(f"🌐 Server running on http://localhost:{PORT}")
+    if farm_queue is not None:
+        print("🚜 Render farm queue:", RENDER_FARM_DB)
+    
+    # With the debug reloader the parent process only watches files; the
+    # serving child is the one that needs warm workers.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or not DEBUG:
+        if farm_queue is None or farm_node is not None:
+            print(f"🔥 Warming up {RENDER_WORKERS} render workers...")
+            render_pool.start()
+        if farm_node is not None:
+            farm_node.start()
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    app.run(debug=DEBUG, host='0.0.0.0', port=PORT)
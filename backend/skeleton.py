@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Template Skeletons
+A fast render path for the simple forms (the simple 6-field forms, NDA, LOA).
+Each template is compiled once: the normal python-docx filler runs with a
+sentinel in place of every candidate value, and the resulting document.xml
+is cut at the sentinels into static byte chunks and named slots. Rendering is
+then XML-escaped concatenation plus adding document.xml to a prebuilt zip
+(as its last part; the file is byte-identical to the python-docx render).
+
+Compilation records which candidate fields the filler reads. A field whose
+being empty changes the document (e.g. a line only written when both name
+and father are known) is required; if a candidate cannot be substituted
+safely (empty, padded or multi-line values) render() returns None and the
+caller falls back to python-docx.
+"""
+
+from __future__ import annotations
+import io, re, zipfile
+from typing import Callable, FrozenSet, List, Optional, Tuple
+
+from candidate import Candidate
+from reproducible import DOCUMENT_PART, date_time, part_order, zip_info
+
+# Candidate attributes the simple-form fillers use
+SKELETON_FIELDS = ("name", "father", "email", "title", "employer", "today",
+                   "address_current", "address_permanent", "address_previous")
+
+_OPEN, _CLOSE = "⟦", "⟧"
+_SLOT_RE = re.compile(f"{_OPEN}(\\w+){_CLOSE}".encode("utf-8"))
+# python-docx turns tabs/newlines into elements and pads with xml:space="preserve"
+_UNSAFE_RE = re.compile(r"[\x00-\x1f\ud800-\udfff\ufffe\uffff]")
+
+
+class NotCompilable(Exception):
+    """The template's filler does something a skeleton cannot reproduce."""
+
+
+class _Probe(Candidate):
+    """A candidate whose skeleton fields are sentinels and which records attribute reads."""
+    __slots__ = ("reads",)
+
+    def __init__(self, values: dict):
+        self.reads = set()
+        super().__init__({})
+        for field, value in values.items():
+            setattr(self, field, value)
+        self.reads.clear()
+
+    def __getattribute__(self, attr):
+        if attr != "reads" and not attr.startswith("__"):
+            object.__getattribute__(self, "reads").add(attr)
+        return object.__getattribute__(self, attr)
+
+
+def _sentinels(**overrides) -> dict:
+    values = {f: f"{_OPEN}{f}{_CLOSE}" for f in SKELETON_FIELDS}
+    values.update(overrides)
+    return values
+
+
+def _escape(value: str) -> bytes:
+    # matches lxml's text serialization (quotes are left as-is in text nodes)
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").encode("utf-8")
+
+
+def substitutable(value) -> bool:
+    return isinstance(value, str) and bool(value) and value == value.strip() and not _UNSAFE_RE.search(value)
+
+
+def _split(package: bytes) -> Tuple[List[bytes], List[str], bytes, tuple]:
+    """(chunks, slots, zip without document.xml, its timestamp). The zip is
+    written as reproducible.write_package would, which puts document.xml
+    last, so appending it gives the same bytes as a python-docx render."""
+    base = io.BytesIO()
+    stamp = date_time()
+    with zipfile.ZipFile(io.BytesIO(package)) as src, zipfile.ZipFile(base, "w") as dst:
+        names = src.namelist()
+        if DOCUMENT_PART not in names:
+            raise NotCompilable(f"no {DOCUMENT_PART}")
+        xml = src.read(DOCUMENT_PART)
+        for name in sorted(names, key=part_order):
+            if name == DOCUMENT_PART:
+                continue
+            data = src.read(name)
+            if _OPEN.encode("utf-8") in data:
+                raise NotCompilable(f"candidate values end up in {name}")
+            dst.writestr(zip_info(name, stamp), data)
+    parts = _SLOT_RE.split(xml)
+    return parts[0::2], [s.decode("ascii") for s in parts[1::2]], base.getvalue(), stamp
+
+
+class Skeleton:
+    __slots__ = ("chunks", "slots", "required", "base", "date_time")
+
+    def __init__(self, chunks: List[bytes], slots: List[str], required: FrozenSet[str], base: bytes,
+                 date_time: tuple):
+        self.chunks = chunks
+        self.slots = slots
+        self.required = required
+        self.base = base
+        self.date_time = date_time
+
+    def render(self, candidate: Candidate) -> Optional[bytes]:
+        """DOCX bytes for this candidate, or None if python-docx has to render it."""
+        for field in self.required:
+            if not substitutable(getattr(candidate, field)):
+                return None
+        out = [self.chunks[0]]
+        for slot, chunk in zip(self.slots, self.chunks[1:]):
+            out.append(_escape(getattr(candidate, slot)))
+            out.append(chunk)
+        buf = io.BytesIO(self.base)
+        with zipfile.ZipFile(buf, "a") as z:
+            z.writestr(zip_info(DOCUMENT_PART, self.date_time), b"".join(out))
+        return buf.getvalue()
+
+
+def compile_skeleton(render: Callable[[Candidate], bytes]) -> Skeleton:
+    """`render(candidate)` must fill the template with python-docx and return the saved DOCX bytes."""
+    probe = _Probe(_sentinels())
+    chunks, slots, base, date_time = _split(render(probe))
+    unexpected = probe.reads - set(SKELETON_FIELDS)
+    if unexpected:
+        raise NotCompilable(f"filler reads {', '.join(sorted(unexpected))}")
+    required = set(slots)
+    # A field that is read but never written out may still steer the filler
+    for field in sorted(probe.reads - required):
+        variant = _split(render(_Probe(_sentinels(**{field: ""}))))
+        if variant[:2] != (chunks, slots):
+            required.add(field)
+    return Skeleton(chunks, slots, frozenset(required), base, date_time)
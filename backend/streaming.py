@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Streaming Fill
+Bounded-memory filling for very large templates (long policy documents and
+annexures with hundreds of tables). Instead of loading the whole tree with
+python-docx, word/document.xml is read with lxml's iterparse one top-level
+paragraph or table at a time. Each block is wrapped in the usual python-docx
+proxies, passed to the fill rules, written to the output zip straight away
+and dropped, so peak memory is about one block whatever the document's size.
+The other parts are copied through unchanged.
+
+Only rules that look at one block at a time can run this way (the general
+form rules, see SmartFormPopulator.fill_general_block). The form type is
+found with a streaming scan as well: scan_form_type() applies the
+determine_form_type() keyword rules to the same text, keeping only a short
+tail of it.
+"""
+
+from __future__ import annotations
+import re, shutil, zipfile
+from typing import Callable, Sequence, Set, Tuple
+
+from docx.oxml import element_class_lookup
+from docx.oxml.ns import qn
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+from lxml import etree
+
+from reproducible import DOCUMENT_PART, date_time, part_order, zip_info
+
+XML_DECLARATION = b"<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+W_BODY, W_P, W_TBL = qn("w:body"), qn("w:p"), qn("w:tbl")
+
+_NS_DECL_RE = re.compile(rb'\s+xmlns(?::[\w.-]+)?="[^"]*"')
+_QNAME_RE = re.compile(rb"<([^\s/>]+)")
+_TAIL = 64  # longer than any form type keyword
+
+
+def document_size(src) -> int:
+    """Uncompressed size of word/document.xml (src: path or file object)."""
+    with zipfile.ZipFile(src) as z:
+        return z.getinfo(DOCUMENT_PART).file_size
+
+
+def _iterparse(stream):
+    events = etree.iterparse(stream, events=("start", "end"), remove_blank_text=True, resolve_entities=False,
+                             huge_tree=True)
+    # python-docx's element classes, so blocks work with Paragraph/Table as usual
+    events.set_element_class_lookup(element_class_lookup)
+    return events
+
+
+def _declarations(xml: bytes) -> Set[bytes]:
+    head = xml[:xml.index(b">")]
+    return {m.group(0).strip() for m in _NS_DECL_RE.finditer(head)}
+
+
+def _serialize(el, inherited: Set[bytes]) -> bytes:
+    """el as XML without re-declaring namespaces its ancestors already declared."""
+    xml = etree.tostring(el, encoding="UTF-8", xml_declaration=False)
+    end = xml.index(b">")
+    head = _NS_DECL_RE.sub(lambda m: b"" if m.group(0).strip() in inherited else m.group(0), xml[:end])
+    return head + xml[end:]
+
+
+def _open_tag(el, inherited: Set[bytes]) -> Tuple[bytes, bytes, Set[bytes]]:
+    """(start tag, end tag, namespace declarations in scope inside it) for an element still being parsed."""
+    shell = etree.tostring(etree.Element(el.tag, dict(el.attrib), nsmap=el.nsmap))  # b'<w:body .../>'
+    qname = _QNAME_RE.match(shell).group(1)
+    start = _serialize(etree.fromstring(shell), inherited)[:-2] + b">"
+    return start, b"</" + qname + b">", inherited | _declarations(shell)
+
+
+def _fill_document_xml(src, dst, fill_block: Callable) -> int:
+    fixes = 0
+    root = body = None
+    scopes = {}  # element -> namespace declarations in scope for its children
+    closing = {}
+    dst.write(XML_DECLARATION)
+    for event, el in _iterparse(src):
+        if event == "start":
+            if root is None or (body is None and el.tag == W_BODY and el.getparent() is root):
+                parent_scope = scopes[root] if root is not None else set()
+                start, end, scopes[el] = _open_tag(el, parent_scope)
+                closing[el] = end
+                dst.write(start)
+                if root is None:
+                    root = el
+                else:
+                    body = el
+            continue
+        parent = el.getparent()
+        if el is body or el is root:
+            dst.write(closing[el])
+        elif parent is body or parent is root:
+            # a finished top-level block: fill, write out, forget
+            if parent is body and el.tag in (W_P, W_TBL):
+                fixes += fill_block(el)
+            dst.write(_serialize(el, scopes[parent]))
+            parent.remove(el)
+    return fixes
+
+
+def stream_fill(src, dst, fill_block: Callable) -> int:
+    """Copy the DOCX at src (path or file object) to dst (path or writable file),
+    passing every top-level paragraph and table element of the body through
+    fill_block(element) on the way. Returns the sum of fill_block's results."""
+    fixes = 0
+    stamp = date_time()
+    with zipfile.ZipFile(src) as zin, zipfile.ZipFile(dst, "w", zipfile.ZIP_DEFLATED) as zout:
+        # laid out like reproducible.write_package, so the file is reproducible too
+        for name in sorted(zin.namelist(), key=part_order):
+            with zin.open(name) as r, zout.open(zip_info(name, stamp), "w") as w:
+                if name == DOCUMENT_PART:
+                    fixes = _fill_document_xml(r, w, fill_block)
+                else:
+                    shutil.copyfileobj(r, w, 64 * 1024)
+    return fixes
+
+
+class _KeywordScan:
+    """Which form type rules match a text that arrives piece by piece. Keeps
+    only the last _TAIL characters, enough to catch a keyword split between
+    two pieces."""
+
+    def __init__(self, rules: Sequence):
+        self.rules = rules
+        self.hits: Set[str] = set()
+        self.tail = ""
+        self.length = 0  # characters fed so far
+        self.head = ""  # first _TAIL characters
+
+    def feed(self, piece: str):
+        piece = piece.lower()
+        self.check(self.tail + piece, at_start=self.length == len(self.tail), at_end=True)
+        self.length += len(piece)
+        if len(self.head) < _TAIL:
+            self.head = (self.head + piece)[:_TAIL]
+        self.tail = (self.tail + piece)[-_TAIL:]
+
+    def check(self, window: str, at_start: bool, at_end: bool):
+        for form_type, words, pattern in self.rules:
+            if any(w in window for w in words):
+                self.hits.add(form_type)
+            elif pattern is not None:
+                # \b at the edges of the window only counts where the text really starts or ends
+                for m in pattern.finditer(window):
+                    if (m.start() > 0 or at_start) and (m.end() < len(window) or at_end):
+                        self.hits.add(form_type)
+                        break
+
+
+def scan_form_type(src, rules: Sequence) -> str:
+    """determine_form_type() for a template on disk or in a file object, without loading it.
+    `rules` is SmartFormPopulator.FORM_TYPE_RULES. Like extract_document_structure,
+    the text is the body's non-empty paragraphs, then every table cell."""
+    paragraphs, cells = _KeywordScan(rules), _KeywordScan(rules)
+    with zipfile.ZipFile(src) as z, z.open(DOCUMENT_PART) as xml:
+        body = None
+        for event, el in _iterparse(xml):
+            if event == "start":
+                if body is None and el.tag == W_BODY:
+                    body = el
+                continue
+            if body is None or el.getparent() is not body:
+                continue
+            if el.tag == W_P:
+                text = (Paragraph(el, None).text or "").strip()
+                if text:
+                    paragraphs.feed(text if paragraphs.length == 0 else " " + text)
+            elif el.tag == W_TBL:
+                for row in Table(el, None).rows:
+                    for cell in row.cells:
+                        cells.feed(" " + (cell.text or "").strip())
+            body.remove(el)
+    # a keyword may also straddle the last paragraph and the first cell
+    junction = _KeywordScan(rules)
+    junction.check(paragraphs.tail + cells.head, at_start=paragraphs.length == len(paragraphs.tail),
+                   at_end=cells.length == len(cells.head))
+    hits = paragraphs.hits | cells.hits | junction.hits
+    for form_type, _words, _pattern in rules:
+        if form_type in hits:
+            return form_type
+    return "general"
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Template Store
+Loads the DOCX templates once and keeps their bytes and extracted form
+structure in memory, so a render only has to parse the copy it fills.
+
+Parsed python-docx trees are kept as pristine masters in an optional
+MemoryBudgetLRU (keyed by content hash) and deep-copied per render.
+
+The store can watch its folder: edited, added or removed templates are
+detected by mtime/size and confirmed by content hash, re-parsed, and swapped
+in as a new immutable snapshot. A render holds on to the snapshot it started
+with, so in-flight work always finishes on the old version.
+
+Simple forms also get a compiled skeleton (see skeleton.py) when they are
+parsed, so most renders of them skip python-docx entirely.
+"""
+
+from __future__ import annotations
+import copy, hashlib, io, logging, os, threading, time
+from typing import Callable, Dict, List, Mapping, Optional
+from docx import Document
+
+from memory_cache import MemoryBudgetLRU
+from populator import SmartFormPopulator
+from reproducible import save_document
+from skeleton import NotCompilable, Skeleton, compile_skeleton
+from streaming import document_size, scan_form_type
+
+log = logging.getLogger("template_store")
+
+
+class TemplateEntry:
+    """One template: raw bytes plus the structure extract_form_structure() found."""
+    __slots__ = ("name", "path", "blob", "structure", "mtime", "size", "sha256", "cache", "skeleton")
+
+    def __init__(self, name: str, path: str, blob: bytes, structure: Dict, mtime: float, size: int, sha256: str,
+                 cache: Optional[MemoryBudgetLRU] = None, skeleton: Optional[Skeleton] = None):
+        self.name = name
+        self.path = path
+        self.blob = blob
+        self.structure = structure
+        self.mtime = mtime
+        self.size = size
+        self.sha256 = sha256
+        self.cache = cache
+        self.skeleton = skeleton
+
+    @property
+    def form_type(self) -> str:
+        return self.structure.get("form_type", "unknown")
+
+    @property
+    def streaming(self) -> bool:
+        """Too big to load: filled block by block from the bytes (see streaming.py)."""
+        return bool(self.structure.get("streaming"))
+
+    def open_document(self) -> Document:
+        """Fresh, writable python-docx Document for one render."""
+        if self.cache is None:
+            return Document(io.BytesIO(self.blob))
+        # Copying the cached master is cheaper than unzipping and parsing again.
+        # The master must stay untouched: once python-docx has cached proxies
+        # (e.g. Document._body) a deepcopy would detach them from the new tree.
+        master = self.cache.get_or_create(("template", self.sha256), lambda: Document(io.BytesIO(self.blob)))
+        return copy.deepcopy(master)
+
+    def touched(self, mtime: float) -> "TemplateEntry":
+        """Same content, newer mtime (file was re-saved without changes)."""
+        return TemplateEntry(self.name, self.path, self.blob, self.structure, mtime, self.size, self.sha256, self.cache,
+                             self.skeleton)
+
+
+class TemplateSnapshot:
+    """Immutable view of the templates at one version."""
+    __slots__ = ("version", "_entries")
+
+    def __init__(self, version: int, entries: Dict[str, TemplateEntry]):
+        self.version = version
+        self._entries = entries
+
+    def names(self) -> List[str]:
+        return list(self._entries)
+
+    def get(self, name: str) -> Optional[TemplateEntry]:
+        return self._entries.get(name)
+
+    def entries(self) -> List[TemplateEntry]:
+        return list(self._entries.values())
+
+    def snapshot(self) -> "TemplateSnapshot":
+        return self
+
+
+class TemplateStore:
+    def __init__(self, templates_dir: Optional[str], cache: Optional[MemoryBudgetLRU] = None, skeletons: bool = True,
+                 stream_bytes: Optional[int] = None):
+        self.templates_dir = templates_dir
+        self.cache = cache
+        self.skeletons = skeletons
+        # general forms with a document.xml this big are never parsed whole
+        self.stream_bytes = SmartFormPopulator.STREAM_MIN_BYTES if stream_bytes is None else stream_bytes
+        self._snapshot = TemplateSnapshot(0, {})
+        self._refresh_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._bad: Dict[str, tuple] = {}  # name -> (mtime, size) of a file that failed to parse
+        self.loaded_at: Optional[float] = None
+        self.reloads = 0
+
+    def parse(self, name: str, path: str, blob: bytes, mtime: float) -> TemplateEntry:
+        if self.stream_bytes and document_size(io.BytesIO(blob)) >= self.stream_bytes:
+            form_type = scan_form_type(io.BytesIO(blob), SmartFormPopulator.FORM_TYPE_RULES)
+            if SmartFormPopulator.streamable(name, form_type):
+                log.info("🌊 %s will be streamed (%s)", name, form_type)
+                structure = {"paragraphs": [], "tables": [], "form_type": form_type, "streaming": True}
+                return TemplateEntry(name, path, blob, structure, mtime, len(blob), hashlib.sha256(blob).hexdigest(),
+                                     self.cache)
+            log.warning("⚠️  %s is large, but %s forms need the whole document; loading it", name, form_type)
+        # structure extraction only looks at the template, so an empty candidate is enough
+        analyser = SmartFormPopulator.from_dict({})
+        structure = analyser.extract_document_structure(Document(io.BytesIO(blob)))
+        skeleton = None
+        if self.skeletons and SmartFormPopulator.skeleton_eligible(name, structure.get("form_type", "unknown")):
+            skeleton = self.compile(name, blob, structure)
+        return TemplateEntry(name, path, blob, structure, mtime, len(blob), hashlib.sha256(blob).hexdigest(), self.cache,
+                             skeleton)
+
+    @staticmethod
+    def compile(name: str, blob: bytes, structure: Dict) -> Optional[Skeleton]:
+        def render(candidate) -> bytes:
+            doc = Document(io.BytesIO(blob))
+            SmartFormPopulator.from_candidate(candidate)._fill_document(doc, structure, name)
+            buf = io.BytesIO()
+            save_document(doc, buf)
+            return buf.getvalue()
+
+        try:
+            skeleton = compile_skeleton(render)
+        except NotCompilable as e:
+            log.debug("No skeleton for %s: %s", name, e)
+            return None
+        except Exception as e:
+            log.warning("⚠️  Skeleton compile failed for %s: %s", name, e)
+            return None
+        log.debug("🦴 Skeleton for %s: %d slots, requires %s", name, len(skeleton.slots),
+                  ", ".join(sorted(skeleton.required)))
+        return skeleton
+
+    @classmethod
+    def from_blobs(cls, blobs: Mapping[str, bytes], cache: Optional[MemoryBudgetLRU] = None,
+                   skeletons: bool = True, stream_bytes: Optional[int] = None) -> "TemplateStore":
+        """A store over templates already in memory ({file name: DOCX bytes}); it has no folder to watch."""
+        store = cls(None, cache=cache, skeletons=skeletons, stream_bytes=stream_bytes)
+        entries = {name: store.parse(name, name, blobs[name], 0.0) for name in sorted(blobs)}
+        store._snapshot = TemplateSnapshot(1, entries)
+        store.loaded_at = time.time()
+        return store
+
+    def load(self) -> "TemplateStore":
+        self.refresh()
+        return self
+
+    def refresh(self) -> bool:
+        """Re-scan the folder; swap in a new snapshot if anything changed."""
+        if self.templates_dir is None:
+            return False
+        with self._refresh_lock:
+            current = self._snapshot
+            entries: Dict[str, TemplateEntry] = {}
+            changed = False
+            for de in sorted(os.scandir(self.templates_dir), key=lambda d: d.name):
+                if not (de.is_file() and de.name.lower().endswith(".docx")):
+                    continue
+                st = de.stat()
+                old = current.get(de.name)
+                if old is not None and old.mtime == st.st_mtime and old.size == st.st_size:
+                    entries[de.name] = old
+                    continue
+                if self._bad.get(de.name) == (st.st_mtime, st.st_size):
+                    if old is not None:
+                        entries[de.name] = old
+                    continue
+                try:
+                    with open(de.path, "rb") as f:
+                        blob = f.read()
+                    sha = hashlib.sha256(blob).hexdigest()
+                    if old is not None and old.sha256 == sha:
+                        entries[de.name] = old.touched(st.st_mtime)
+                        continue
+                    entries[de.name] = self.parse(de.name, de.path, blob, st.st_mtime)
+                    self._bad.pop(de.name, None)
+                    changed = True
+                except Exception as e:
+                    # Most likely a half-written file; keep the old version until it changes again
+                    log.warning("⚠️  Could not load template %s: %s", de.name, e)
+                    self._bad[de.name] = (st.st_mtime, st.st_size)
+                    if old is not None:
+                        entries[de.name] = old
+            if set(entries) != set(current.names()):
+                changed = True
+            if changed or self.loaded_at is None:
+                self._snapshot = TemplateSnapshot(current.version + 1, entries)
+                if self.loaded_at is not None:
+                    self.reloads += 1
+                    log.info("🔄 Templates reloaded (version %d)", self._snapshot.version)
+                self.loaded_at = time.time()
+            else:
+                # mtimes may have moved; keep the version but remember them
+                self._snapshot = TemplateSnapshot(current.version, entries)
+            return changed
+
+    def watch(self, interval: float = 2.0, on_change: Optional[Callable[["TemplateStore"], None]] = None):
+        """Poll the folder every `interval` seconds in a daemon thread."""
+        if self._watcher is not None or interval <= 0:
+            return
+
+        def _loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.refresh() and on_change is not None:
+                        on_change(self)
+                except Exception as e:
+                    log.exception("⚠️  Template watch failed: %s", e)
+
+        self._watcher = threading.Thread(target=_loop, name="template-watcher", daemon=True)
+        self._watcher.start()
+
+    # Renders should call snapshot() once and use it for the whole request
+    def snapshot(self) -> TemplateSnapshot:
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def names(self) -> List[str]:
+        return self._snapshot.names()
+
+    def get(self, name: str) -> Optional[TemplateEntry]:
+        return self._snapshot.get(name)
+
+    def stats(self) -> Dict:
+        snap = self._snapshot
+        return {
+            "version": snap.version,
+            "reloads": self.reloads,
+            "templates": len(snap.names()),
+            "bytes": sum(e.size for e in snap.entries()),
+            "form_types": {e.name: e.form_type for e in snap.entries()},
+            "skeletons": sorted(e.name for e in snap.entries() if e.skeleton is not None),
+            "streaming": sorted(e.name for e in snap.entries() if e.streaming),
+            "loaded_at": self.loaded_at,
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tracing & Structured Logging
+A trace id per request plus lightweight spans (name, duration, attributes).
+Spans are only timed and appended to the active trace; they are written out
+once per request as a single structured log line, so the render hot path does
+no string formatting or I/O for them. Logs are JSON lines with levels.
+
+A trace can carry hooks: context-manager factories entered around every span
+(the memory profiler uses this to measure each render stage).
+"""
+
+from __future__ import annotations
+import contextvars, json, logging, os, sys, time, uuid
+from contextlib import ExitStack, contextmanager
+from typing import Callable, ContextManager, Dict, Iterator, List, Optional
+
+_current: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "started", "hooks")
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or new_trace_id()
+        self.spans: List[Dict] = []
+        self.started = time.perf_counter()
+        self.hooks: List[Callable[[str, Dict], ContextManager]] = []
+
+    def add(self, name: str, duration_ms: float, **attrs):
+        self.spans.append({"name": name, "ms": round(duration_ms, 2), **attrs})
+
+    def extend(self, spans: List[Dict]):
+        self.spans.extend(spans or [])
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def current_trace_id() -> Optional[str]:
+    tr = _current.get()
+    return tr.trace_id if tr is not None else None
+
+
+@contextmanager
+def trace(trace_id: Optional[str] = None) -> Iterator[Trace]:
+    """Make a Trace active for the current thread/context."""
+    tr = Trace(trace_id)
+    token = _current.set(tr)
+    try:
+        yield tr
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[None]:
+    """Time a block and record it on the active trace (no-op without one)."""
+    tr = _current.get()
+    if tr is None:
+        yield
+        return
+    if tr.hooks:
+        with ExitStack() as stack:
+            for hook in tr.hooks:
+                stack.enter_context(hook(name, attrs))
+            started = time.perf_counter()
+            try:
+                yield
+            finally:
+                tr.add(name, (time.perf_counter() - started) * 1000, **attrs)
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        tr.add(name, (time.perf_counter() - started) * 1000, **attrs)
+
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None) or current_trace_id()
+        if trace_id:
+            entry["trace_id"] = trace_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level: Optional[str] = None, json_output: Optional[bool] = None):
+    """Root logging setup. LOG_LEVEL (default INFO) and LOG_FORMAT=json|text from the environment."""
+    level = (level or os.environ.get("LOG_LEVEL", "INFO")).upper()
+    if json_output is None:
+        json_output = os.environ.get("LOG_FORMAT", "json").lower() == "json"
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonLogFormatter() if json_output else logging.Formatter("%(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Complexity Benchmark
+Times the structure and classification helpers (_linearize_blocks,
+_table_has_any_text, _classify_table, extract_document_structure) and the
+fill itself on synthetic templates while one dimension of the template
+grows: the number of blocks (paragraphs and tables together), the rows per
+table, or the merged rows per table. For every stage it fits the growth
+exponent of time against document size (1.0 is linear, 2.0 quadratic), over
+all sizes and over the last step, flags the stages that grow faster than
+the document, and plots the times on log-log axes, where a superlinear
+stage shows as a steeper line.
+
+    python benchmarks/bench_complexity.py --grow blocks --sizes 1,2,4,8,16
+    python benchmarks/bench_complexity.py --grow rows --form-type general --csv > rows.csv
+"""
+
+from __future__ import annotations
+import argparse, gc, io, math, os, sys, tempfile, time
+from typing import Callable, Dict, List, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from docx import Document  # noqa: E402
+from form_data import transform_form_data  # noqa: E402
+from populator import SmartFormPopulator  # noqa: E402
+from reproducible import save_document  # noqa: E402
+from synthetic_candidates import generate_candidate  # noqa: E402
+from synthetic_templates import TITLES, generate_template  # noqa: E402
+
+STAGES = ("parse", "linearize", "scan_rows", "classify", "structure", "fill", "save")
+SUPERLINEAR = 1.3  # growth exponent above which a stage is flagged
+_NO_MATCH = ["\x00no such label\x00"]  # makes _table_has_any_text read every row
+
+
+def _best_ms(fn: Callable, repeat: int, setup: Callable = lambda: None) -> float:
+    best = math.inf
+    for _ in range(repeat):
+        arg = setup()
+        gc.collect()  # keep collections of earlier garbage out of the timing
+        started = time.perf_counter()
+        fn(arg)
+        best = min(best, (time.perf_counter() - started) * 1000)
+    return best
+
+
+def stage_timings(pop: SmartFormPopulator, path: str, repeat: int) -> Dict[str, float]:
+    """Best-of-`repeat` milliseconds per stage for the template at `path`."""
+    doc = Document(path)
+    structure = pop.extract_document_structure(doc)
+    name = os.path.basename(path)
+
+    def filled():
+        d = Document(path)
+        pop._fill_document(d, structure, name)
+        return d
+
+    return {
+        "parse": _best_ms(lambda _: Document(path), repeat),
+        "linearize": _best_ms(lambda _: pop._linearize_blocks(doc), repeat),
+        "scan_rows": _best_ms(lambda _: [pop._table_has_any_text(t, _NO_MATCH, "row") for t in doc.tables], repeat),
+        "classify": _best_ms(lambda _: [pop._classify_table(t) for t in doc.tables], repeat),
+        "structure": _best_ms(lambda _: pop.extract_document_structure(doc), repeat),
+        "fill": _best_ms(lambda d: pop._fill_document(d, structure, name), repeat, setup=lambda: Document(path)),
+        "save": _best_ms(lambda d: save_document(d, io.BytesIO()), repeat, setup=filled),
+    }
+
+
+def document_units(doc) -> int:
+    """Size of a document as the rules see it: paragraphs plus table cells."""
+    return len(doc.paragraphs) + sum(len(row.cells) for t in doc.tables for row in t.rows)
+
+
+def growth_exponent(sizes: Sequence[float], times: Sequence[float]) -> float:
+    """Least-squares slope of log(time) against log(size)."""
+    xs = [math.log(s) for s in sizes]
+    ys = [math.log(max(t, 1e-3)) for t in times]
+    mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+    var = sum((x - mx) ** 2 for x in xs)
+    return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / var if var else 0.0
+
+
+def ascii_plot(sizes: Sequence[float], series: Dict[str, Sequence[float]], width: int = 60, height: int = 16) -> str:
+    """Log-log scatter of every series against sizes, one letter per series."""
+    points = [(s, t) for ts in series.values() for s, t in zip(sizes, ts)]
+    lx = [math.log(s) for s, _ in points]
+    ly = [math.log(max(t, 1e-3)) for _, t in points]
+    x0, x1 = min(lx), max(lx) or 1
+    y0, y1 = min(ly), max(ly)
+    grid = [[" "] * width for _ in range(height)]
+    legend = []
+    for letter, (label, ts) in zip("ABCDEFGHIJ", series.items()):
+        legend.append(f"{letter}={label}")
+        for s, t in zip(sizes, ts):
+            col = round((math.log(s) - x0) / ((x1 - x0) or 1) * (width - 1))
+            row = round((math.log(max(t, 1e-3)) - y0) / ((y1 - y0) or 1) * (height - 1))
+            grid[height - 1 - row][col] = letter
+    top, bottom = f"{math.exp(y1):.1f} ms", f"{math.exp(y0):.2f} ms"
+    margin = max(len(top), len(bottom)) + 1
+    lines = [(top if i == 0 else bottom if i == height - 1 else "").rjust(margin) + "|" + "".join(r)
+             for i, r in enumerate(grid)]
+    lines.append(" " * margin + "+" + "-" * width)
+    axis = f" {min(sizes)}".ljust(width - len(str(max(sizes)))) + f"{max(sizes)}  (paragraphs + cells, log)"
+    lines.append(" " * margin + axis)
+    lines.append(" " * margin + " " + "  ".join(legend))
+    return "\n".join(lines)
+
+
+def template_shape(grow: str, scale: int, args) -> Dict:
+    shape = {"paragraphs": args.paragraphs, "tables": args.tables, "rows": args.rows, "cols": args.cols,
+             "merged": args.merged}
+    if grow == "blocks":
+        shape["paragraphs"] *= scale
+        shape["tables"] *= scale
+    elif grow == "rows":
+        shape["rows"] *= scale
+    else:  # merged banner rows, with the rows that carry labels kept as they are
+        shape["merged"] *= scale
+        shape["rows"] += shape["merged"] - args.merged
+    return shape
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classification and fill time vs. template size")
+    parser.add_argument("--grow", choices=("blocks", "rows", "merged"), default="blocks")
+    parser.add_argument("--sizes", default="1,2,4,8,16", help="comma-separated scale factors")
+    parser.add_argument("--paragraphs", type=int, default=20, help="body paragraphs at scale 1")
+    parser.add_argument("--tables", type=int, default=5, help="tables at scale 1")
+    parser.add_argument("--rows", type=int, default=6, help="rows per table at scale 1")
+    parser.add_argument("--cols", type=int, default=2)
+    parser.add_argument("--merged", type=int, default=1, help="merged banner rows per table at scale 1")
+    parser.add_argument("--form-type", choices=sorted(TITLES), default="background_verification")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage and size (best is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--csv", action="store_true")
+    args = parser.parse_args()
+
+    pop = SmartFormPopulator.from_dict(transform_form_data(generate_candidate(args.seed)))
+    scales = [int(s) for s in args.sizes.split(",")]
+    units: List[int] = []
+    rows: List[Dict[str, float]] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            shape = template_shape(args.grow, scale, args)
+            doc = generate_template(form_type=args.form_type, seed=args.seed, **shape)
+            path = os.path.join(tmp, f"synthetic_{scale}.docx")
+            save_document(doc, path)
+            units.append(document_units(doc))
+            started = time.perf_counter()
+            rows.append(stage_timings(pop, path, args.repeat))
+            print(f"  {args.grow} x{scale}: {units[-1]} paragraphs + cells, {time.perf_counter() - started:.2f}s",
+                  file=sys.stderr)
+
+    if args.csv:
+        print(",".join(["scale", "units"] + [f"{s}_ms" for s in STAGES]))
+        for scale, n, timing in zip(scales, units, rows):
+            print(",".join([str(scale), str(n)] + [f"{timing[s]:.2f}" for s in STAGES]))
+        return
+
+    # the fit over every size, and the last step alone: a quadratic term that only
+    # takes over in the largest documents barely moves the fit but shows in the last step
+    print(f"\n{'stage':<12}" + "".join(f"{n:>10}" for n in units) + f"{'fit':>8}{'last':>8}")
+    flagged = []
+    for stage in STAGES:
+        times = [timing[stage] for timing in rows]
+        fit = growth_exponent(units, times) if len(units) > 1 else 0.0
+        last = growth_exponent(units[-2:], times[-2:]) if len(units) > 1 else 0.0
+        mark = ""
+        if max(fit, last) > SUPERLINEAR and times[-1] >= 1.0:  # sub-millisecond stages are mostly noise
+            mark = "  ⚠️ superlinear"
+            flagged.append(stage)
+        print(f"{stage:<12}" + "".join(f"{t:>10.1f}" for t in times) + f"{fit:>8.2f}{last:>8.2f}{mark}")
+    if len(units) > 1:
+        print()
+        print(ascii_plot(units, {s: [timing[s] for timing in rows] for s in ("classify", "structure", "fill")}))
+    print(f"\n{'⚠️  Superlinear: ' + ', '.join(flagged) if flagged else '✅ Every stage grows linearly'}"
+          f" (growing {args.grow}, exponent > {SUPERLINEAR} is flagged)")
+
+
+if __name__ == "__main__":
+    main()
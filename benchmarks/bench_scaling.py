@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Scaling Benchmark
+Renders synthetic candidates while one history section grows and prints the
+time per template at each size, so loops that grow faster than the data
+(multi-address, reference and employment tables) stand out. With --memory
+it reports peak traced allocation per template instead of time, and
+--report writes the full per-stage memory report for every size.
+
+    python benchmarks/bench_scaling.py --section employers --sizes 1,2,4,8,16
+    python benchmarks/bench_scaling.py --section previous_addresses --csv > addresses.csv
+    python benchmarks/bench_scaling.py --memory --report memory.json
+"""
+
+from __future__ import annotations
+import argparse, json, os, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from form_data import transform_form_data  # noqa: E402
+from populator import SmartFormPopulator  # noqa: E402
+from profiling import MemoryProfiler  # noqa: E402
+from synthetic_candidates import DEFAULT_SIZES, generate_candidate  # noqa: E402
+from template_store import TemplateStore  # noqa: E402
+from tracing import trace  # noqa: E402
+
+
+def render_timings(store: TemplateStore, candidate: dict, templates_dir: str) -> dict:
+    """Milliseconds per template (parse + fill + save) for one candidate."""
+    pop = SmartFormPopulator.from_dict(transform_form_data(candidate))
+    with tempfile.TemporaryDirectory() as out, trace() as tr:
+        pop.populate_all_forms(templates_dir, out, store=store)
+    per_template: dict = {}
+    for s in tr.spans:
+        if "template" in s:
+            per_template[s["template"]] = per_template.get(s["template"], 0.0) + s["ms"]
+    return per_template
+
+
+def render_memory(store: TemplateStore, candidate: dict, templates_dir: str) -> dict:
+    """MemoryProfiler summary (peak KB and RSS delta per template and stage) for one candidate."""
+    pop = SmartFormPopulator.from_dict(transform_form_data(candidate))
+    profiler = MemoryProfiler()
+    try:
+        with tempfile.TemporaryDirectory() as out, trace() as tr:
+            tr.hooks.append(profiler.stage)
+            pop.populate_all_forms(templates_dir, out, store=store, profiler=profiler)
+        return profiler.summary()
+    finally:
+        profiler.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render time vs. history length")
+    parser.add_argument("--section", choices=sorted(DEFAULT_SIZES), default="employers")
+    parser.add_argument("--sizes", default="1,2,4,8,16", help="comma-separated section sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="renders per size (best is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--templates", default=os.path.join(ROOT, "templates"))
+    parser.add_argument("--csv", action="store_true")
+    parser.add_argument("--memory", action="store_true", help="peak KB per template instead of ms")
+    parser.add_argument("--report", metavar="PATH", help="with --memory: write the full memory report as JSON")
+    args = parser.parse_args()
+    unit = "KB" if args.memory else "ms"
+
+    store = TemplateStore(args.templates).load()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    render_timings(store, generate_candidate(args.seed), args.templates)  # warm imports and caches
+
+    rows = []
+    reports = {}
+    for size in sizes:
+        candidate = generate_candidate(args.seed, **{args.section: size})
+        best: dict = {}
+        started = time.perf_counter()
+        if args.memory:  # allocation is deterministic; one run per size is enough
+            reports[size] = render_memory(store, candidate, args.templates)
+            best = {name: t["peak_kb"] for name, t in reports[size]["templates"].items()}
+        for _ in range(0 if args.memory else args.repeat):
+            for name, ms in render_timings(store, candidate, args.templates).items():
+                best[name] = min(best.get(name, ms), ms)
+        rows.append((size, best))
+        print(f"  {args.section}={size}: {(time.perf_counter() - started) / (1 if args.memory else args.repeat):.2f}s"
+              " per candidate", file=sys.stderr)
+    if args.report and reports:
+        with open(args.report, "w") as f:
+            json.dump({"section": args.section, "sizes": {str(k): v for k, v in reports.items()}}, f, indent=2)
+
+    names = sorted({n for _, best in rows for n in best})
+    if args.csv:
+        print(",".join([args.section, f"total_{unit.lower()}"] + [f'"{n}"' for n in names]))
+        for size, best in rows:
+            print(",".join([str(size), f"{sum(best.values()):.1f}"] + [f"{best.get(n, 0):.1f}" for n in names]))
+        return
+    print(f"\n{'template':<55}" + "".join(f"{size:>10}" for size, _ in rows))
+    for n in names:
+        print(f"{n[:54]:<55}" + "".join(f"{best.get(n, 0):>10.1f}" for _, best in rows))
+    label = f"worst {unit}" if args.memory else "total ms"
+    print(f"{label:<55}" + "".join(f"{(max(best.values(), default=0) if args.memory else sum(best.values())):>10.1f}"
+                                   for _, best in rows))
+
+
+if __name__ == "__main__":
+    main()
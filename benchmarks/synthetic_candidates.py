@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Synthetic Candidates
+Deterministic, seeded candidate payloads in the frontend schema (the same
+shape as test_data.json) for stress and scaling tests. Every history section
+has a configurable size, so benchmarks can grow one section at a time and
+look for renders that slow down faster than the data grows.
+
+    python benchmarks/synthetic_candidates.py --seed 7 --employers 10 > candidate.json
+    python benchmarks/synthetic_candidates.py --count 500 --jsonl > candidates.jsonl
+"""
+
+from __future__ import annotations
+import argparse, json, random, sys
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+FIRST_NAMES = ["Aarav", "Priya", "Rahul", "Ananya", "Vikram", "Sneha", "Arjun", "Kavya", "Rohan", "Meera",
+               "Karthik", "Divya", "Siddharth", "Pooja", "Aditya", "Lakshmi"]
+LAST_NAMES = ["Sharma", "Reddy", "Iyer", "Patel", "Nair", "Gupta", "Rao", "Menon", "Das", "Kulkarni"]
+CITIES = [("Bangalore", "Karnataka", "560"), ("Hyderabad", "Telangana", "500"), ("Chennai", "Tamil Nadu", "600"),
+          ("Mumbai", "Maharashtra", "400"), ("Pune", "Maharashtra", "411"), ("New Delhi", "Delhi", "110"),
+          ("Kolkata", "West Bengal", "700"), ("Kochi", "Kerala", "682")]
+STREETS = ["Main Road", "MG Road", "Park Street", "Lake View Layout", "Temple Street", "Station Road", "Ring Road"]
+COMPANIES = ["Infotech", "Systems", "Technologies", "Solutions", "Software", "Consulting", "Analytics", "Labs"]
+ROLES = ["Software Engineer", "Senior Developer", "Tech Lead", "QA Engineer", "Data Analyst", "Project Manager"]
+DEPARTMENTS = ["Engineering", "Quality", "Data", "Delivery", "Platform"]
+DEGREES = [("Bachelor of Technology", 4), ("Bachelor of Science", 3), ("Master of Science", 2),
+           ("Master of Computer Applications", 3), ("Master of Business Administration", 2)]
+RELATIONS = ["Father", "Mother", "Spouse", "Sister", "Brother"]
+GAP_REASONS = ["Higher studies", "Family responsibilities", "Travel and personal development", "Health reasons",
+               "Relocation", "Preparing for competitive exams"]
+
+DEFAULT_SIZES = {"employers": 2, "previous_addresses": 2, "references": 2, "gaps": 1, "witnesses": 1}
+
+
+def _iso(d: date) -> str:
+    return d.isoformat()
+
+
+def _raw(start: date, end: Optional[date]) -> str:
+    return f"{start:%b %Y} - {end:%b %Y}" if end else f"{start:%b %Y} - Present"
+
+
+def _period(start: date, end: Optional[date]) -> Dict:
+    return {"start": _iso(start), "end": _iso(end) if end else "present", "raw": _raw(start, end)}
+
+
+class _Faker:
+    def __init__(self, seed: int):
+        self.rnd = random.Random(seed)
+
+    def pick(self, seq):
+        return self.rnd.choice(seq)
+
+    def digits(self, n: int) -> str:
+        return "".join(self.rnd.choice("0123456789") for _ in range(n))
+
+    def letters(self, n: int) -> str:
+        return "".join(self.rnd.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(n))
+
+    def person(self) -> str:
+        return f"{self.pick(FIRST_NAMES)} {self.pick(LAST_NAMES)}"
+
+    def phone(self) -> str:
+        return self.pick("6789") + self.digits(9)
+
+    def address(self) -> Dict:
+        city, state, pin_prefix = self.pick(CITIES)
+        pin = pin_prefix + self.digits(3)
+        return {
+            "full_address": f"{self.rnd.randint(1, 999)} {self.pick(STREETS)}, {city}, {state} {pin}",
+            "state": state,
+            "postal_code": pin,
+        }
+
+    def company(self) -> str:
+        return f"{self.pick(LAST_NAMES)} {self.pick(COMPANIES)}"
+
+    def months(self, lo: int, hi: int) -> timedelta:
+        return timedelta(days=30 * self.rnd.randint(lo, hi))
+
+
+def _employment(fk: _Faker, start: date, end: Optional[date], index: int) -> Dict:
+    company = fk.company()
+    city, state, _ = fk.pick(CITIES)
+    manager = fk.person()
+    return {
+        "employer_name_and_branch": f"{company}, {city}",
+        "employer_address": fk.address()["full_address"],
+        "position_and_department": f"{fk.pick(ROLES)}, {fk.pick(DEPARTMENTS)}",
+        "landline": f"0{fk.digits(2)}-{fk.digits(8)}",
+        "employment_period": _period(start, end),
+        "employee_code": f"EMP{index:03d}{fk.digits(2)}",
+        "last_salary": str(fk.rnd.randrange(20000, 250000, 500)),
+        "reason_for_leaving": "" if end is None else fk.pick(["Better opportunity", "Relocation", "Career growth",
+                                                               "Contract ended"]),
+        "reporting_manager": f"{manager}, {fk.pick(DEPARTMENTS)} Department, Phone: 0{fk.digits(2)}-{fk.digits(8)}, "
+                             f"Email: {manager.split()[0].lower()}@{company.split()[0].lower()}.com",
+        "agency_details": "",
+        "contract_agency": False,
+        "can_verify": True,
+    }
+
+
+def _qualification(fk: _Faker, end: date) -> Dict:
+    degree, years = fk.pick(DEGREES)
+    city, state, _ = fk.pick(CITIES)
+    start = date(end.year - years, 7, 1)
+    return {
+        "university_and_college": f"{fk.pick(LAST_NAMES)} Institute of Technology",
+        "location_full_address": f"{city}, {state}",
+        "degree_or_course": degree,
+        "period": {"start": _iso(start), "end": _iso(end)},
+        "roll_or_registration": f"{start:%y}{fk.letters(2)}{fk.digits(3)}",
+    }
+
+
+def generate_candidate(seed: int = 0, employers: int = DEFAULT_SIZES["employers"],
+                       previous_addresses: int = DEFAULT_SIZES["previous_addresses"],
+                       references: int = DEFAULT_SIZES["references"], gaps: int = DEFAULT_SIZES["gaps"],
+                       witnesses: int = DEFAULT_SIZES["witnesses"], today: Optional[date] = None) -> Dict:
+    """One candidate in the frontend schema. The same arguments always give the same payload.
+
+    `employers` counts the current job plus employment_history entries;
+    `gaps` > 1 produces a list of gaps (a single gap stays a dict, as in test_data.json).
+    """
+    fk = _Faker(seed)
+    today = today or date(2025, 1, 1)
+    name = fk.person()
+    dob = date(fk.rnd.randint(1965, 2001), fk.rnd.randint(1, 12), fk.rnd.randint(1, 28))
+    city, _, _ = fk.pick(CITIES)
+
+    # Walk backwards from today: current job, then older jobs with the gaps in between
+    jobs: List[Dict] = []
+    gap_list: List[Dict] = []
+    end: Optional[date] = None
+    cursor = today - fk.months(3, 48)
+    for i in range(max(1, employers)):
+        start = cursor
+        jobs.append(_employment(fk, start, end, i + 1))
+        end = start - fk.months(0, 1)
+        if len(gap_list) < gaps:
+            gap_end = end
+            end = gap_end - fk.months(2, 12)
+            gap_list.append({"reason": fk.pick(GAP_REASONS), "period": _period(end, gap_end),
+                             "address_during_gap": fk.address()["full_address"]})
+        cursor = end - fk.months(12, 48)
+    career_start = cursor
+    while len(gap_list) < gaps:  # more gaps than employers: place the rest before the first job
+        gap_end = career_start
+        career_start = gap_end - fk.months(2, 12)
+        gap_list.append({"reason": fk.pick(GAP_REASONS), "period": _period(career_start, gap_end),
+                         "address_during_gap": fk.address()["full_address"]})
+
+    # Addresses: current since the current job, previous ones back to birth
+    moved_in = jobs[0]["employment_period"]["start"]
+    current = {**fk.address(), "duration_of_stay": _period(date.fromisoformat(moved_in), None)}
+    permanent = {**fk.address(), "duration_of_stay": _period(dob, None)}
+    previous = []
+    stay_end = date.fromisoformat(moved_in)
+    for _ in range(previous_addresses):
+        stay_start = max(dob, stay_end - fk.months(6, 60))
+        previous.append({**fk.address(), "duration_of_stay": _period(stay_start, stay_end)})
+        stay_end = stay_start
+
+    highest = _qualification(fk, date(min(career_start.year, today.year - 1), 6, 30))
+    prior = _qualification(fk, date(int(highest["period"]["start"][:4]), 6, 30))
+    nominee_dob = date(dob.year - fk.rnd.randint(-10, 30), fk.rnd.randint(1, 12), fk.rnd.randint(1, 28))
+    father = f"{fk.pick(FIRST_NAMES)} {name.split()[1]}"
+
+    return {
+        "name": name,
+        "gender": fk.pick(["Male", "Female"]),
+        "date_of_birth": _iso(dob),
+        "father_name": father,
+        "nationality": "Indian",
+        "pan_card": f"{fk.letters(5)}{fk.digits(4)}{fk.letters(1)}",
+        "aadhar_card": fk.digits(12),
+        "din": fk.digits(8),
+        "passport_no": f"{fk.letters(1)}{fk.digits(7)}",
+        "passport_issue_date": _iso(date(today.year - 5, 1, 1)),
+        "passport_expiry_date": _iso(date(today.year + 5, 1, 1)),
+        "email": f"{name.replace(' ', '.').lower()}{fk.digits(2)}@example.com",
+        "religion": fk.pick(["Hindu", "Muslim", "Christian", "Sikh", "Jain"]),
+        "phone": fk.phone(),
+        "current_address": current,
+        "permanent_address": permanent,
+        "previous_address": previous,
+        "current_employment": jobs[0],
+        "employment_history": jobs[1:],
+        "highest_qualification": highest,
+        "previous_qualification": prior,
+        "references": [{"name": fk.person(), "phone": fk.phone(),
+                        "designation_and_company": f"{fk.pick(ROLES)}, {fk.company()}"} for _ in range(references)],
+        "gaps": (gap_list[0] if gap_list else {}) if gaps <= 1 else gap_list,
+        "epf_and_gratuity": {
+            "pf_account_no": f"PF{fk.digits(9)}",
+            "marital_status": fk.pick(["Single", "Married"]),
+            "religion": "",
+            "department": jobs[0]["position_and_department"].split(", ")[-1],
+            "post_held": jobs[0]["position_and_department"].split(", ")[0],
+            "date_of_appointment": jobs[0]["employment_period"]["start"],
+            "nominee": {
+                "name": fk.person(),
+                "relationship": fk.pick(RELATIONS),
+                "date_of_birth": _iso(nominee_dob),
+                "address": permanent["full_address"],
+                "share": "100%",
+            },
+            "family_member_1": {"name": father, "relationship": "Father", "age": str(today.year - dob.year + 28)},
+            "witnesses": [{"name": fk.person(), "address": fk.address()["full_address"]} for _ in range(witnesses)],
+            "form_sign_date": _iso(today),
+            "form_sign_place": city,
+            "employer_name": jobs[0]["employer_name_and_branch"].split(",")[0],
+            "employer_address": jobs[0]["employer_address"],
+        },
+    }
+
+
+def generate_candidates(count: int, seed: int = 0, **sizes) -> List[Dict]:
+    """`count` different candidates with the same section sizes."""
+    return [generate_candidate(seed + i, **sizes) for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate seeded synthetic candidates (frontend schema)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--jsonl", action="store_true", help="one candidate per line instead of a JSON document")
+    for section, default in DEFAULT_SIZES.items():
+        parser.add_argument(f"--{section.replace('_', '-')}", type=int, default=default, dest=section)
+    args = parser.parse_args()
+
+    sizes = {k: getattr(args, k) for k in DEFAULT_SIZES}
+    candidates = generate_candidates(args.count, args.seed, **sizes)
+    if args.jsonl:
+        for c in candidates:
+            sys.stdout.write(json.dumps(c) + "\n")
+    else:
+        json.dump(candidates[0] if args.count == 1 else candidates, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
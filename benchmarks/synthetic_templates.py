@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Synthetic Templates
+Deterministic, seeded DOCX templates of any size for complexity tests. The
+paragraphs and table labels are drawn from the vocabulary the populator
+recognizes (the employment, education, address, reference and gap labels
+_classify_table looks for, and the "Label:" paragraphs the general rules
+fill), so the classifier and the fill rules do real work on every block.
+The number of paragraphs, tables, rows per table, columns and merged banner
+rows are all configurable, so a benchmark can grow one dimension at a time.
+
+    python benchmarks/synthetic_templates.py out.docx --paragraphs 200 --tables 40 --rows 8
+    python benchmarks/synthetic_templates.py nda.docx --form-type nda --merged 2
+"""
+
+from __future__ import annotations
+import argparse, os, random, sys
+from typing import Dict, List, Tuple
+
+from docx import Document
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+from reproducible import save_document  # noqa: E402
+
+# (heading paragraph, banner text, row labels) per table kind, in the populator's words
+SECTIONS: Dict[str, Tuple[str, str, List[str]]] = {
+    "employment": ("Employment History:", "Current / Previous Employer",
+                   ["Employers Name & Branch", "Position & Department", "Employment Period", "Employee Code",
+                    "Last Salary Drawn", "Reporting Manager", "Agency Details (if any)", "Office Landline",
+                    "May we verify now?"]),
+    "education": ("Education:", "Highest Qualification",
+                  ["University and College", "Location", "Degree / Diploma", "Period of the Course",
+                   "Roll / Registration / Seat No."]),
+    "address": ("Address Details:", "Current Address",
+                ["Current Address", "Town/ City", "Duration of Stay", "Phone Number", "Permanent Address",
+                 "Previous Address"]),
+    "reference": ("Details of Professional References", "Reference 1",
+                  ["Referee Name", "Designation & Company", "Contact Number", "Reference 2"]),
+    "gap": ("Career Gap:", "Employment Gap",
+            ["Reason for Gap", "Period of Gap", "Duration (From / To)"]),
+}
+FIELD_LABELS = ["Name (Complete)*:", "Father's Name:", "Date of Birth:", "Gender:", "Email ID:", "Phone:",
+                "PAN:", "Aadhaar:", "Nationality:", "Print Name:", "Signature:", "Date:", "Address:"]
+PROSE = [
+    "The information furnished in this form will be verified with the sources listed.",
+    "Please complete every section in block letters and attach supporting documents.",
+    "Any incorrect or missing information may delay the onboarding process.",
+    "The candidate authorises the company and its agents to contact the organisations named below.",
+    "All details remain confidential and are used only for employment screening.",
+    "Strike out any section that does not apply instead of leaving it blank.",
+]
+# a title that determine_form_type() maps to each form type
+TITLES = {
+    "background_verification": "Background Verification Form",
+    "nda": "Non-Disclosure Agreement",
+    "declaration": "Declaration by the Employee",
+    "loa": "Leave of Absence Request",
+    "gratuity": "Form F - Nomination for Gratuity",
+    "general": "Employee Information Form",
+}
+
+
+def generate_template(paragraphs: int = 20, tables: int = 5, rows: int = 6, cols: int = 2, merged: int = 1,
+                      form_type: str = "background_verification", seed: int = 0) -> Document:
+    """A Document with a title, `paragraphs` body paragraphs spread between `tables`
+    tables, each preceded by its section heading. Every table has `rows` rows and
+    `cols` columns (label, then empty value cells); its first `merged` rows are
+    banners merged across all columns. The same arguments always give the same document."""
+    if cols < 2 and merged:
+        raise ValueError("merged banner rows need at least 2 columns")
+    rnd = random.Random(seed)
+    kinds = list(SECTIONS)
+    doc = Document()
+    doc.add_paragraph(TITLES[form_type])
+
+    def body_paragraph():
+        # about a third are "Label:" fields, the rest plain text
+        doc.add_paragraph(rnd.choice(FIELD_LABELS) if rnd.random() < 0.35 else rnd.choice(PROSE))
+
+    for t in range(tables):
+        # the same number of paragraphs before every table, the remainder after the last
+        for _ in range(paragraphs // tables if tables else 0):
+            body_paragraph()
+        heading, banner, labels = SECTIONS[kinds[t % len(kinds)]]
+        doc.add_paragraph(heading)
+        table = doc.add_table(rows=rows, cols=cols)
+        table_rows = table.rows
+        for r, row in enumerate(table_rows):
+            cells = row.cells
+            if r < merged:
+                cells[0].merge(cells[-1]).text = banner if r == 0 else f"{banner} ({r + 1})"
+            else:
+                cells[0].text = labels[(r - merged) % len(labels)]
+    for _ in range(paragraphs - (paragraphs // tables) * tables if tables else paragraphs):
+        body_paragraph()
+    return doc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic DOCX template")
+    parser.add_argument("output", help="where to write the .docx")
+    parser.add_argument("--paragraphs", type=int, default=20, help="body paragraphs (headings not included)")
+    parser.add_argument("--tables", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=6, help="rows per table")
+    parser.add_argument("--cols", type=int, default=2, help="columns per table")
+    parser.add_argument("--merged", type=int, default=1, help="merged banner rows per table")
+    parser.add_argument("--form-type", choices=sorted(TITLES), default="background_verification")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    doc = generate_template(args.paragraphs, args.tables, args.rows, args.cols, args.merged, args.form_type, args.seed)
+    save_document(doc, args.output)  # byte-identical for the same arguments
+    print(f"{args.output}: {len(doc.paragraphs)} paragraphs, {len(doc.tables)} tables", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
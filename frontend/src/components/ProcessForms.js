@@ -1,30 +1,108 @@
 import React, { useState } from 'react';
-import { Download, FileText, Loader, CheckCircle, AlertCircle } from 'lucide-react';
+import { Download, FileText, Loader, CheckCircle, AlertCircle, XCircle } from 'lucide-react';
 import axios from 'axios';
 
+// Reads a text/event-stream response body and calls onEvent(name, data) per event
+const readEventStream = async (response, onEvent) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const message = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let name = 'message';
+      let payload = '';
+      message.split('\n').forEach((line) => {
+        if (line.startsWith('event: ')) name = line.slice(7);
+        else if (line.startsWith('data: ')) payload += line.slice(6);
+      });
+      if (payload) onEvent(name, JSON.parse(payload));
+    }
+  }
+};
+
 const ProcessForms = ({ data }) => {
   const [isProcessing, setIsProcessing] = useState(false);
   const [isCompleted, setIsCompleted] = useState(false);
   const [error, setError] = useState(null);
   const [downloadLinks, setDownloadLinks] = useState([]);
+  const [failedForms, setFailedForms] = useState([]);
+  const [progress, setProgress] = useState({}); // template -> started | finished | failed
+
+  const finish = (result) => {
+    if (result.success) {
+      setIsCompleted(true);
+      setDownloadLinks(result.downloadLinks || []);
+      setFailedForms(result.failedForms || []);
+    } else {
+      setError(result.error || 'Failed to process forms');
+    }
+  };
+
+  // Plain request/response, used where the browser cannot stream a POST body back
+  const processFormsOnce = async () => {
+    const response = await axios.post('/api/process-forms', data, {
+      headers: {
+        'Content-Type': 'application/json',
+      },
+    });
+    finish(response.data);
+  };
+
+  // Each form can be downloaded as soon as the backend reports it finished
+  const processFormsStreaming = async () => {
+    const response = await fetch('/api/process-forms/stream', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(data),
+    });
+    if (!response.headers.get('Content-Type')?.startsWith('text/event-stream')) {
+      // busy (429) or rejected before rendering started: a normal JSON answer
+      const result = await response.json();
+      finish({ success: false, error: result.error });
+      return;
+    }
+    let completed = false;
+    await readEventStream(response, (name, event) => {
+      if (name === 'template') {
+        setProgress((prev) => ({ ...prev, [event.template]: event.status }));
+        if (event.status === 'finished') {
+          setDownloadLinks((prev) => (
+            prev.some((link) => link.filename === event.filename)
+              ? prev
+              : [...prev, { filename: event.filename, url: event.url, type: 'docx' }]
+          ));
+        } else if (event.status === 'failed') {
+          setFailedForms((prev) => [...prev.filter((f) => f.template !== event.template),
+            { template: event.template, error: event.error }]);
+        }
+      } else if (name === 'done') {
+        completed = true;
+        finish(event);
+      }
+    });
+    if (!completed) {
+      setError('The connection closed before all forms were processed');
+    }
+  };
 
   const processForms = async () => {
     setIsProcessing(true);
     setError(null);
+    setDownloadLinks([]);
+    setFailedForms([]);
+    setProgress({});
     
     try {
-      // Send data to backend
-      const response = await axios.post('/api/process-forms', data, {
-        headers: {
-          'Content-Type': 'application/json',
-        },
-      });
-
-      if (response.data.success) {
-        setIsCompleted(true);
-        setDownloadLinks(response.data.downloadLinks || []);
+      if (window.fetch && window.ReadableStream && window.TextDecoder) {
+        await processFormsStreaming();
       } else {
-        setError(response.data.error || 'Failed to process forms');
+        await processFormsOnce();
       }
     } catch (err) {
       setError(err.response?.data?.error || 'An error occurred while processing forms');
@@ -33,9 +111,31 @@ const ProcessForms = ({ data }) => {
     }
   };
 
-  const downloadFile = (filename) => {
-    // Use the full backend URL for downloads
-    window.open(`http://localhost:5000/api/download/${encodeURIComponent(filename)}`, '_blank');
+  const renderDownloadLink = (link, index) => (
+    <div key={index} className="border border-gray-200 rounded-lg p-3">
+      <div className="flex items-center justify-between">
+        <div className="flex items-center">
+          <FileText className="h-4 w-4 text-blue-500 mr-2" />
+          <div>
+            <p className="text-sm font-medium text-gray-900 truncate">{link.filename}</p>
+            <p className="text-xs text-gray-500">Editable document</p>
+          </div>
+        </div>
+        <button
+          onClick={() => downloadFile(link)}
+          className="px-3 py-1 bg-blue-600 text-white rounded-md text-sm hover:bg-blue-700"
+        >
+          Download
+        </button>
+      </div>
+    </div>
+  );
+
+  const downloadFile = (link) => {
+    // Use the full backend URL for downloads; in lazy mode the link also names
+    // the candidate, and the form is rendered when it is first downloaded
+    const path = link.url || `/api/download/${encodeURIComponent(link.filename)}`;
+    window.open(`http://localhost:5000${path}`, '_blank');
   };
 
   return (
@@ -62,12 +162,34 @@ const ProcessForms = ({ data }) => {
       )}
 
       {isProcessing && (
-        <div className="text-center py-8">
-          <Loader className="h-16 w-16 text-primary-600 mx-auto mb-4 animate-spin" />
-          <h3 className="text-lg font-medium text-gray-900 mb-2">Processing Forms...</h3>
-          <p className="text-gray-600">
-            Please wait while we fill out all the forms with your information.
-          </p>
+        <div className="py-8">
+          <div className="text-center">
+            <Loader className="h-16 w-16 text-primary-600 mx-auto mb-4 animate-spin" />
+            <h3 className="text-lg font-medium text-gray-900 mb-2">Processing Forms...</h3>
+            <p className="text-gray-600">
+              Please wait while we fill out all the forms with your information.
+            </p>
+          </div>
+
+          {Object.keys(progress).length > 0 && (
+            <ul className="mt-6 space-y-2">
+              {Object.entries(progress).map(([template, status]) => (
+                <li key={template} className="flex items-center text-sm text-gray-700">
+                  {status === 'finished' && <CheckCircle className="h-4 w-4 text-green-600 mr-2" />}
+                  {status === 'failed' && <XCircle className="h-4 w-4 text-red-600 mr-2" />}
+                  {status === 'started' && <Loader className="h-4 w-4 text-primary-600 mr-2 animate-spin" />}
+                  {template}
+                </li>
+              ))}
+            </ul>
+          )}
+
+          {/* Forms that are already done can be downloaded while the rest render */}
+          {downloadLinks.length > 0 && (
+            <div className="mt-6 grid grid-cols-1 md:grid-cols-2 gap-3">
+              {downloadLinks.map(renderDownloadLink)}
+            </div>
+          )}
         </div>
       )}
 
@@ -98,10 +220,23 @@ const ProcessForms = ({ data }) => {
               <h3 className="text-sm font-medium text-green-800">Forms Processed Successfully!</h3>
             </div>
             <p className="mt-2 text-sm text-green-700">
-              All forms have been filled and are ready for download.
+              {failedForms.length === 0
+                ? 'All forms have been filled and are ready for download.'
+                : `${downloadLinks.length} forms are ready for download; ${failedForms.length} could not be filled.`}
             </p>
           </div>
 
+          {failedForms.length > 0 && (
+            <div className="bg-yellow-50 border border-yellow-200 rounded-md p-4">
+              <h3 className="text-sm font-medium text-yellow-800 mb-2">Forms Not Generated</h3>
+              <ul className="text-sm text-yellow-700 space-y-1">
+                {failedForms.map((form) => (
+                  <li key={form.template}>• {form.template}: {form.error}</li>
+                ))}
+              </ul>
+            </div>
+          )}
+
           <div>
             <h3 className="text-lg font-medium text-gray-900 mb-4">Download Filled Forms</h3>
             
@@ -116,25 +251,7 @@ const ProcessForms = ({ data }) => {
                   📝 Download editable Word documents with all your information filled in.
                 </p>
                 <div className="grid grid-cols-1 md:grid-cols-2 gap-3">
-                  {downloadLinks.map((link, index) => (
-                    <div key={index} className="border border-gray-200 rounded-lg p-3">
-                      <div className="flex items-center justify-between">
-                        <div className="flex items-center">
-                          <FileText className="h-4 w-4 text-blue-500 mr-2" />
-                          <div>
-                            <p className="text-sm font-medium text-gray-900 truncate">{link.filename}</p>
-                            <p className="text-xs text-gray-500">Editable document</p>
-                          </div>
-                        </div>
-                        <button
-                          onClick={() => downloadFile(link.filename)}
-                          className="px-3 py-1 bg-blue-600 text-white rounded-md text-sm hover:bg-blue-700"
-                        >
-                          Download
-                        </button>
-                      </div>
-                    </div>
-                  ))}
+                  {downloadLinks.map(renderDownloadLink)}
                 </div>
               </div>
             )}